@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Throughput baseline for the psytrace and statstool command lines.
+
+Generates a deterministic reference trace, then runs each tool in a fresh
+interpreter and reports lines/sec and the peak RSS of that process. Run it with
+every interpreter to track, eg
+
+    python2 benchmarks/bench_baseline.py
+    python3 benchmarks/bench_baseline.py
+
+and record the results in benchmarks/BASELINE.md.
+
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIRPATH = os.path.join(THIS_DIRPATH, os.pardir)
+
+# Runs a tool's command line in this interpreter and prints the elapsed time
+# and peak RSS as json on the last line of stderr
+CHILD_SCRIPT = """
+import json, resource, runpy, sys, time
+sys.argv = %(argv)r
+sys.path.insert(0, %(dirpath)r)
+start = time.time()
+stdout = sys.stdout
+sys.stdout = open(%(stdout_filepath)r, "w")
+runpy.run_path(sys.argv[0], run_name="__main__")
+sys.stdout.close()
+sys.stdout = stdout
+elapsed = time.time() - start
+# ru_maxrss is in kilobytes on Linux, bytes on macOS. On Linux it also keeps the
+# RSS of the parent forked before exec, so prefer the high water mark of this
+# process image
+maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if (sys.platform == "darwin"):
+    maxrss //= 1024
+try:
+    with open("/proc/self/status") as f:
+        maxrss = [ int(l.split()[1]) for l in f if l.startswith("VmHWM:") ][0]
+except (IOError, OSError, IndexError):
+    pass
+sys.stderr.write("\\n" + json.dumps({ "elapsed" : elapsed, "maxrss_kb" : maxrss }) + "\\n")
+"""
+
+def generate_reference_trace(filepath, num_lines, num_cpus = 8, num_tasks = 400, seed = 0):
+    """
+    Write a trace with a mix of scheduler, frequency, kgsl and untranslated
+    "<...>" events over a few hundred tasks
+    """
+    rnd = random.Random(seed)
+    tasks = [ (500 + i, "Task%d" % i, 500 + (i // 8)) for i in range(num_tasks) ]
+    current = [ (0, "<idle>", 0) ] * num_cpus
+    frequencies = [ 300000, 1036800, 1958400, 2150400 ]
+    timestamp = 1000.0
+    with open(filepath, "w") as f:
+        f.write("# tracer: nop\n")
+        f.write("#\n")
+        for i in range(num_lines):
+            timestamp += rnd.random() * 0.00005
+            cpu = rnd.randrange(num_cpus)
+            pid, comm, tgid = current[cpu]
+            r = rnd.random()
+            if (r < 0.4):
+                next_pid, next_comm, next_tgid = (0, "<idle>", 0) if (rnd.random() < 0.3) else rnd.choice(tasks)
+                function = "sched_switch"
+                rest = "prev_comm=%s prev_pid=%d prev_prio=120 prev_state=S ==> next_comm=%s next_pid=%d next_prio=120" % (
+                    "swapper/%d" % cpu if (pid == 0) else comm, pid,
+                    "swapper/%d" % cpu if (next_pid == 0) else next_comm, next_pid)
+                current[cpu] = (next_pid, next_comm, next_tgid)
+            elif (r < 0.5):
+                function = "cpu_frequency"
+                rest = "state=%d cpu_id=%d" % (rnd.choice(frequencies), cpu)
+            elif (r < 0.8):
+                wakee_pid, wakee_comm, _ = rnd.choice(tasks)
+                function = "sched_wakeup"
+                rest = "comm=%s pid=%d prio=120 success=1 target_cpu=%03d" % (wakee_comm, wakee_pid, rnd.randrange(num_cpus))
+            else:
+                function = "kgsl_gpubusy"
+                rest = "d_name=kgsl-3d0 busy=%d elapsed=%d" % (rnd.randrange(1000000), 1000000)
+            # Some names miss the kernel comm cache
+            if ((pid != 0) and (rnd.random() < 0.05)):
+                comm = "<...>"
+            f.write("%16s-%-5d (%5d) [%03d] d..3 %.6f: %s: %s\n" % (comm, pid, tgid, cpu, timestamp, function, rest))
+
+def count_lines(filepath):
+    with open(filepath, "rb") as f:
+        return sum(1 for l in f)
+
+def run_tool(python, argv, tmp_dirpath, dirpath = ROOT_DIRPATH):
+    """
+    :param dirpath: directory with the modules the tool imports
+    :return: (elapsed seconds, peak rss in KB) of running argv in a fresh
+             python interpreter, its stdout is in tmp_dirpath/stdout.txt
+    """
+    script = CHILD_SCRIPT % { "argv" : argv, "dirpath" : dirpath,
+                              "stdout_filepath" : os.path.join(tmp_dirpath, "stdout.txt") }
+    p = subprocess.Popen([python, "-c", script], cwd=tmp_dirpath,
+                         stderr=subprocess.PIPE, universal_newlines=True)
+    _, stderr = p.communicate()
+    if (p.returncode != 0):
+        raise RuntimeError("%s failed:\n%s" % (repr(argv), stderr))
+    result = json.loads(stderr.strip().splitlines()[-1])
+
+    return result["elapsed"], result["maxrss_kb"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--python", default=sys.executable,
+                        help="Interpreter to run the tools with")
+    parser.add_argument("--lines", type=int, default=500000,
+                        help="Number of lines in the reference trace")
+    parser.add_argument("--stats-files", type=int, default=20,
+                        help="Number of schedstats csvs averaged by statstool")
+    args = parser.parse_args()
+
+    python_version = subprocess.check_output([args.python, "-c", "import platform; print(platform.python_version())"],
+                                             universal_newlines=True).strip()
+
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        trace_filepath = os.path.join(tmp_dirpath, "trace.txt")
+        generate_reference_trace(trace_filepath, args.lines)
+
+        psytrace_filepath = os.path.join(ROOT_DIRPATH, "psytrace.py")
+        dst_filepath = os.path.join(tmp_dirpath, "trace.txt.out")
+        elapsed, maxrss = run_tool(args.python, [psytrace_filepath, trace_filepath, dst_filepath], tmp_dirpath)
+        print("python %s psytrace: %d lines in %.2fs, %.0f lines/sec, peak RSS %d KB" % (
+            python_version, args.lines, elapsed, args.lines / elapsed, maxrss))
+
+        # Average copies of the schedstats csv the psytrace run generated
+        stats_filepaths = []
+        for i in range(args.stats_files):
+            stats_filepath = os.path.join(tmp_dirpath, "stats%d_schedstats.csv" % i)
+            shutil.copyfile(dst_filepath + "_schedstats.csv", stats_filepath)
+            stats_filepaths.append(stats_filepath)
+        num_lines = sum([ count_lines(stats_filepath) for stats_filepath in stats_filepaths ])
+        statstool_filepath = os.path.join(ROOT_DIRPATH, "statstool.py")
+        elapsed, maxrss = run_tool(args.python, [statstool_filepath, "avg"] + stats_filepaths, tmp_dirpath)
+        print("python %s statstool avg: %d lines in %.2fs, %.0f lines/sec, peak RSS %d KB" % (
+            python_version, num_lines, elapsed, num_lines / elapsed, maxrss))
+
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+if (__name__ == "__main__"):
+    main()
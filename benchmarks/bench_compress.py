@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Benchmark for psytrace compressed output.
+
+Runs psytrace.main on the bench_baseline.py reference trace with each output
+compression, with and without the background compression thread, and reports
+the wall time and the bytes written for the trace and the csvs.
+
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from bench_baseline import generate_reference_trace
+from bench_decoder import load_psytrace
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--psytrace", default=os.path.join(THIS_DIRPATH, os.pardir, "psytrace.py"),
+                        help="psytrace.py to benchmark")
+    parser.add_argument("--lines", type=int, default=500000,
+                        help="Number of lines in the reference trace")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    psytrace = load_psytrace(args.psytrace)
+    psytrace.logger.setLevel(logging.WARNING)
+
+    configs = [ (None, False) ]
+    for compression in sorted(psytrace.COMPRESSION_EXTENSIONS.keys()):
+        if (compression == "zst"):
+            try:
+                import zstandard
+            except ImportError:
+                print("zst: zstandard not available, skipping")
+                continue
+        configs.extend([ (compression, False), (compression, True) ])
+
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        src_filepath = os.path.join(tmp_dirpath, "trace.txt")
+        generate_reference_trace(src_filepath, args.lines)
+
+        for compression, background in configs:
+            psytrace.BACKGROUND_COMPRESSION = background
+            dst_dirpath = os.path.join(tmp_dirpath, "out")
+            best = None
+            for i in range(args.repeat):
+                if (os.path.exists(dst_dirpath)):
+                    shutil.rmtree(dst_dirpath)
+                os.makedirs(dst_dirpath)
+                start = time.time()
+                psytrace.main(src_filepath, os.path.join(dst_dirpath, "trace.txt.out"), compression=compression)
+                elapsed = time.time() - start
+                best = elapsed if (best is None) else min(best, elapsed)
+
+            num_bytes = sum([ os.path.getsize(os.path.join(dst_dirpath, filename)) for filename in os.listdir(dst_dirpath) ])
+            print("%-4s %-10s: %.2fs, %d bytes written" % (
+                compression or "none", "background" if background else "",
+                best, num_bytes))
+
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for the psytrace event decoders.
+
+Generates a synthetic kgsl-heavy trace and reports the lines/sec psytrace.main
+processes it at. Pass --psytrace with the path to another psytrace.py (eg one
+extracted with git show) to compare revisions.
+
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+
+KGSL_EVENTS = [
+    ("kgsl_pwrstats", "d_name=kgsl-3d0 total=12427 busy=8139 ram_time=1159316 ram_wait=301723"),
+    ("kgsl_clk", "d_name=kgsl-3d0 flag=on active_freq=257000000"),
+    ("kgsl_gpubusy", "d_name=kgsl-3d0 busy=1032838 elapsed=1032834"),
+    ("kgsl_buslevel", "d_name=kgsl-3d0 pwrlevel=4 bus=6"),
+    ("kgsl_pwrlevel", "d_name=kgsl-3d0 pwrlevel=5 freq=214000000 prev_pwrlevel=0 prev_freq=624000000"),
+    ("kgsl_register_event", "ctx=0 ts=2410408 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28"),
+    ("kgsl_fire_event", "ctx=0 ts=2412008 type=retired age=0 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28"),
+    ("kgsl_issueibcmds", "d_name=kgsl-3d0 ctx=24 ib=0x0 numibs=1 ts=14192 flags=CTX_SWITCH result=0 type=GL"),
+    ("kgsl_active_count_put", "work:ffffffc001b1f738, adreno_dispatcher_work+0xa14/0xac8"),
+    ("kgsl_add_event", "ctx:0, ts:2412470, retired:2412470, work:0xffffffc08702f740, adreno_ringbuffer_mmu_disable_clk_on_ts+0x24/0x5c"),
+    ("kgsl_timer", "work:ffffffc001b1f738, call_timer_fn+0x88/0x174"),
+]
+
+def generate_trace(filepath, num_lines, num_cpus = 4, seed = 0):
+    """
+    Write a trace where most events are kgsl_*, with a sprinkling of
+    sched_switch and cpu_frequency so the accounting has some work to do
+    """
+    rnd = random.Random(seed)
+    timestamp = 1000.0
+    current = [0] * num_cpus
+    with open(filepath, "w") as f:
+        f.write("# tracer: nop\n")
+        for i in range(num_lines):
+            timestamp += rnd.random() * 0.0001
+            cpu = rnd.randrange(num_cpus)
+            pid = current[cpu]
+            task = "<idle>" if (pid == 0) else "kgsl_worker_thr"
+            r = rnd.random()
+            if (r < 0.1):
+                next_pid = rnd.choice([0, 0, 0, 500 + cpu])
+                function = "sched_switch"
+                rest = "prev_comm=%s prev_pid=%d prev_prio=120 prev_state=S ==> next_comm=%s next_pid=%d next_prio=120" % (
+                    "swapper/%d" % cpu if (pid == 0) else task, pid,
+                    "swapper/%d" % cpu if (next_pid == 0) else "kgsl_worker_thr", next_pid)
+                current[cpu] = next_pid
+            elif (r < 0.15):
+                function = "cpu_frequency"
+                rest = "state=%d cpu_id=%d" % (rnd.choice([300000, 1958400]), cpu)
+            else:
+                function, rest = rnd.choice(KGSL_EVENTS)
+            f.write("%16s-%-5d (%5d) [%03d] d..3 %.6f: %s: %s\n" % (task, pid, pid, cpu, timestamp, function, rest))
+
+def load_psytrace(filepath):
+    """
+    :return: psytrace.py module loaded from filepath, with its directory in the
+             path so its sibling modules are found
+    """
+    sys.path.insert(0, os.path.dirname(os.path.realpath(filepath)))
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source("psytrace_under_test", filepath)
+
+    spec = importlib.util.spec_from_file_location("psytrace_under_test", filepath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--psytrace", default=os.path.join(THIS_DIRPATH, os.pardir, "psytrace.py"),
+                        help="psytrace.py to benchmark")
+    parser.add_argument("--lines", type=int, default=200000,
+                        help="Number of lines in the synthetic trace")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    psytrace = load_psytrace(args.psytrace)
+    psytrace.logger.setLevel(logging.WARNING)
+
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        src_filepath = os.path.join(tmp_dirpath, "trace.txt")
+        dst_filepath = os.path.join(tmp_dirpath, "trace.txt.out")
+        generate_trace(src_filepath, args.lines)
+
+        best = None
+        for i in range(args.repeat):
+            start = time.time()
+            psytrace.main(src_filepath, dst_filepath)
+            elapsed = time.time() - start
+            best = elapsed if (best is None) else min(best, elapsed)
+
+        print("%s: %d lines in %.3fs, %.0f lines/sec" % (args.psytrace, args.lines, best, args.lines / best))
+
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+if (__name__ == "__main__"):
+    main()
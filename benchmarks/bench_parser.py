@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark for the logcat parser.
+
+Writes a synthetic logcat with VrApi, battery, insideout_periodic and
+oculus_os_dml lines among unrelated ones, runs parser.py on it in a fresh
+interpreter and reports lines/sec. Pass --reference with the path to another
+parser.py (eg one extracted with git show) to time it too and check both
+write the same csv.
+
+"""
+from __future__ import print_function
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tracegen import generate_logcat
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+# Modules imported by parser.py
+PARSER_MODULE_FILENAMES = [ "logcat.py", "metricseries.py", "npyfile.py" ]
+
+def run_parser(python, parser_filepath, parser_args, logcat_filepaths, tmp_dirpath):
+    """
+    Run a copy of parser_filepath next to a traces/ directory with the logcats
+
+    :return: (elapsed seconds, contents of the results csv)
+    """
+    run_dirpath = tempfile.mkdtemp(dir=tmp_dirpath)
+    traces_dirpath = os.path.join(run_dirpath, "traces")
+    os.makedirs(traces_dirpath)
+    for logcat_filepath in logcat_filepaths:
+        os.symlink(logcat_filepath, os.path.join(traces_dirpath, os.path.basename(logcat_filepath)))
+    shutil.copyfile(parser_filepath, os.path.join(run_dirpath, "parser.py"))
+    # parser.py imports the modules next to it, copy the ones it has
+    for module_filename in PARSER_MODULE_FILENAMES:
+        module_filepath = os.path.join(os.path.dirname(parser_filepath), module_filename)
+        if (os.path.exists(module_filepath)):
+            shutil.copyfile(module_filepath, os.path.join(run_dirpath, module_filename))
+
+    start = time.time()
+    with open(os.devnull, "w") as f_null:
+        subprocess.check_call([python, os.path.join(run_dirpath, "parser.py")] + parser_args, cwd=run_dirpath, stdout=f_null)
+    elapsed = time.time() - start
+
+    with open(glob.glob(os.path.join(traces_dirpath, "*_results.csv"))[0], "rb") as f:
+        return elapsed, f.read()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parser", default=os.path.join(THIS_DIRPATH, os.pardir, "parser.py"),
+                        help="parser.py to benchmark")
+    parser.add_argument("--parser-args", default="",
+                        help="Space separated arguments for the parser, eg \"--year 18 -j 4 --merge\"")
+    parser.add_argument("--reference", default=None,
+                        help="Another parser.py to time and compare the csv with")
+    parser.add_argument("--reference-args", default="",
+                        help="Space separated arguments for the reference parser")
+    parser.add_argument("--python", default=sys.executable,
+                        help="Interpreter to run the parsers with")
+    parser.add_argument("--lines", type=int, default=1000000,
+                        help="Number of lines in each logcat")
+    parser.add_argument("--files", type=int, default=1,
+                        help="Number of logcats")
+    args = parser.parse_args()
+
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        logcat_filepaths = []
+        for i in range(args.files):
+            logcat_filepath = os.path.join(tmp_dirpath, "trace%d.txt.logcat" % i)
+            generate_logcat(logcat_filepath, args.lines, seed=i)
+            logcat_filepaths.append(logcat_filepath)
+        num_lines = args.lines * args.files
+
+        parsers = [ ("parser", args.parser, args.parser_args.split()) ]
+        if (args.reference is not None):
+            parsers.append(("reference", args.reference, args.reference_args.split()))
+
+        results = []
+        for name, parser_filepath, parser_args in parsers:
+            elapsed, csv = run_parser(args.python, os.path.realpath(parser_filepath), parser_args, logcat_filepaths,
+                                      tmp_dirpath)
+            print("%s: %d lines in %.2fs, %.0f lines/sec, %d csv rows" % (
+                name, num_lines, elapsed, num_lines / elapsed, csv.count(b"\n") - 1))
+            results.append(csv)
+
+        if (len(results) > 1):
+            print("csvs are %s" % ("identical" if (results[0] == results[1]) else "DIFFERENT"))
+
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for the psytrace schedstats csv aggregation.
+
+Builds a synthetic set of grouped tasks and times writing the schedstats csv
+with the Python and the NumPy aggregation, checking both csvs are identical.
+
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIRPATH, os.pardir))
+
+import schedstats
+
+class SyntheticTask(object):
+    def __init__(self, comm, tgid_name, npids, seconds, cycles):
+        self.comm = comm
+        self.tgid_name = tgid_name
+        self.npids = npids
+        self.seconds = seconds
+        self.cycles = cycles
+
+def generate_tasks(num_tasks, num_cpus, seed = 0):
+    """
+    :return: (tasks, cpu_seconds, cpu_cycles) with some tasks that never ran
+             on some cpus, some with no cycles and some with duplicated
+             values to exercise the sort ties
+    """
+    rnd = random.Random(seed)
+    frequencies = [ 300000.0, 1958400.0, 2150400.0 ]
+    tasks = []
+    for i in range(num_tasks):
+        if ((i > 0) and (rnd.random() < 0.05)):
+            # Tie with a previous task
+            t = rnd.choice(tasks)
+            seconds = list(t.seconds)
+            cycles = list(t.cycles)
+        else:
+            seconds = [ rnd.expovariate(100.0) if (rnd.random() < 0.5) else 0.0 for cpu_id in range(num_cpus) ]
+            if (rnd.random() < 0.1):
+                cycles = [ 0.0 ] * num_cpus
+            else:
+                cycles = [ s * rnd.choice(frequencies) for s in seconds ]
+        tasks.append(SyntheticTask("task%d" % i, "parent%d" % (i % 100), rnd.randint(1, 4), seconds, cycles))
+
+    cpu_seconds = [ sum([ t.seconds[cpu_id] for t in tasks ]) for cpu_id in range(num_cpus) ]
+    cpu_cycles = [ sum([ t.cycles[cpu_id] for t in tasks ]) for cpu_id in range(num_cpus) ]
+
+    return tasks, cpu_seconds, cpu_cycles
+
+def run(tasks, cpu_seconds, cpu_cycles, cpu_weights, use_numpy, repeat):
+    best = None
+    for i in range(repeat):
+        f_out = io.StringIO() if (sys.version_info[0] >= 3) else io.BytesIO()
+        start = time.time()
+        schedstats.write_schedstats(f_out, tasks, cpu_seconds, cpu_cycles, cpu_weights, use_numpy)
+        elapsed = time.time() - start
+        best = elapsed if (best is None) else min(best, elapsed)
+
+    return best, f_out.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=100000,
+                        help="Number of synthetic tasks")
+    parser.add_argument("--cpus", type=int, default=8,
+                        help="Number of synthetic cpus")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    tasks, cpu_seconds, cpu_cycles = generate_tasks(args.tasks, args.cpus)
+    cpu_weights = [ 1.0 + (cpu_id * 2 // args.cpus) for cpu_id in range(args.cpus) ]
+
+    python_elapsed, python_csv = run(tasks, cpu_seconds, cpu_cycles, cpu_weights, False, args.repeat)
+    print("python: %d tasks in %.3fs" % (args.tasks, python_elapsed))
+
+    if (schedstats.numpy is None):
+        print("numpy: not available")
+        return
+
+    numpy_elapsed, numpy_csv = run(tasks, cpu_seconds, cpu_cycles, cpu_weights, True, args.repeat)
+    print("numpy: %d tasks in %.3fs (%.1fx)" % (args.tasks, numpy_elapsed, python_elapsed / numpy_elapsed))
+
+    assert python_csv == numpy_csv, "The csvs differ"
+    print("csvs are identical")
+
+if (__name__ == "__main__"):
+    main()
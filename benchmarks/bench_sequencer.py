@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+Benchmark for pyRosita's Sequencer.add.
+
+Generates a procedural script of random actions over every robot component,
+as when building long sequences programmatically, and reports the adds/sec of
+running it through Sequencer.add, and of writing the animation. Pass
+--reference with the root of another checkout (eg one made with git worktree)
+to time its pyRosita too and check both write the same sequence commands.
+Also times aiming along a path of --aim-points with Sequencer.add_aim_path
+against adding the aims one by one.
+
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import io
+import os
+import random
+import sys
+import time
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIRPATH = os.path.join(THIS_DIRPATH, os.pardir)
+
+HEAD_PARTS = [ "nod", "turn", "roll" ]
+TORSO_PARTS = [ "bend_forward", "sideways", "turn" ]
+ARM_PARTS = [ "up", "out", "twist", "fore_arm", "elbow", "wrist" ]
+
+class SequenceFile(io.StringIO):
+    """
+    Collects what Sequencer.generate_animation writes
+    """
+    name = "bench.sequence"
+
+    def commands(self):
+        """
+        :return: list of (heading time, channel, value) of the sequence
+                 events in the order they are written, blank lines are
+                 skipped and later values of a channel under the same heading
+                 replace earlier ones
+        """
+        lines = self.getvalue().split("\n")
+        events = []
+        for line in lines[lines.index("[Sequence Events]") + 1:]:
+            if (line.startswith("time=")):
+                events.append((line[len("time="):], {}))
+            elif (line != ""):
+                channel, value = line.split("=", 1)
+                events[-1][1][channel] = value
+        return [ (time, channel, value) for time, values in events for channel, value in values.items() ]
+
+def load_pyrosita(root_dirpath, name):
+    """
+    :return: the pyRosita package under root_dirpath, imported as name
+    """
+    package_dirpath = os.path.join(root_dirpath, "pyRosita")
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_package(name, package_dirpath)
+
+    spec = importlib.util.spec_from_file_location(name, os.path.join(package_dirpath, "__init__.py"),
+                                                  submodule_search_locations=[ package_dirpath ])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def generate_script(num_actions, seed = 0):
+    """
+    :return: list of (action, args) for Sequencer.add, with amounts within the
+             limits so the robot doesn't print warnings
+    """
+    rnd = random.Random(seed)
+    script = []
+    for i in range(num_actions):
+        r = rnd.random()
+        side = rnd.choice([ "left", "right" ])
+        if (r < 0.25):
+            script.append(("set {}_arm_{}".format(side, rnd.choice([ "aim", "move" ])),
+                           ((rnd.randint(0, 100), rnd.randint(0, 100)), )))
+        elif (r < 0.45):
+            component = rnd.choice([ "head_" + part for part in HEAD_PARTS ] +
+                                   [ "torso_" + part for part in TORSO_PARTS ] +
+                                   [ side + "_arm_" + part for part in ARM_PARTS ])
+            script.append(("set " + component, (rnd.randint(0, 100), )))
+        elif (r < 0.6):
+            component = rnd.choice([ "head_" + part for part in HEAD_PARTS ] +
+                                   [ "torso_" + part for part in TORSO_PARTS ] +
+                                   [ side + "_arm_" + part for part in ARM_PARTS ])
+            script.append(("change " + component, (rnd.choice([ -1, 1 ]) * rnd.randint(1, 5), )))
+        elif (r < 0.85):
+            script.append(("set {}_{}".format(rnd.choice([ "left", "right", "both" ]),
+                                              rnd.choice([ "trigger", "grip", "drop" ])), ()))
+        elif (r < 0.95):
+            script.append(("set look_point_{}".format(rnd.choice([ "forward", "left", "right" ])), ()))
+        elif (r < 0.99):
+            script.append(("set wait", (rnd.randint(1, 3), )))
+        else:
+            script.append(("set default", ()))
+    return script
+
+def run(pyrosita, script, stream = False, delta = False):
+    """
+    :return: (seconds adding, seconds generating the animation, sequencer) of
+             adding the script to a new sequencer, streaming the keyframes if
+             stream and writing only the changed channels if delta
+    """
+    if (stream or delta):
+        seq = pyrosita.Sequencer(SequenceFile(), pyrosita.Robot(), "", "", "", stream=stream, delta=delta)
+    else:
+        seq = pyrosita.Sequencer(SequenceFile(), pyrosita.Robot(), "", "", "")
+    # Older Sequencers print on some actions
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.time()
+        for action, args in script:
+            seq.add(action, *args)
+        elapsed = time.time() - start
+        start = time.time()
+        seq.generate_animation()
+        generate_elapsed = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return elapsed, generate_elapsed, seq
+
+def run_aim_path(pyrosita, num_points, seed = 0):
+    """
+    :return: (seconds adding the aims one by one, seconds adding them with
+             Sequencer.add_aim_path, whether both write the same commands) of
+             aiming along a random walk of num_points points
+    """
+    rnd = random.Random(seed)
+    xs = [ 50 ]
+    ys = [ 50 ]
+    for i in range(num_points - 1):
+        xs.append(min(100, max(0, xs[-1] + rnd.randint(-3, 3))))
+        ys.append(min(100, max(0, ys[-1] + rnd.randint(-3, 3))))
+
+    sequencers = []
+    elapsed = []
+    for batch in (False, True):
+        seq = pyrosita.Sequencer(SequenceFile(), pyrosita.Robot(), "", "", "")
+        start = time.time()
+        if (batch):
+            seq.add_aim_path(xs, ys, "left")
+        else:
+            for x, y in zip(xs, ys):
+                seq.add("set left_arm_aim", (x, y))
+        elapsed.append(time.time() - start)
+        seq.generate_animation()
+        sequencers.append(seq)
+    return elapsed[0], elapsed[1], sequencers[0].file.commands() == sequencers[1].file.commands()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--actions", type=int, default=100000,
+                        help="Number of actions of the script")
+    parser.add_argument("--reference", metavar="DIRPATH", default=None,
+                        help="Root of another checkout to time and compare the sequence commands with")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the keyframes of the tree's sequencer to the file as they are added")
+    parser.add_argument("--delta", action="store_true",
+                        help="Write only the channels of the tree's sequencer that change")
+    parser.add_argument("--aim-points", type=int, default=10000,
+                        help="Number of points of the aim path, 0 to skip it")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    script = generate_script(args.actions)
+    checkouts = [ ("tree", ROOT_DIRPATH) ]
+    if (args.reference is not None):
+        checkouts.append(("reference", args.reference))
+
+    commands = []
+    for name, root_dirpath in checkouts:
+        pyrosita = load_pyrosita(root_dirpath, "pyRosita_%s" % name)
+        best = None
+        best_generate = None
+        for i in range(args.repeat):
+            elapsed, generate_elapsed, seq = run(pyrosita, script, args.stream and (name == "tree"),
+                                                  args.delta and (name == "tree"))
+            best = elapsed if (best is None) else min(best, elapsed)
+            best_generate = generate_elapsed if (best_generate is None) else min(best_generate, generate_elapsed)
+        print("%s: %d adds in %.3fs, %.0f adds/sec, %d keyframes written in %.3fs, %d bytes, %.2fs of animation" % (
+            name, len(script), best, len(script) / best, seq.file.getvalue().count("\ntime="), best_generate,
+            len(seq.file.getvalue()), seq.timer))
+        commands.append(seq.file.commands())
+
+        if ((args.aim_points > 0) and hasattr(pyrosita.Sequencer, "add_aim_path")):
+            one_by_one, batch, identical = run_aim_path(pyrosita, args.aim_points)
+            print("%s: %d aim points in %.3fs one by one, %.3fs with add_aim_path, %.1fx, sequence commands are %s" % (
+                name, args.aim_points, one_by_one, batch, one_by_one / batch,
+                "identical" if (identical) else "DIFFERENT"))
+
+    if (len(commands) > 1):
+        # Older Sequencers replace the commands of a heading when a button press
+        # or a wait lands on it, so compare the commands, not their order
+        tree_commands = collections.Counter(commands[0])
+        reference_commands = collections.Counter(commands[1])
+        if (tree_commands == reference_commands):
+            print("sequence commands are identical")
+        else:
+            print("sequence commands are DIFFERENT: %d only in tree, %d only in reference" % (
+                sum((tree_commands - reference_commands).values()),
+                sum((reference_commands - tree_commands).values())))
+
+if (__name__ == "__main__"):
+    main()
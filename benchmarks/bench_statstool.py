@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Benchmark for statstool sum/avg/diff.
+
+Writes synthetic schedstats csvs where most processes appear in every file and
+some only in a few, then times loading and averaging them the way
+"statstool.py avg" does, and diffing the first two. Pass --statstool with the
+path to another statstool.py (eg one extracted with git show) to compare
+revisions, the old quadratic join needs far smaller --rows and --files.
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIRPATH, os.pardir))
+
+from tracegen import generate_stats
+
+def load_module(name, filepath):
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(name, filepath)
+
+    spec = importlib.util.spec_from_file_location(name, filepath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--statstool", default=os.path.join(THIS_DIRPATH, os.pardir, "statstool.py"),
+                        help="statstool.py to benchmark")
+    parser.add_argument("--rows", type=int, default=10000,
+                        help="Number of processes per csv")
+    parser.add_argument("--files", type=int, default=100,
+                        help="Number of csvs")
+    parser.add_argument("--cpus", type=int, default=8,
+                        help="Number of cpus in the csvs")
+    parser.add_argument("--match", default=None,
+                        help="Process matching passed to operate_stats and diff_stats, eg exact, pid or parent, "
+                             "by default the statstool's own")
+    args = parser.parse_args()
+
+    statstool = load_module("statstool_under_test", args.statstool)
+    # Older statstools don't take a match argument
+    match_args = () if (args.match is None) else (args.match, )
+
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        rnd = random.Random(0)
+        filepaths = []
+        for i in range(args.files):
+            filepath = os.path.join(tmp_dirpath, "trace%d.txt.out_schedstats.csv" % i)
+            generate_stats(filepath, args.rows, args.cpus, rnd)
+            filepaths.append(filepath)
+
+        # Same fold as "statstool.py avg"
+        start = time.time()
+        load_elapsed = 0
+        stats_c = None
+        for filepath in filepaths:
+            load_start = time.time()
+            stats_a = statstool.load_stats(filepath)
+            load_elapsed += time.time() - load_start
+            if (stats_c is None):
+                stats_c = stats_a
+            else:
+                stats_c = statstool.operate_stats(stats_a, stats_c, lambda a, b: (a if a is not None else 0) +
+                                                                                 (b if b is not None else 0),
+                                                  *match_args)
+        stats_c = statstool.operate_stats(stats_c, [], lambda a, b: a / len(filepaths))
+        elapsed = time.time() - start
+        print("avg: %d files x %d rows in %.2fs (%.2fs loading), %d rows in the result" % (
+            args.files, args.rows, elapsed, load_elapsed, len(stats_c) - 1))
+
+        stats_a = statstool.load_stats(filepaths[0])
+        stats_b = statstool.load_stats(filepaths[min(1, len(filepaths) - 1)])
+        start = time.time()
+        stats_c = statstool.diff_stats(stats_a, stats_b, *match_args)
+        print("diff: %d x %d rows in %.3fs" % (len(stats_a) - 1, len(stats_b) - 1, time.time() - start))
+
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+if (__name__ == "__main__"):
+    main()
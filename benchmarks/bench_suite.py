@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for psytrace, statstool and parser.py on synthetic inputs.
+
+Generates a trace, schedstats csvs and logcats with tracegen.py, runs each
+tool's command line in a fresh interpreter and reports lines/sec, peak RSS and
+a digest of the outputs. Pass --reference with the root of another checkout
+(eg one made with git worktree) to run its tools on the same inputs and check
+the outputs are identical, so regressions in speed, memory or results show up
+offline, eg
+
+    git worktree add /tmp/baseline HEAD~1
+    python benchmarks/bench_suite.py --reference /tmp/baseline
+
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from bench_baseline import count_lines, run_tool
+from tracegen import generate_logcat, generate_stats, generate_trace
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIRPATH = os.path.realpath(os.path.join(THIS_DIRPATH, os.pardir))
+# Modules imported by parser.py, see bench_parser.py
+PARSER_MODULE_FILENAMES = [ "parser.py", "logcat.py", "metricseries.py", "npyfile.py" ]
+# Year passed to parser.py, so its csv doesn't depend on when it runs
+PARSER_YEAR = "18"
+
+def digest_files(filepaths, dirpath):
+    """
+    :return: hex digest of the names, relative to dirpath, and contents of the
+             files
+    """
+    digest = hashlib.sha1()
+    for filepath in sorted(filepaths):
+        digest.update(os.path.relpath(filepath, dirpath).encode("utf-8"))
+        with open(filepath, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def list_files(dirpath):
+    return [ os.path.join(dirpath, filename) for filename in os.listdir(dirpath)
+             if os.path.isfile(os.path.join(dirpath, filename)) ]
+
+def run_psytrace(python, root_dirpath, inputs, run_dirpath):
+    """
+    :return: (elapsed seconds, peak rss in KB, lines processed, digest of the
+             outputs)
+    """
+    out_dirpath = os.path.join(run_dirpath, "out")
+    os.makedirs(out_dirpath)
+    elapsed, maxrss = run_tool(python, [ os.path.join(root_dirpath, "psytrace.py"), inputs["trace"],
+                                         os.path.join(out_dirpath, "trace.txt.out") ],
+                               run_dirpath, root_dirpath)
+    return elapsed, maxrss, inputs["trace_lines"], digest_files(list_files(out_dirpath), out_dirpath)
+
+def run_statstool(python, root_dirpath, operation, stats_filepaths, run_dirpath):
+    elapsed, maxrss = run_tool(python, [ os.path.join(root_dirpath, "statstool.py"), operation ] + stats_filepaths,
+                               run_dirpath, root_dirpath)
+    stdout_filepath = os.path.join(run_dirpath, "stdout.txt")
+    return elapsed, maxrss, sum([ count_lines(filepath) for filepath in stats_filepaths ]), \
+           digest_files([ stdout_filepath ], run_dirpath)
+
+def run_statstool_avg(python, root_dirpath, inputs, run_dirpath):
+    return run_statstool(python, root_dirpath, "avg", inputs["stats"], run_dirpath)
+
+def run_statstool_diff(python, root_dirpath, inputs, run_dirpath):
+    return run_statstool(python, root_dirpath, "diff", inputs["stats"][:2], run_dirpath)
+
+def run_parser(python, root_dirpath, inputs, run_dirpath):
+    # parser.py reads the traces/ next to it, run a copy next to the logcats
+    traces_dirpath = os.path.join(run_dirpath, "traces")
+    os.makedirs(traces_dirpath)
+    for logcat_filepath in inputs["logcats"]:
+        os.symlink(logcat_filepath, os.path.join(traces_dirpath, os.path.basename(logcat_filepath)))
+    for module_filename in PARSER_MODULE_FILENAMES:
+        module_filepath = os.path.join(root_dirpath, module_filename)
+        if (os.path.exists(module_filepath)):
+            shutil.copyfile(module_filepath, os.path.join(run_dirpath, module_filename))
+
+    elapsed, maxrss = run_tool(python, [ os.path.join(run_dirpath, "parser.py"), "--year", PARSER_YEAR ],
+                               run_dirpath, run_dirpath)
+    # The csv is named after the time it was written
+    csv_filepaths = [ filepath for filepath in list_files(traces_dirpath) if filepath.endswith("_results.csv") ]
+    with open(csv_filepaths[0], "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return elapsed, maxrss, inputs["logcat_lines"], digest
+
+# Name and function of each benchmark, the functions take the interpreter, the
+# root of the checkout, the inputs and an empty directory to run in
+BENCHMARKS = [
+    ("psytrace", run_psytrace),
+    ("statstool avg", run_statstool_avg),
+    ("statstool diff", run_statstool_diff),
+    ("parser", run_parser),
+]
+
+def generate_inputs(dirpath, args):
+    """
+    :return: dict with the paths of the inputs and their number of lines
+    """
+    inputs = {}
+    inputs["trace"] = os.path.join(dirpath, "trace.txt")
+    generate_trace(inputs["trace"], args.trace_lines, args.cpus, args.tasks)
+    inputs["trace_lines"] = args.trace_lines
+
+    rnd = random.Random(0)
+    inputs["stats"] = []
+    for i in range(args.stats_files):
+        stats_filepath = os.path.join(dirpath, "trace%d.txt.out_schedstats.csv" % i)
+        generate_stats(stats_filepath, args.stats_rows, args.cpus, rnd)
+        inputs["stats"].append(stats_filepath)
+
+    inputs["logcats"] = []
+    for i in range(args.logcat_files):
+        logcat_filepath = os.path.join(dirpath, "trace%d.txt.logcat" % i)
+        generate_logcat(logcat_filepath, args.logcat_lines, seed=i)
+        inputs["logcats"].append(logcat_filepath)
+    inputs["logcat_lines"] = args.logcat_lines * args.logcat_files
+
+    return inputs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--python", default=sys.executable,
+                        help="Interpreter to run the tools with")
+    parser.add_argument("--reference", metavar="DIRPATH", default=None,
+                        help="Root of another checkout to run and compare the outputs with")
+    parser.add_argument("--reference-python", default=None,
+                        help="Interpreter to run the reference tools with, defaults to --python")
+    parser.add_argument("--only", action="append", choices=[ name for name, run in BENCHMARKS ], default=None,
+                        help="Run only this benchmark, can be repeated")
+    parser.add_argument("--trace-lines", type=int, default=500000,
+                        help="Number of lines of the trace")
+    parser.add_argument("--cpus", type=int, default=8,
+                        help="Number of cpus of the trace and the schedstats csvs")
+    parser.add_argument("--tasks", type=int, default=400,
+                        help="Number of tasks of the trace")
+    parser.add_argument("--stats-files", type=int, default=20,
+                        help="Number of schedstats csvs")
+    parser.add_argument("--stats-rows", type=int, default=2000,
+                        help="Number of processes per schedstats csv")
+    parser.add_argument("--logcat-lines", type=int, default=500000,
+                        help="Number of lines per logcat")
+    parser.add_argument("--logcat-files", type=int, default=1,
+                        help="Number of logcats")
+    parser.add_argument("--json", metavar="FILEPATH", default=None,
+                        help="Also write the results as json to this file")
+    args = parser.parse_args()
+
+    checkouts = [ ("tree", ROOT_DIRPATH, args.python) ]
+    if (args.reference is not None):
+        checkouts.append(("reference", os.path.realpath(args.reference), args.reference_python or args.python))
+
+    tmp_dirpath = tempfile.mkdtemp()
+    try:
+        inputs = generate_inputs(tmp_dirpath, args)
+
+        results = []
+        for name, run in BENCHMARKS:
+            if ((args.only is not None) and (name not in args.only)):
+                continue
+            digests = []
+            for checkout_name, root_dirpath, python in checkouts:
+                run_dirpath = tempfile.mkdtemp(dir=tmp_dirpath)
+                elapsed, maxrss, num_lines, digest = run(python, root_dirpath, inputs, run_dirpath)
+                print("%-9s %-14s: %d lines in %.2fs, %.0f lines/sec, peak RSS %d KB, output %s" % (
+                    checkout_name, name, num_lines, elapsed, num_lines / elapsed, maxrss, digest[:12]))
+                sys.stdout.flush()
+                results.append({ "checkout" : checkout_name, "benchmark" : name, "lines" : num_lines,
+                                 "seconds" : elapsed, "maxrss_kb" : maxrss, "digest" : digest })
+                digests.append(digest)
+            if (len(digests) > 1):
+                print("%-9s %-14s: outputs are %s" % ("", name, "identical" if (digests[0] == digests[1]) else "DIFFERENT"))
+
+        if (args.json is not None):
+            python_version = subprocess.check_output([args.python, "-c", "import platform; print(platform.python_version())"],
+                                                     universal_newlines=True).strip()
+            with open(args.json, "w") as f:
+                json.dump({ "python" : python_version, "args" : vars(args), "results" : results }, f, indent = 1)
+
+    finally:
+        shutil.rmtree(tmp_dirpath)
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+Synthetic inputs for the trace tooling, so it can be benchmarked offline
+without a headset.
+
+- trace: ftrace text as pulled by systrace.py, with sched_switch,
+  sched_wakeup, cpu_frequency, kgsl_*, net_dev_xmit and netif_receive_skb
+  events over a configurable number of cpus and tasks, the input of psytrace
+- logcat: logcat with VrApi, battery, insideout_periodic and oculus_os_dml
+  lines among unrelated ones, the input of parser.py
+- stats: schedstats csvs as written by psytrace, the input of statstool
+
+The output only depends on the arguments and the seed, eg
+
+    python benchmarks/tracegen.py trace trace.txt --lines 1000000 --cpus 8
+    python benchmarks/tracegen.py logcat trace.txt.logcat --lines 1000000
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+
+THIS_DIRPATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIRPATH, os.pardir))
+
+import schedstats
+
+# Frequencies in KHz of the little cpus, the first half, and of the big ones
+LITTLE_FREQUENCIES = [ 300000, 576000, 1036800, 1478400, 1766400 ]
+BIG_FREQUENCIES = [ 300000, 1036800, 1958400, 2150400, 2457600 ]
+# Power levels of the gpu and their frequencies in Hz
+GPU_FREQUENCIES = [ 710000000, 624000000, 560000000, 510000000, 401000000, 314000000, 257000000 ]
+NET_DEVICES = [ "wlan0", "lo" ]
+
+def generate_trace(filepath, num_lines, num_cpus = 8, num_tasks = 400, seed = 0):
+    """
+    Write a trace where each cpu switches between a few hundred tasks, with
+    frequency changes, gpu and network events in between. About a third of the
+    lines are kgsl_* events, as in traces of a busy VR app
+
+    :param num_tasks: number of tasks, in processes of 8 threads
+    """
+    rnd = random.Random(seed)
+    tasks = [ (500 + i, "Task%d" % i, 500 + (i // 8) * 8) for i in range(num_tasks) ]
+    idle = (0, "<idle>", 0)
+    current = [ idle ] * num_cpus
+    gpu_pwrlevel = 3
+    timestamp = 1000.0
+    with open(filepath, "w") as f:
+        f.write("# tracer: nop\n")
+        f.write("#\n")
+        for i in range(num_lines):
+            timestamp += rnd.random() * 0.00005
+            cpu = rnd.randrange(num_cpus)
+            pid, comm, tgid = current[cpu]
+            r = rnd.random()
+            if (r < 0.3):
+                next_pid, next_comm, next_tgid = idle if (rnd.random() < 0.3) else rnd.choice(tasks)
+                function = "sched_switch"
+                rest = "prev_comm=%s prev_pid=%d prev_prio=120 prev_state=%s ==> next_comm=%s next_pid=%d next_prio=120" % (
+                    "swapper/%d" % cpu if (pid == 0) else comm, pid, rnd.choice([ "S", "R", "D" ]),
+                    "swapper/%d" % cpu if (next_pid == 0) else next_comm, next_pid)
+                current[cpu] = (next_pid, next_comm, next_tgid)
+            elif (r < 0.5):
+                wakee_pid, wakee_comm, _ = rnd.choice(tasks)
+                function = "sched_wakeup"
+                rest = "comm=%s pid=%d prio=120 success=1 target_cpu=%03d" % (wakee_comm, wakee_pid, rnd.randrange(num_cpus))
+            elif (r < 0.56):
+                function = "cpu_frequency"
+                frequencies = LITTLE_FREQUENCIES if (cpu < num_cpus // 2) else BIG_FREQUENCIES
+                rest = "state=%d cpu_id=%d" % (rnd.choice(frequencies), cpu)
+            elif (r < 0.66):
+                function = rnd.choice([ "net_dev_xmit", "netif_receive_skb" ])
+                rest = "dev=%s skbaddr=ffffffc0%08x len=%d" % (rnd.choice(NET_DEVICES), rnd.getrandbits(32),
+                                                               rnd.randint(40, 1500))
+                if (function == "net_dev_xmit"):
+                    rest += " rc=0"
+            else:
+                r = rnd.random()
+                if (r < 0.2):
+                    function = "kgsl_pwrstats"
+                    total = rnd.randint(10000, 20000)
+                    ram_time = rnd.randint(1000000, 2000000)
+                    rest = "d_name=kgsl-3d0 total=%d busy=%d ram_time=%d ram_wait=%d" % (
+                        total, rnd.randint(0, total), ram_time, rnd.randint(0, ram_time))
+                elif (r < 0.35):
+                    function = "kgsl_gpubusy"
+                    rest = "d_name=kgsl-3d0 busy=%d elapsed=%d" % (rnd.randrange(1000000), 1000000)
+                elif (r < 0.45):
+                    function = "kgsl_clk"
+                    rest = "d_name=kgsl-3d0 flag=%s active_freq=%d" % (rnd.choice([ "on", "off" ]),
+                                                                       GPU_FREQUENCIES[gpu_pwrlevel])
+                elif (r < 0.5):
+                    function = "kgsl_pwrlevel"
+                    prev_pwrlevel = gpu_pwrlevel
+                    gpu_pwrlevel = rnd.randrange(len(GPU_FREQUENCIES))
+                    rest = "d_name=kgsl-3d0 pwrlevel=%d freq=%d prev_pwrlevel=%d prev_freq=%d" % (
+                        gpu_pwrlevel, GPU_FREQUENCIES[gpu_pwrlevel], prev_pwrlevel, GPU_FREQUENCIES[prev_pwrlevel])
+                elif (r < 0.55):
+                    function = "kgsl_buslevel"
+                    rest = "d_name=kgsl-3d0 pwrlevel=%d bus=%d" % (gpu_pwrlevel, rnd.randint(0, 12))
+                elif (r < 0.7):
+                    function = "kgsl_issueibcmds"
+                    rest = "d_name=kgsl-3d0 ctx=%d ib=0x0 numibs=1 ts=%d flags=CTX_SWITCH result=0 type=GL" % (
+                        rnd.randint(1, 40), i)
+                elif (r < 0.85):
+                    function = rnd.choice([ "kgsl_register_event", "kgsl_fire_event" ])
+                    rest = "ctx=0 ts=%d type=retired age=0 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28" % i
+                    if (function == "kgsl_register_event"):
+                        rest = rest.replace(" type=retired age=0", "")
+                else:
+                    function = rnd.choice([ "kgsl_active_count_put", "kgsl_timer" ])
+                    rest = "work:ffffffc001b1f738, adreno_dispatcher_work+0xa14/0xac8"
+            # Some names miss the kernel comm cache
+            if ((pid != 0) and (rnd.random() < 0.05)):
+                comm = "<...>"
+            f.write("%16s-%-5d (%5d) [%03d] d..3 %.6f: %s: %s\n" % (comm, pid, tgid, cpu, timestamp, function, rest))
+
+def generate_logcat(filepath, num_lines, seed = 0):
+    """
+    Write a logcat where about a third of the lines carry data for the parser
+    """
+    rnd = random.Random(seed)
+    with open(filepath, "w") as f:
+        for i in range(num_lines):
+            timestamp = "07-%02d %02d:%02d:%02d.%03d" % (21 + i // 1000000, (i // 100000) % 24, (i // 1000) % 60,
+                                                          (i // 10) % 60, rnd.randrange(1000))
+            r = rnd.random()
+            if (r < 0.15):
+                tag = "VrApi"
+                message = ("FPS=%d/72,Prd=%dms,Tear=%d,Early=0,Stale=%d,Stale2/5/10/max=0/0/0/0,VSnc=0,Lat=%d,Fov=0,"
+                           "CPU4/GPU=3/3,1958/490MHz,OC=FF,TA=0/0/0,SP=N/N/N,Mem=1804MHz,Free=%dMB,PLS=0,"
+                           "Temp=%.1fC/0.0C,TW=2.97ms,App=5.46ms,GD=0.00ms,CPU&GPU=8.67ms,LCnt=1(DR72,LM2),"
+                           "GPU%%=0.59,CPU%%=0.22(W0.30),DSF=1.00,CFL=16.00/20.00") % (
+                    rnd.randint(60, 72), rnd.randint(30, 50), rnd.randint(0, 3), rnd.randint(0, 5),
+                    rnd.choice([ -1, 1, 2 ]), rnd.randint(900, 1500), 30 + rnd.random() * 10)
+            elif (r < 0.2):
+                tag = "BatteryStats"
+                message = "current_now=%d voltage_now=%d" % (rnd.randint(100000, 900000), rnd.randint(3600000, 4300000))
+            elif (r < 0.25):
+                tag = "insideout_periodic"
+                message = ('{"duration":%d,"frames":%d,"inliers_avg":%.2f,"has_tracking":true,"keyframes_avg":%.1f,'
+                           '"map_points_avg":%d,"mapper_queue_max":%d,"realtime_ms":%d,"reprojection_err_avg":%.3f,'
+                           '"tracker_dur_p50":%.2f,"tracker_dur_p90":%.2f,"uptime_ms":%d,"vision_jitter_p50":%.2f,'
+                           '"vision_jitter_p90":%.2f,"visionlib_sourcecodeversion":"r%d","stats":{"lost":%d}}') % (
+                    rnd.randint(4900, 5100), rnd.randint(140, 150), rnd.random() * 80, rnd.random() * 20,
+                    rnd.randint(1000, 5000), rnd.randint(0, 8), rnd.randint(10 ** 6, 10 ** 7), rnd.random(),
+                    rnd.random() * 5, rnd.random() * 9, i * 10, rnd.random(), rnd.random() * 2,
+                    rnd.randint(1000, 2000), rnd.randint(0, 3))
+            elif (r < 0.3):
+                tag = "oculus_os_dml"
+                fields = []
+                for sensor in [ "controller_imu", "controller_button", "imu_hmd", "mag", "sync", "vsync" ]:
+                    fields.append('"%s_average_rtt":%.3f,"%s_max_rtt":%.3f,"%s_samples":%d' % (
+                        sensor, rnd.random(), sensor, rnd.random() * 4, sensor, rnd.randint(0, 1000)))
+                message = "{%s}" % ",".join(fields)
+            else:
+                tag = rnd.choice([ "ActivityManager", "SurfaceFlinger", "chatty", "Zygote" ])
+                message = "uid=%d expire %d lines, Stale=%d" % (rnd.randint(1000, 10000), rnd.randint(1, 99), rnd.randint(0, 9))
+            f.write("%s  %4d  %4d I %-8s: %s\n" % (timestamp, rnd.randint(100, 5000), rnd.randint(100, 5000), tag, message))
+
+def generate_stats(filepath, num_rows, num_cpus, rnd):
+    """
+    Write a schedstats csv with num_rows processes, 90% of them from a set
+    shared by all the files
+
+    :param rnd: random.Random, shared by the files of a run so they differ
+    """
+    with open(filepath, "w") as f:
+        schedstats.write_schedstats_header(f, num_cpus)
+        row_format = schedstats.build_schedstats_format(num_cpus)
+        for i in range(num_rows):
+            if (rnd.random() < 0.9):
+                comm = "process%d" % i
+            else:
+                comm = "rare%d" % rnd.randrange(num_rows * 10)
+            values = [ rnd.random() * 100.0 for j in range(6 + num_cpus * 4) ]
+            f.write(row_format % tuple([ comm, "parent%d" % (i % 50), rnd.randint(1, 8) ] + values))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=[ "trace", "logcat", "stats" ], help="Kind of file to generate")
+    parser.add_argument("filepath", help="File to write")
+    parser.add_argument("--lines", type=int, default=100000,
+                        help="Number of lines of the trace or logcat, of processes of the schedstats csv")
+    parser.add_argument("--cpus", type=int, default=8,
+                        help="Number of cpus of the trace or schedstats csv")
+    parser.add_argument("--tasks", type=int, default=400,
+                        help="Number of tasks of the trace")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the random generator")
+    args = parser.parse_args()
+
+    if (args.kind == "trace"):
+        generate_trace(args.filepath, args.lines, args.cpus, args.tasks, args.seed)
+    elif (args.kind == "logcat"):
+        generate_logcat(args.filepath, args.lines, args.seed)
+    else:
+        generate_stats(args.filepath, args.lines, args.cpus, random.Random(args.seed))
+
+if (__name__ == "__main__"):
+    main()
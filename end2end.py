@@ -4,6 +4,8 @@ import requests
 from time import sleep
 import argparse
 
+import logcatlive
+
 def wait_for_file():
     while True:
         try:
@@ -14,7 +16,7 @@ def wait_for_file():
             print("file not yet created. Waiting 0.5 sec and will try again.")
             sleep (0.5)
         
-def main(sequence, time):
+def main(sequence, time, live = False):
     # set up a session in order to call the Tritium Web API 
     # on Rosita to run the sequence
     session = requests.Session()
@@ -53,6 +55,12 @@ def main(sequence, time):
     # This DOES work - just with a half-second potential for missing the cue
     wait_for_file()
 
+    # print rolling FPS/latency/temperature while the sequence plays
+    if live:
+        logcat_process = logcatlive.adb_logcat(["-T", "1"])
+        monitor = logcatlive.LiveMonitor(logcat_process.stdout)
+        monitor.start()
+
     # start Rosita's animations
     play_url = "https://rt-0101.robothespian.co.uk/tritium/sequence_player/play/"
     response = session.put(play_url+sequence)
@@ -63,13 +71,19 @@ def main(sequence, time):
     SYSTRACE_FILEPATH = os.path.join(SYSTRACE_FILEPATH, "systrace.py")
     os.system("python \"{}\" {}".format(SYSTRACE_FILEPATH, time))
 
+    if live:
+        logcat_process.terminate()
+        monitor.stop()
+
 if (__name__ == "__main__"):
     parser = argparse.ArgumentParser()
     parser.add_argument('sequence', 
                         help='Specify the sequence name to be played on RoboThespian (omit .sequence)')
     parser.add_argument('time', type=int,
                         help='Specify the amount of time (seconds) to run Dead & Buried, RoboThespian animation, and systrace')
+    parser.add_argument('--live', action='store_true',
+                        help='Print rolling FPS, latency and temperature from adb logcat while the sequence plays')
     args = parser.parse_args()
     sequence = args.sequence
     time = args.time
-    main(sequence, time)
\ No newline at end of file
+    main(sequence, time, args.live)
\ No newline at end of file
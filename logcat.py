@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Grabs VrApi, insideout_periodic and oculus_os_dml metrics from logcat.
+
+parse_logcat works on any stream of logcat lines, eg a file, the stdout of
+"adb logcat" or a list, so tools can parse in-process as the lines arrive.
+write_results is what parser.py runs on the traces/*.txt.logcat files.
+
+"""
+
+import datetime
+import heapq
+import logging
+import re
+import sys
+from os import listdir
+from os.path import isfile, join
+
+from metricseries import SeriesWriter
+
+# Specify what data to pull from the logcat file
+VRAPI_FIELDS = ['FPS',
+                'Prd',
+                'Tear',
+                'Early',
+                'Stale',
+                'VSnc',
+                'Lat',
+                'Fov',
+                'Free',
+                'Temp',
+                'current_now',
+                'voltage_now']
+INSIDEOUT_FIELDS = ['duration',
+                    'frames',
+                    'inliers_avg',
+                    'has_tracking',
+                    'keyframes_avg',
+                    'map_points_avg',
+                    'mapper_queue_max',
+                    'realtime_ms',
+                    'reprojection_err_avg',
+                    'tracker_dur_p50',
+                    'tracker_dur_p90',
+                    'uptime_ms',
+                    'vision_jitter_p50',
+                    'vision_jitter_p90',
+                    'visionlib_sourcecodeversion']
+OCULUS_OS_DML_FIELDS = ['controller_button_average_rtt',
+                        'controller_button_max_rtt',
+                        'controller_button_samples',
+                        'controller_imu_average_rtt',
+                        'controller_imu_max_rtt',
+                        'controller_imu_samples',
+                        'imu_hmd_average_rtt',
+                        'imu_hmd_max_rtt',
+                        'imu_hmd_samples',
+                        'mag_average_rtt',
+                        'mag_max_rtt',
+                        'mag_samples',
+                        'sync_average_rtt',
+                        'sync_max_rtt',
+                        'sync_samples',
+                        'vsync_average_rtt',
+                        'vsync_max_rtt',
+                        'vsync_samples']
+DEFAULT_FIELDS = VRAPI_FIELDS + INSIDEOUT_FIELDS + OCULUS_OS_DML_FIELDS
+
+# Set regex for identifying the timestamp on a line
+TIMESTAMP_REGEXP = re.compile(br'[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{3}')
+
+# The fields of the timestamps are fixed width, so comparing them as strings
+# compares the times. Rows without one sort with the row before them
+NO_TIMESTAMP = ""
+
+logger = logging.getLogger(__name__)
+
+def build_key_value_regexp(fields):
+    # VrApi writes comma separated key=value pairs, eg FPS=72/72,Prd=39ms,...
+    # only the leading digits of the value are grabbed
+    return re.compile(b'(' + b'|'.join([re.escape(field.encode("ascii")) for field in fields]) + b')=([0123456789]+)')
+
+def build_json_regexp(fields):
+    # insideout_periodic and oculus_os_dml write json, grab the text between the
+    # key and the next comma. The value is captured in a lookahead so the keys
+    # nested inside it are found too
+    return re.compile(b'"(' + b'|'.join([re.escape(field.encode("ascii")) for field in fields]) + b')":(?=([^,\n]*),)')
+
+# Format of the fields of each source and the function building the regex that
+# grabs them
+SOURCES = [(VRAPI_FIELDS, build_key_value_regexp),
+           (INSIDEOUT_FIELDS, build_json_regexp),
+           (OCULUS_OS_DML_FIELDS, build_json_regexp)]
+
+# Compiled regexes indexed by the tuple of fields they grab
+_source_regexps_cache = {}
+
+def get_source_regexps(fields):
+    """
+    :param fields: tuple of field names
+    :return: list with one precompiled regex per source with fields to grab, so
+             all the fields of a source are found in a single pass over the line
+    """
+    try:
+        return _source_regexps_cache[fields]
+    except KeyError:
+        pass
+
+    regexps = []
+    for source_fields, build_regexp in SOURCES:
+        wanted_fields = [field for field in source_fields if field in fields]
+        if len(wanted_fields) > 0:
+            regexps.append(build_regexp(wanted_fields))
+    unknown_fields = set(fields) - set(DEFAULT_FIELDS)
+    if len(unknown_fields) > 0:
+        raise ValueError("Unknown logcat fields %s" % repr(sorted(unknown_fields)))
+    _source_regexps_cache[fields] = regexps
+    return regexps
+
+def parse_line(line, regexps):
+    """
+    :param line: *bytes* logcat line
+    :param regexps: list of regexes as returned by get_source_regexps
+    :return: dict with the value of every field found in line, each field
+             takes its first occurrence
+    """
+    values = {}
+    for regexp in regexps:
+        for m in regexp.finditer(line):
+            if m.group(1) not in values:
+                values[m.group(1)] = m.group(2)
+    return values
+
+def to_text(value):
+    if sys.version_info[0] >= 3:
+        return value.decode("utf-8", "replace")
+    return value
+
+def iter_rows(stream, fields, year):
+    """
+    :return: generator of (timestamp, values) of each line of stream with data
+             to grab, see parse_logcat
+    """
+    regexps = get_source_regexps(tuple(fields))
+    # Index of each field in the values, lines have only a few of them
+    field_indices = dict((field.encode("ascii"), index) for index, field in enumerate(fields))
+    empty_values = [""] * len(fields)
+    if year is None:
+        year = datetime.datetime.now().strftime("%y")
+    year_separator = b"-" + year.encode("ascii") + b" "
+
+    for line in stream:
+        if not isinstance(line, bytes):
+            line = line.encode("utf-8")
+        if b"FPS=" in line or b'insideout_periodic' in line or b'controller_imu_average_rtt' in line or b'current_now' in line:
+            # Relevant lines with data to grab come from VrApi (that
+            # include FPS, for example), insideout_periodic, or oculus_os_dml.
+
+            timestamp = TIMESTAMP_REGEXP.search(line)
+            if timestamp is not None:
+                date_time = timestamp.group().split(b" ")
+                timestamp = to_text(date_time[0] + year_separator + date_time[1])
+            else:
+                timestamp = NO_TIMESTAMP
+            values = list(empty_values)
+            for field, value in parse_line(line, regexps).items():
+                values[field_indices[field]] = to_text(value)
+            yield timestamp, tuple(values)
+
+def parse_logcat(stream, fields = None, year = None):
+    """
+    :param stream: iterable of logcat lines, as bytes (eg a file opened in
+                   binary mode or the stdout of "adb logcat") or text
+    :param fields: list of field names to grab, DEFAULT_FIELDS if None
+    :param year: *string* two digit year written in the timestamps, logcat
+                 doesn't have it, the current year if None
+    :return: generator of (timestamp, values) for each line with data to grab,
+             timestamp being "MM-DD-YY HH:MM:SS.mmm" (NO_TIMESTAMP if the line
+             doesn't have one) and values a tuple with the text value of each
+             field, empty if the field isn't in the line. Lines are parsed as
+             they are read, so it can follow a live stream
+    """
+    if fields is None:
+        fields = DEFAULT_FIELDS
+    return iter_rows(stream, fields, year)
+
+def parse_file(filepath, year = None):
+    """
+    :return: list of (timestamp, values) for the lines of the logcat file with
+             data to grab, see parse_logcat
+    """
+    with open(filepath, "rb") as f:
+        return list(iter_rows(f, DEFAULT_FIELDS, year))
+
+def sort_rows(rows):
+    """
+    Stable sort of the rows of one file by timestamp, logcat interleaves
+    buffers so it's only mostly sorted
+
+    :return: list of (sort timestamp, row), rows without a timestamp take the
+             one of the row before them
+    """
+    keys = []
+    timestamp = NO_TIMESTAMP
+    for row_timestamp, values in rows:
+        if row_timestamp != NO_TIMESTAMP:
+            timestamp = row_timestamp
+        keys.append(timestamp)
+    order = sorted(range(len(rows)), key=lambda i: keys[i])
+    return [(keys[i], rows[i]) for i in order]
+
+def merge_rows(files_rows):
+    """
+    :return: generator of the rows of all the files ordered by timestamp, rows
+             with the same timestamp keep the order of the files and then of
+             the lines
+    """
+    decorated = []
+    for file_index, rows in enumerate(files_rows):
+        decorated.append([(timestamp, file_index, line_index, row)
+                          for line_index, (timestamp, row) in enumerate(sort_rows(rows))])
+    for timestamp, file_index, line_index, row in heapq.merge(*decorated):
+        yield row
+
+def parse_file_args(args):
+    return parse_file(*args)
+
+def write_results(traces_filepath, num_jobs = 1, merge = False, year = None, series_dirpath = None):
+    """
+    Grab the data of all the .txt.logcat files in a directory into a
+    timestamped _results.csv in the same directory
+
+    :param num_jobs: number of processes parsing the files
+    :param merge: order the rows of all the files by timestamp, instead of file
+                  after file
+    :param year: *string* two digit year written in the timestamps
+    :param series_dirpath: if not None, also write each metric as a typed
+                           series to this directory, see metricseries.py
+    :return: path of the csv
+    """
+    # Get list of all filenames ending in .txt.logcat in traces/ directory
+    onlyfiles = [f for f in listdir(traces_filepath) if isfile(join(traces_filepath, f))]
+    files = []
+    for file in onlyfiles:
+        if ".txt.logcat" in file:
+            files.append(file)
+    logger.debug("Grabbing the data of %s" % repr(files))
+
+    # Set the file to write the parsed results to
+    now = datetime.datetime.now()
+    filepath = join(traces_filepath, now.strftime("%Y%m%d-%H%M%S_results.csv"))
+    result = open(filepath, "w")
+
+    # Write headers for file
+    result.write("timestamp,")
+    for item in DEFAULT_FIELDS:
+        result.write(item+",")
+    result.write("\n")
+
+    tasks = [(join(traces_filepath, file), year) for file in files]
+    pool = None
+    if num_jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(num_jobs)
+        files_rows = pool.imap(parse_file_args, tasks)
+    else:
+        files_rows = (parse_file_args(task) for task in tasks)
+
+    try:
+        if merge:
+            rows = merge_rows(files_rows)
+        else:
+            rows = (row for file_rows in files_rows for row in file_rows)
+        series = None
+        if series_dirpath is not None:
+            # Also write each metric as a typed series
+            series = SeriesWriter(series_dirpath, DEFAULT_FIELDS)
+        for timestamp, values in rows:
+            result.write(timestamp + "," + ",".join(values) + ",\n")
+            if series is not None:
+                series.add_values(timestamp, values)
+        if series is not None:
+            series.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    result.close()
+
+    return filepath
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+"""
+Live rolling aggregates of the logcat metrics while a run is going on.
+
+Tails "adb logcat", or replays a logcat file standing in for a device, through
+the logcat.py field extractors and keeps the last, mean, min and max of each
+metric over a rolling window of logcat time. The aggregates are printed every
+few seconds and, with --http, served as json.
+
+Memory is bounded: lines are read by a thread into a bounded queue and the
+windows keep a bounded number of samples. When parsing falls behind, new lines
+from adb are dropped and counted instead of stalling the reader, so adb keeps
+draining the device buffer. Replayed files are never dropped from, the replay
+waits for the parser instead, so replaying a file always gives the same
+aggregates.
+
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import logcat
+from metricseries import parse_csv_timestamp, parse_value
+
+LIVE_FIELDS = ["FPS", "Lat", "Temp"]
+# Lines queued between the reader thread and the parser
+LIVE_QUEUE_LINES = 10000
+# Seconds of logcat time in the rolling windows
+LIVE_WINDOW_SECONDS = 10.0
+# Samples kept in each window however many fall in it
+LIVE_WINDOW_SAMPLES = 4096
+# Seconds between reports
+LIVE_REPORT_SECONDS = 2.0
+
+logger = logging.getLogger(__name__)
+
+class RollingWindow(object):
+    """
+    Samples of a metric over the last window_ms of logcat time
+    """
+    __slots__ = ("window_ms", "samples", "total")
+
+    def __init__(self, window_ms, max_samples = LIVE_WINDOW_SAMPLES):
+        self.window_ms = window_ms
+        # (time, value) in the order they were added
+        self.samples = collections.deque(maxlen = max_samples)
+        # Sum of the values in samples, kept so the mean is O(1)
+        self.total = 0.0
+
+    def add(self, time_ms, value):
+        if (len(self.samples) == self.samples.maxlen):
+            self.total -= self.samples[0][1]
+        self.samples.append((time_ms, value))
+        self.total += value
+        # Logcat interleaves buffers, so times are only mostly increasing,
+        # expire from the oldest end relative to the newest sample
+        while ((len(self.samples) > 0) and (self.samples[0][0] <= time_ms - self.window_ms)):
+            self.total -= self.samples.popleft()[1]
+
+    def summary(self):
+        """
+        :return: dict with the last, mean, min and max values and the number of
+                 samples, None if the window is empty
+        """
+        if (len(self.samples) == 0):
+            return None
+        values = [ value for sample_time, value in self.samples ]
+        return { "last" : values[-1],
+                 "mean" : self.total / len(values),
+                 "min" : min(values),
+                 "max" : max(values),
+                 "count" : len(values) }
+
+class LiveMetrics(object):
+    """
+    Rolling window of each field, fed with the rows of logcat.parse_logcat
+    """
+    def __init__(self, fields, window_seconds = LIVE_WINDOW_SECONDS, max_samples = LIVE_WINDOW_SAMPLES):
+        self.fields = list(fields)
+        window_ms = int(window_seconds * 1000)
+        self.windows = [ RollingWindow(window_ms, max_samples) for field in self.fields ]
+        # Logcat time of the last row with a timestamp, rows without one are
+        # taken as logged at the same time
+        self.time_ms = None
+        self.num_rows = 0
+
+    def add(self, timestamp, values):
+        """
+        :param timestamp: timestamp yielded by logcat.parse_logcat
+        :param values: values yielded by logcat.parse_logcat, in fields order
+        """
+        time_ms = parse_csv_timestamp(timestamp)
+        if (time_ms is not None):
+            self.time_ms = time_ms
+        elif (self.time_ms is None):
+            return
+        self.num_rows += 1
+        for window, value in zip(self.windows, values):
+            if (value != ""):
+                value = parse_value(value)
+                if (value is not None):
+                    window.add(self.time_ms, value)
+
+    def snapshot(self):
+        """
+        :return: dict with the summary of each field with samples
+        """
+        metrics = {}
+        for field, window in zip(self.fields, self.windows):
+            summary = window.summary()
+            if (summary is not None):
+                metrics[field] = summary
+        return metrics
+
+class LineReader(threading.Thread):
+    """
+    Reads the lines of a stream into a bounded queue, dropping them when the
+    queue is full if drop_lines, else waiting for room, then queues None
+    """
+    def __init__(self, stream, max_lines = LIVE_QUEUE_LINES, drop_lines = True):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.stream = stream
+        self.lines = queue.Queue(max_lines)
+        self.drop_lines = drop_lines
+        self.num_lines = 0
+        self.num_dropped = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        try:
+            for line in self.stream:
+                if (self.stopping.is_set()):
+                    break
+                self.num_lines += 1
+                if (not self.drop_lines):
+                    self.lines.put(line)
+                    continue
+                try:
+                    self.lines.put_nowait(line)
+                except queue.Full:
+                    self.num_dropped += 1
+        finally:
+            # Block for the end marker, the consumer must see it
+            self.lines.put(None)
+
+    def stop(self):
+        self.stopping.set()
+
+def replay_lines(filepath, speed = 1.0):
+    """
+    :param speed: multiple of the logcat time to replay the lines at, 0 to
+                  replay them as fast as they can be read
+    :return: generator of the lines of a logcat file, paced by their timestamps
+    """
+    start_time = None
+    with open(filepath, "rb") as f:
+        for line in f:
+            if (speed > 0):
+                timestamp = logcat.TIMESTAMP_REGEXP.search(line)
+                if (timestamp is not None):
+                    time_ms = parse_csv_timestamp(timestamp.group().decode("ascii").replace(" ", "-00 ", 1))
+                    if (start_time is None):
+                        start_time = (time.time(), time_ms)
+                    delay = start_time[0] + (time_ms - start_time[1]) / 1000.0 / speed - time.time()
+                    if (delay > 0):
+                        time.sleep(delay)
+            yield line
+
+class LiveMonitor(object):
+    """
+    Parses a stream of logcat lines into LiveMetrics as they arrive, reporting
+    the aggregates every report_seconds
+    """
+    def __init__(self, stream, fields = LIVE_FIELDS, window_seconds = LIVE_WINDOW_SECONDS,
+                 report_seconds = LIVE_REPORT_SECONDS, max_lines = LIVE_QUEUE_LINES, year = None, report = None,
+                 drop_lines = True):
+        """
+        :param stream: iterable of logcat lines, eg the stdout of adb logcat
+        :param drop_lines: drop the lines that don't fit in the queue when
+                           parsing falls behind, instead of waiting for it,
+                           see LineReader
+        :param report: function called with the snapshot dict on each report,
+                       print_snapshot if None
+        """
+        self.fields = fields
+        self.year = year
+        self.metrics = LiveMetrics(fields, window_seconds)
+        self.reader = LineReader(stream, max_lines, drop_lines)
+        self.report_seconds = report_seconds
+        self.report = print_snapshot if (report is None) else report
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def queued_lines(self):
+        """
+        :return: generator of the lines queued by the reader, reporting between
+                 them when it's time to
+        """
+        next_report = time.time() + self.report_seconds
+        while (True):
+            try:
+                line = self.reader.lines.get(timeout = max(0.0, next_report - time.time()))
+            except queue.Empty:
+                line = None
+            else:
+                if (line is None):
+                    break
+            if (time.time() >= next_report):
+                self.report(self.snapshot())
+                next_report = time.time() + self.report_seconds
+            if (line is not None):
+                yield line
+
+    def run(self):
+        """
+        Parse the stream until it ends or stop is called
+        """
+        self.reader.start()
+        for timestamp, values in logcat.parse_logcat(self.queued_lines(), self.fields, self.year):
+            with self.lock:
+                self.metrics.add(timestamp, values)
+        self.report(self.snapshot())
+
+    def start(self):
+        """
+        Run in a background thread, eg while a sequence plays
+        """
+        self.thread = threading.Thread(target = self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout = None):
+        self.reader.stop()
+        if (self.thread is not None):
+            self.thread.join(timeout)
+
+    def snapshot(self):
+        """
+        :return: dict with the metrics, the number of lines read and of lines
+                 dropped because parsing fell behind
+        """
+        with self.lock:
+            metrics = self.metrics.snapshot()
+            num_rows = self.metrics.num_rows
+        return { "metrics" : metrics,
+                 "lines" : self.reader.num_lines,
+                 "dropped" : self.reader.num_dropped,
+                 "rows" : num_rows }
+
+def print_snapshot(snapshot):
+    metrics = snapshot["metrics"]
+    fields = [ "%s %g (mean %.1f, %g..%g)" % (field, metrics[field]["last"], metrics[field]["mean"],
+                                              metrics[field]["min"], metrics[field]["max"])
+               for field in sorted(metrics.keys()) ]
+    print("%s | %d lines, %d dropped" % (", ".join(fields) if (len(fields) > 0) else "no metrics yet",
+                                        snapshot["lines"], snapshot["dropped"]))
+    sys.stdout.flush()
+
+def adb_logcat(adb_args = ()):
+    """
+    :return: the adb logcat process, its stdout has the lines
+    """
+    cmd = [ "adb", "logcat" ] + list(adb_args)
+    logger.debug("Running command %s" % repr(cmd))
+    return subprocess.Popen(cmd, stdout = subprocess.PIPE)
+
+def serve_snapshots(monitor, port):
+    """
+    Serve the snapshots of monitor as json on port from a background thread
+    """
+    class SnapshotHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(monitor.snapshot(), indent = 1, sort_keys = True).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = HTTPServer(("", port), SnapshotHandler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replay", metavar="FILEPATH", default=None,
+                        help="Replay a logcat file instead of tailing adb logcat")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Multiple of the logcat time to replay at, 0 to replay as fast as possible")
+    parser.add_argument("--adb-args", default="",
+                        help="Space separated arguments for adb logcat, eg \"-T 1\" to skip the buffered lines")
+    parser.add_argument("--fields", default=",".join(LIVE_FIELDS),
+                        help="Comma separated logcat fields to aggregate")
+    parser.add_argument("--window", type=float, default=LIVE_WINDOW_SECONDS,
+                        help="Seconds of logcat time in the rolling aggregates")
+    parser.add_argument("--interval", type=float, default=LIVE_REPORT_SECONDS,
+                        help="Seconds between reports")
+    parser.add_argument("--queue", type=int, default=LIVE_QUEUE_LINES,
+                        help="Lines queued before dropping, replays wait instead of dropping")
+    parser.add_argument("--year", default=None,
+                        help="Two digit year of the logcat timestamps, defaults to the current year")
+    parser.add_argument("--http", metavar="PORT", type=int, default=None,
+                        help="Also serve the aggregates as json on this port")
+    args = parser.parse_args()
+    if (args.window <= 0):
+        parser.error("--window must be greater than 0")
+
+    logging.basicConfig(level=logging.INFO)
+
+    process = None
+    if (args.replay is not None):
+        stream = replay_lines(args.replay, args.speed)
+    else:
+        process = adb_logcat(args.adb_args.split())
+        stream = process.stdout
+
+    monitor = LiveMonitor(stream, args.fields.split(","), args.window, args.interval, args.queue, args.year,
+                          drop_lines = (process is not None))
+    if (args.http is not None):
+        serve_snapshots(monitor, args.http)
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if (process is not None):
+            process.terminate()
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+Typed time series of the logcat metrics grabbed by parser.py.
+
+A series directory has two .npy files per metric, so each metric keeps only
+the timestamps it was logged at:
+- <metric>.time.npy: int64 milliseconds since the epoch of the logcat wall
+  clock time, logcat doesn't log the timezone
+- <metric>.value.npy: float64 values, json true and false are stored as 1 and
+  0, text values are skipped
+
+Rolled up directories also have <metric>.min.npy, <metric>.max.npy and
+<metric>.count.npy for each period, with the mean as the value and the start
+of the period as the time. The metrics and their lengths are in series.json.
+The files can be memory-mapped with numpy.load or loaded with load_series.
+
+"""
+from __future__ import print_function
+
+import argparse
+import array
+import calendar
+import json
+import os
+import re
+import sys
+
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+from npyfile import NpyWriter, NPY_BUFFER_ELEMENTS, descr_to_typecode, int64_typecode, load_npy, read_npy_header
+
+SERIES_INDEX_FILENAME = "series.json"
+
+# Columns of a series and of a rolled up series, with their typecodes
+SERIES_COLUMNS = [ ("time", int64_typecode()), ("value", "d") ]
+ROLLUP_COLUMNS = SERIES_COLUMNS + [ ("min", "d"), ("max", "d"), ("count", int64_typecode()) ]
+
+# Timestamp as written by parser.py in the csv, eg 07-21-18 23:53:50.123
+CSV_TIMESTAMP_REGEXP = re.compile(r"([0-9]{2})-([0-9]{2})-([0-9]+) ([0-9]{2}):([0-9]{2}):([0-9]{2}).([0-9]{3})$")
+
+def parse_csv_timestamp(timestamp):
+    """
+    :param timestamp: *string* timestamp of a parser.py csv row
+    :return: milliseconds since the epoch, None if the timestamp is empty or
+             malformed
+    """
+    m = CSV_TIMESTAMP_REGEXP.match(timestamp)
+    if (m is None):
+        return None
+    month, day, year, hours, minutes, seconds, milliseconds = [ int(group) for group in m.groups() ]
+    if (year < 100):
+        year += 2000
+
+    return calendar.timegm((year, month, day, hours, minutes, seconds)) * 1000 + milliseconds
+
+def parse_value(value):
+    """
+    :param value: *string* value of a metric as grabbed from logcat
+    :return: the value as a float, None if it isn't a number
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    if (value == "true"):
+        return 1.0
+    if (value == "false"):
+        return 0.0
+    return None
+
+def series_filepath(dirpath, metric, column):
+    return os.path.join(dirpath, "%s.%s.npy" % (metric, column))
+
+class SeriesWriter(object):
+    """
+    Writes the metrics of parser.py rows as one series per metric, with bounded
+    memory
+    """
+    def __init__(self, dirpath, metrics, columns = SERIES_COLUMNS):
+        """
+        :param dirpath: directory to write the series to, created if needed
+        :param metrics: list with the names of the metrics, in the order of the
+                        values of the rows
+        """
+        if (not os.path.exists(dirpath)):
+            os.makedirs(dirpath)
+        self.dirpath = dirpath
+        self.metrics = list(metrics)
+        self.columns = columns
+        # Writers for each metric, created when its first value is added
+        self.writers = [ None ] * len(self.metrics)
+
+    def add(self, metric_index, values):
+        """
+        :param metric_index: index of the metric in metrics
+        :param values: one value per column
+        """
+        writers = self.writers[metric_index]
+        if (writers is None):
+            writers = [ NpyWriter(series_filepath(self.dirpath, self.metrics[metric_index], name), typecode)
+                        for name, typecode in self.columns ]
+            self.writers[metric_index] = writers
+        for writer, value in zip(writers, values):
+            writer.append(value)
+
+    def add_values(self, timestamp, values):
+        """
+        :param timestamp: *string* timestamp of a parser.py row
+        :param values: text value of each metric, empty if it wasn't logged,
+                       as yielded by logcat.parse_logcat
+        """
+        time = parse_csv_timestamp(timestamp)
+        if (time is None):
+            return
+        for metric_index, value in enumerate(values):
+            if (value != ""):
+                value = parse_value(value)
+                if (value is not None):
+                    self.add(metric_index, (time, value))
+
+    def close(self):
+        lengths = {}
+        for metric, writers in zip(self.metrics, self.writers):
+            if (writers is not None):
+                for writer in writers:
+                    writer.close()
+                lengths[metric] = writers[0].length
+
+        with open(os.path.join(self.dirpath, SERIES_INDEX_FILENAME), "w") as f:
+            json.dump({ "metrics" : [ metric for metric in self.metrics if (metric in lengths) ],
+                        "lengths" : lengths,
+                        "columns" : [ name for name, typecode in self.columns ] }, f, indent = 1)
+
+def load_series_index(dirpath):
+    with open(os.path.join(dirpath, SERIES_INDEX_FILENAME), "r") as f:
+        return json.load(f)
+
+def load_series(dirpath, metric):
+    """
+    :return: dict with the memory-mapped columns of the metric (numpy arrays if
+             NumPy is available, otherwise array.array) indexed by column name
+    """
+    index = load_series_index(dirpath)
+    return dict([ (name, load_npy(series_filepath(dirpath, metric, name))) for name in index["columns"] ])
+
+def iter_npy(filepath):
+    """
+    :return: generator of the values of a .npy file, read in chunks
+    """
+    with open(filepath, "rb") as f:
+        descr, length = read_npy_header(f)
+        typecode = descr_to_typecode(descr)
+        while (length > 0):
+            values = array.array(typecode)
+            values.fromfile(f, min(length, NPY_BUFFER_ELEMENTS))
+            if (sys.byteorder != "little"):
+                values.byteswap()
+            for value in values:
+                yield value
+            length -= len(values)
+
+def rollup_series(src_dirpath, dst_dirpath, period_ms):
+    """
+    Downsample every metric of a series directory to one sample per period,
+    with the mean, min, max and count of the values in the period
+
+    :param period_ms: length of the periods in milliseconds, periods start at
+                      multiples of it since the epoch
+    """
+    index = load_series_index(src_dirpath)
+    writer = SeriesWriter(dst_dirpath, index["metrics"], ROLLUP_COLUMNS)
+    for metric_index, metric in enumerate(index["metrics"]):
+        # The series are in file order, which is only sorted when parser.py
+        # merged them, so accumulate every period before writing any. Memory
+        # grows with the number of periods, not of values
+        periods = {}
+        times = iter_npy(series_filepath(src_dirpath, metric, "time"))
+        values = iter_npy(series_filepath(src_dirpath, metric, "value"))
+        for time, value in zip(times, values):
+            period = time - time % period_ms
+            try:
+                stats = periods[period]
+            except KeyError:
+                periods[period] = [ value, value, value, 1 ]
+                continue
+            stats[0] += value
+            stats[1] = min(stats[1], value)
+            stats[2] = max(stats[2], value)
+            stats[3] += 1
+
+        for period in sorted(periods.keys()):
+            total, minimum, maximum, count = periods[period]
+            writer.add(metric_index, (period, total / count, minimum, maximum, count))
+    writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+    rollup_parser = subparsers.add_parser("rollup", help="Downsample a series directory")
+    rollup_parser.add_argument("src_dirpath", help="Series directory written by parser.py --series")
+    rollup_parser.add_argument("dst_dirpath", help="Directory to write the rolled up series to")
+    rollup_parser.add_argument("--period", type=float, default=1.0,
+                               help="Seconds per sample of the rolled up series")
+    info_parser = subparsers.add_parser("info", help="Print the metrics of a series directory")
+    info_parser.add_argument("dirpath", help="Series directory")
+    args = parser.parse_args()
+
+    if (args.command == "rollup"):
+        rollup_series(args.src_dirpath, args.dst_dirpath, max(1, int(round(args.period * 1000))))
+
+    elif (args.command == "info"):
+        index = load_series_index(args.dirpath)
+        for metric in index["metrics"]:
+            print("%s: %d samples" % (metric, index["lengths"][metric]))
+
+    else:
+        parser.print_help()
+
+if (__name__ == "__main__"):
+    main()
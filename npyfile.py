@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Minimal streaming writer and reader for NumPy .npy files.
+
+Only one dimensional arrays of numbers are supported. Writing doesn't need
+NumPy, so the tools can produce columnar output on hosts without it, the
+files can then be loaded (and memory mapped) with numpy.load.
+
+"""
+
+import array
+import ast
+import struct
+import sys
+
+NPY_MAGIC = b"\x93NUMPY"
+NPY_VERSION = b"\x01\x00"
+# Space reserved for the header, so the final shape can be patched in without
+# moving the data. Needs to be a multiple of 64 for NumPy to align the data
+NPY_HEADER_SIZE = 128
+
+# Number of elements buffered in memory before flushing to disk
+NPY_BUFFER_ELEMENTS = 64 * 1024
+
+def int64_typecode():
+    """
+    :return: array typecode for 64-bit signed integers, Python 2 doesn't have
+             "q" and "l" is 32-bit on Windows, fall back to doubles, which are
+             exact up to 2**53
+    """
+    try:
+        array.array("q")
+        return "q"
+    except ValueError:
+        pass
+    if (array.array("l").itemsize == 8):
+        return "l"
+    return "d"
+
+def typecode_to_descr(typecode):
+    """
+    :param typecode: array module typecode
+    :return: NumPy descr string for the typecode, eg "<i4"
+    """
+    itemsize = array.array(typecode).itemsize
+    if (typecode in "fd"):
+        kind = "f"
+    elif (typecode in "BHILQ"):
+        kind = "u"
+    else:
+        kind = "i"
+    if (itemsize == 1):
+        return "|%s1" % kind
+    return "<%s%d" % (kind, itemsize)
+
+def descr_to_typecode(descr):
+    """
+    :param descr: NumPy descr string, eg "<i4"
+    :return: array module typecode with the same kind and size
+    """
+    kind = descr[1]
+    itemsize = int(descr[2:])
+    candidates = "fd" if (kind == "f") else ("BHILQ" if (kind == "u") else "bhilq")
+    for typecode in candidates:
+        try:
+            if (array.array(typecode).itemsize == itemsize):
+                return typecode
+        except ValueError:
+            # Typecode not supported in this Python version
+            pass
+    raise ValueError("Unsupported descr %s" % repr(descr))
+
+def build_npy_header(descr, length):
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, length)
+    # magic, version, header length, header and padding up to NPY_HEADER_SIZE,
+    # the padding must be spaces and end in a newline
+    padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - len(NPY_VERSION) - 2 - len(header)
+    assert padding > 0, "Header too big %s" % repr(header)
+    header = header + " " * (padding - 1) + "\n"
+    return NPY_MAGIC + NPY_VERSION + struct.pack("<H", len(header)) + header.encode("ascii")
+
+class NpyWriter(object):
+    """
+    Writes a one dimensional .npy file incrementally, with bounded memory.
+
+    The header is written with a placeholder shape and patched on close.
+    """
+    def __init__(self, filepath, typecode):
+        self.filepath = filepath
+        self.typecode = typecode
+        self.descr = typecode_to_descr(typecode)
+        self.length = 0
+        self.buffer = array.array(typecode)
+        self.f = open(filepath, "wb")
+        self.f.write(build_npy_header(self.descr, 0))
+
+    def append(self, value):
+        self.buffer.append(value)
+        if (len(self.buffer) >= NPY_BUFFER_ELEMENTS):
+            self.flush()
+
+    def extend(self, values):
+        self.buffer.extend(values)
+        if (len(self.buffer) >= NPY_BUFFER_ELEMENTS):
+            self.flush()
+
+    def flush(self):
+        if (sys.byteorder != "little"):
+            self.buffer.byteswap()
+        self.buffer.tofile(self.f)
+        self.length += len(self.buffer)
+        self.buffer = array.array(self.typecode)
+
+    def close(self):
+        self.flush()
+        self.f.seek(0)
+        self.f.write(build_npy_header(self.descr, self.length))
+        self.f.close()
+
+def read_npy_header(f):
+    """
+    :param f: file object positioned at the start of a .npy file
+    :return: (descr, length), f is left at the start of the data
+    """
+    magic = f.read(len(NPY_MAGIC))
+    assert magic == NPY_MAGIC, "Not a npy file, found magic %s" % repr(magic)
+    version = f.read(2)
+    if (version[0:1] == b"\x01"):
+        header_len = struct.unpack("<H", f.read(2))[0]
+    else:
+        header_len = struct.unpack("<I", f.read(4))[0]
+    header = ast.literal_eval(f.read(header_len).decode("latin1"))
+    assert not header["fortran_order"]
+    assert len(header["shape"]) == 1, "Only one dimensional arrays are supported, found shape %s" % repr(header["shape"])
+
+    return header["descr"], header["shape"][0]
+
+def load_npy(filepath, mmap = True):
+    """
+    Load a one dimensional .npy file
+
+    :param filepath: file to load
+    :param mmap: memory map the file if NumPy is available
+    :return: numpy array if NumPy is available, otherwise an array.array
+    """
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if (numpy is not None):
+        return numpy.load(filepath, mmap_mode = "r" if mmap else None)
+
+    with open(filepath, "rb") as f:
+        descr, length = read_npy_header(f)
+        values = array.array(descr_to_typecode(descr))
+        if (length > 0):
+            values.fromfile(f, length)
+    if ((sys.byteorder != "little") and (values.itemsize > 1)):
+        values.byteswap()
+
+    return values
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python
 """
 Systrace parser.
 
@@ -6,48 +6,166 @@ Enhances a systrace and optionally builds an html
 
 """
 
-import __builtin__
+import argparse
+import array
+import collections
 import gzip
+import hashlib
+import io
+import json
 import logging
 import os
+import pickle
 import re
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 
-logger = logging.getLogger(__name__)
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
-def xopen(filepath, mode):
-    if (filepath.endswith(".gz")):
-        # Always open gzip files in binary mode
-        # XXX This doesn't support writing at the moment
-        assert mode in ["r", "rb" ]
-        return gzip.open(filepath, "rb")
-    else:
-        return open(filepath, mode)
+from npyfile import NpyWriter, NPY_BUFFER_ELEMENTS, descr_to_typecode, int64_typecode, load_npy, read_npy_header
+from schedstats import write_freqstats, write_schedstats
 
-def sum(l):
-    """
-    Override built-in sum to make sure this is never called with a dict instead
-    of a list
-    :param l:
-    :return:
-    """
-    assert isinstance(l, list)
-    return __builtin__.sum(l)
+logger = logging.getLogger(__name__)
 
-def wsum(l, w):
+PY3 = (sys.version_info[0] >= 3)
+# Traces are read and written as latin-1 in Python 3, so any byte round-trips
+# unchanged and offsets and widths match Python 2 byte strings
+TRACE_ENCODING = "latin-1"
+
+# Extension of the output files for each supported compression
+COMPRESSION_EXTENSIONS = { "gz" : ".gz", "zst" : ".zst" }
+# gzip's default, the maximum level is several times slower for little gain
+GZIP_COMPRESSION_LEVEL = 6
+# Compress in a background thread so compression overlaps with parsing
+BACKGROUND_COMPRESSION = True
+# Size of the blocks handed to the compression thread, and the number of blocks
+# that can be queued before the writer blocks
+BACKGROUND_WRITER_BLOCK_SIZE_IN_BYTES = 256 * 1024
+BACKGROUND_WRITER_QUEUE_SIZE = 16
+
+class BackgroundWriter(object):
     """
-    Weighted sum
+    Write-only file object that hands the data to a thread writing to another
+    file object, eg a compressor. zlib and zstd release the GIL, so the
+    compression runs in parallel with the caller.
 
-    :param l: list of numbers
-    :param w: list of weights, with as many weights as numbers in l
-    :return: l[i] * w[i] for all elements in l
+    Errors in the thread are raised on the next write or on close
     """
-    assert len(l) == len(w)
+    def __init__(self, f, encoding = None):
+        """
+        :param f: binary file object to write to, closed on close
+        :param encoding: encoding for text writes, None to write bytes
+        """
+        self.f = f
+        self.encoding = encoding
+        self.blocks = []
+        self.blocks_size = 0
+        self.queue = queue.Queue(BACKGROUND_WRITER_QUEUE_SIZE)
+        self.error = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while (True):
+            block = self.queue.get()
+            if (block is None):
+                break
+            # Keep consuming after an error so the writer never blocks
+            if (self.error is None):
+                try:
+                    self.f.write(block)
+                except Exception as e:
+                    self.error = e
+
+    def checkError(self):
+        if (self.error is not None):
+            raise self.error
+
+    def write(self, s):
+        if ((self.encoding is not None) and (not isinstance(s, bytes))):
+            s = s.encode(self.encoding)
+        self.blocks.append(s)
+        self.blocks_size += len(s)
+        if (self.blocks_size >= BACKGROUND_WRITER_BLOCK_SIZE_IN_BYTES):
+            self.flush()
+
+    def flush(self):
+        """
+        Hand the buffered data to the thread, note this doesn't wait for the
+        data to be written
+        """
+        self.checkError()
+        if (len(self.blocks) > 0):
+            self.queue.put(b"".join(self.blocks))
+            self.blocks = []
+            self.blocks_size = 0
 
-    return sum([w[i] * l[i] for i in xrange(len(l))])
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.f.close()
+        self.checkError()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def is_compressed(filepath):
+    return filepath.endswith(tuple(COMPRESSION_EXTENSIONS.values()))
+
+def open_zstd(filepath, mode):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is needed for %s, install it with pip install zstandard" % repr(filepath))
+
+    if ("r" in mode):
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filepath, "rb"), closefd=True))
+    else:
+        return zstandard.ZstdCompressor().stream_writer(open(filepath, "wb"), closefd=True)
 
+def xopen(filepath, mode):
+    if (is_compressed(filepath)):
+        # Compressed files are always opened in binary mode, and text is
+        # decoded and encoded on top in Python 3
+        assert mode in ["r", "rb", "w", "wb" ]
+        if (filepath.endswith(".gz")):
+            f = gzip.open(filepath, mode[0] + "b", GZIP_COMPRESSION_LEVEL)
+        else:
+            f = open_zstd(filepath, mode)
+        encoding = TRACE_ENCODING if (PY3 and ("b" not in mode)) else None
+        if ("w" in mode):
+            if (BACKGROUND_COMPRESSION):
+                return BackgroundWriter(f, encoding)
+            elif (encoding is not None):
+                return io.TextIOWrapper(f, encoding=encoding, newline="\n")
+        elif (encoding is not None):
+            return io.TextIOWrapper(f, encoding=encoding, newline="\n")
+        return f
+    elif (PY3 and ("b" not in mode)):
+        # Don't translate line endings, like Python 2 does on Linux
+        return open(filepath, mode, encoding=TRACE_ENCODING, newline="\n")
+    else:
+        return open(filepath, mode)
 
+def to_trace_bytes(s):
+    """
+    :return: s encoded for writing to a binary trace file, str is already
+             bytes in Python 2
+    """
+    return s if isinstance(s, bytes) else s.encode(TRACE_ENCODING)
 
 class Struct(dict):
     """!
@@ -60,6 +178,9 @@ class Struct(dict):
         super(Struct, self).__init__(**kwargs)
         self.__dict__ = self
 
+# Name systrace gives a task when the comm isn't in the kernel's cache
+UNKNOWN_COMM = "<...>"
+
 class Task(object):
     def __init__(self, comm, pid, tgid = None, tgid_name = None):
         self.pid = pid
@@ -131,6 +252,47 @@ class SoC(object):
     def __init__(self):
         self.cpus = {}
         self.tasks = {}
+        # Index of self.tasks by pid, pointing to the latest task inserted with
+        # that pid (pids can be recycled, or the task can change name), see
+        # addTask
+        self.tasks_by_pid = {}
+        # Tasks currently running on some cpu, (cpu_id, task) indexed by pid
+        self.running_tasks = {}
+
+    def addTask(self, task):
+        self.tasks[task.id()] = task
+        # "<...>" placeholders, eg from the initial fake sched_switch, don't know
+        # the name, never let them hide the named task of the same pid
+        indexed_task = self.tasks_by_pid.get(task.pid)
+        if ((task.comm != UNKNOWN_COMM) or (indexed_task is None) or (indexed_task.comm == UNKNOWN_COMM)):
+            self.tasks_by_pid[task.pid] = task
+
+    def removeTask(self, task):
+        del self.tasks[task.id()]
+        if (self.tasks_by_pid.get(task.pid) is task):
+            del self.tasks_by_pid[task.pid]
+
+    def renameTask(self, task, comm):
+        self.removeTask(task)
+        task.comm = comm
+        self.addTask(task)
+
+    def getTaskByPid(self, pid):
+        """
+        :return: Latest task seen with the given pid, None if no task with that
+                 pid has been seen
+        """
+        return self.tasks_by_pid.get(pid)
+
+    def getRunningTask(self, pid):
+        """
+        :return: Task with the given pid currently running on some cpu, None if
+                 no cpu is running a task with that pid
+        """
+        try:
+            return self.running_tasks[pid][1]
+        except KeyError:
+            return None
 
     def changeFrequency(self, timestamp, cpu_id, frequency):
         try:
@@ -161,21 +323,21 @@ class SoC(object):
             prev_task = self.tasks[prev_task.id()]
             if (prev_task.tgid_name is None):
                 # Update the parent process name
-                # XXX Do a lookup instead of a linear search
                 prev_tgid_name = None
-                for task in self.tasks.values():
-                    if (task.pid == prev_tgid):
-                        prev_tgid_name = task.comm
+                tgid_task = self.getTaskByPid(prev_tgid)
+                # A "<...>" parent isn't resolved yet, look it up again later
+                if ((tgid_task is not None) and (tgid_task.comm != UNKNOWN_COMM)):
+                    prev_tgid_name = tgid_task.comm
                 prev_task.setTgid(prev_tgid, prev_tgid_name)
 
         except KeyError:
-            self.tasks[prev_task.id()] = prev_task
+            self.addTask(prev_task)
 
         try:
             next_task = Task(next_comm, next_pid)
             next_task = self.tasks[next_task.id()]
         except KeyError:
-            self.tasks[next_task.id()] = next_task
+            self.addTask(next_task)
 
         try:
             cpu = self.cpus[cpu_id]
@@ -201,10 +363,8 @@ class SoC(object):
         if ((cpu.current_task is not None) and (cpu.current_task != prev_task)):
             assert cpu.current_task.pid == prev_task.pid, "Task %s was renamed to %s, but the PID %d vs. %d mismatches" % (cpu.current_task.comm, prev_task.comm, cpu.curren_task.pid, prev_task.pid)
             assert None is logger.debug("Task %s changed name to %s" % (cpu.current_task.id(), prev_task.id()))
-            del self.tasks[cpu.current_task.id()]
-            cpu.current_task.comm = prev_task.comm
+            self.renameTask(cpu.current_task, prev_task.comm)
             prev_task = cpu.current_task
-            self.tasks[prev_task.id()] = prev_task
 
         # Finish accounting to prev task
         seconds = timestamp - cpu.last_timestamp
@@ -212,6 +372,12 @@ class SoC(object):
         cpu.addSeconds(seconds)
 
         # This task is now in this cpu
+        # Note the idle tasks in all the cpus share pid 0, only remove prev_pid
+        # from the running tasks if it was running on this cpu
+        running = self.running_tasks.get(prev_task.pid)
+        if ((running is not None) and (running[0] == cpu_id)):
+            del self.running_tasks[prev_task.pid]
+        self.running_tasks[next_task.pid] = (cpu_id, next_task)
         cpu.current_task = next_task
         cpu.last_timestamp = timestamp
 
@@ -311,51 +477,807 @@ def build_systrace_line(task, pid, tgid, cpu, flags, timestamp, function, rest):
             rest
         )
 
-def wrap_trace_in_html(src_filepath, dst_filepath):
-    SYSTRACE_PY_DIR = os.path.dirname(os.path.realpath(__file__))
+class EventDecoder(object):
+    """
+    Decodes a tracepoint and emits any additional lines into the enhanced trace.
+
+    Decoders are looked up by function name in EVENT_DECODERS, new tracepoints
+    are supported by subclassing and calling register_event_decoder, with no
+    changes to the main loop.
 
-    #
-    # This is lifted from sdk\platform-tools\systrace\catapult\systrace\systrace\output_generator.py
-    #
+    The base class ignores the event.
+    """
+    # Pattern for the arguments of the tracepoint (the rest of the line after
+    # the function name), None if the arguments are not needed
+    pattern = None
+    # Sample arguments the pattern is self-checked against on registration
+    examples = []
+    # Groups of the pattern that are integers, these are stored in the
+    # columnar event dump
+    fields = ()
+
+    def __init__(self):
+        self.regexp = re.compile(self.pattern) if (self.pattern is not None) else None
 
-    SYSTRACE_PY_PREFIX_HTML = os.path.join(SYSTRACE_PY_DIR, "prefix.html")
-    SYSTRACE_PY_SUFFIX_HTML = os.path.join(SYSTRACE_PY_DIR, "suffix.html")
-    SYSTRACE_PY_INFIX_HTML = os.path.join(SYSTRACE_PY_DIR, "systrace_trace_viewer.html")
+    def decode(self, rest):
+        """
+        :param rest: arguments of the tracepoint
+        :return: match object for the arguments, None if they don't match
+        """
+        return self.regexp.match(rest)
+
+    def handle(self, soc, f_out, m, task, pid, tgid, cpu, flags, timestamp, function, rest):
+        """
+        Called once per event of this tracepoint, in trace order
+
+        :param soc: SoC to update with the event
+        :param f_out: enhanced trace file, to write additional lines
+        :param m: decoded arguments as returned by decode, None if the decoder
+                  has no pattern
+        """
+        pass
+
+class CounterEventDecoder(EventDecoder):
+    """
+    Decoder that renders tracepoint arguments as Android counters
+    """
+    counter_pid = 8887
 
+    def counters(self, m, function):
+        """
+        :param m: match object of the tracepoint arguments
+        :return: iterable of (counter name, integer value)
+        """
+        return []
+
+    def handle(self, soc, f_out, m, task, pid, tgid, cpu, flags, timestamp, function, rest):
+        for name, value in self.counters(m, function):
+            rr = build_android_counter(self.counter_pid, name, value)
+            ll = build_systrace_line(task, pid, tgid, cpu, flags, timestamp,
+                                     "tracing_mark_write", rr)
+            f_out.write("%s\n" % ll)
+
+class CpuFrequencyDecoder(EventDecoder):
+    # cpu_frequency: state=2150400 cpu_id=2
+    pattern = SYSTRACE_FREQUENCY_PATTERN
+    examples = [ "state=2150400 cpu_id=2" ]
+    fields = ("frequency", "cpu_id")
+
+    def handle(self, soc, f_out, m, task, pid, tgid, cpu, flags, timestamp, function, rest):
+        frequency = int(m.group("frequency"))
+        cpu_id = int(m.group("cpu_id"))
+        soc.changeFrequency(timestamp, cpu_id, frequency)
+
+class SchedSwitchDecoder(EventDecoder):
+    # sched_switch: prev_comm=cfinteractive prev_pid=313 prev_prio=0 prev_state=D ==> next_comm=swapper/1 next_pid=0 next_prio=120
+    pattern = SYSTRACE_SCHED_SWITCH_PATTERN
+    examples = [ "prev_comm=cfinteractive prev_pid=313 prev_prio=0 prev_state=D ==> next_comm=swapper/1 next_pid=0 next_prio=120" ]
+    fields = ("prev_pid", "prev_prio", "next_pid", "next_prio")
+
+    def handle(self, soc, f_out, m, task, pid, tgid, cpu, flags, timestamp, function, rest):
+        prev_pid = int(m.group("prev_pid"))
+        prev_comm = m.group("prev_comm")
+        next_pid = int(m.group("next_pid"))
+        next_comm = m.group("next_comm")
+        soc.contextSwitch(timestamp, cpu, prev_comm, prev_pid, tgid, next_comm, next_pid)
+
+class NetDeviceDecoder(CounterEventDecoder):
+    # net_dev_xmit: dev=wlan0 skbaddr=ffffffc041327200 len=66 rc=0
+    # netif_receive_skb: dev=wlan0 skbaddr=ffffffc028d95900 len=1470
+    pattern = r"dev=(?P<dev>\S+) skbaddr=\S+ len=(?P<len_bytes>\d+).*"
+    examples = [ "dev=wlan0 skbaddr=ffffffc041327200 len=66 rc=0",
+                 "dev=wlan0 skbaddr=ffffffc028d95900 len=1470" ]
+    fields = ("len_bytes", )
+    counter_pid = 8888
+
+    def counters(self, m, function):
+        len_bytes = int(m.group("len_bytes"))
+        rx_tx = "tx" if (function == "net_dev_xmit") else "rx"
+        name = "%s %s" % (m.group("dev"), rx_tx)
+
+        # The event is found when the buffer has been received or sent, but
+        # there's no information on when the first bytes started, so it doesn't
+        # make sense to render as a block with non zero length.
+        # Drop the counter to zero so this appears as zero-length block in the
+        # trace.
+        yield (name, len_bytes)
+        yield (name, 0)
+
+class KgslPwrstatsDecoder(CounterEventDecoder):
+    # kgsl_pwrstats: d_name=kgsl-3d0 total=12427 busy=8139 ram_time=1159316 ram_wait=301723
+    pattern = r"d_name=kgsl-3d0 total=(?P<total>\d+) busy=(?P<busy>\d+) ram_time=(?P<ram_time>\d+) ram_wait=(?P<ram_wait>\d+)"
+    examples = [ "d_name=kgsl-3d0 total=12427 busy=8139 ram_time=1159316 ram_wait=301723" ]
+    fields = ("total", "busy", "ram_time", "ram_wait")
+
+    def counters(self, m, function):
+        busy_pct = float(m.group("busy")) / float(m.group("total"))
+        yield ("kgsl_pwrstats_busy", int(busy_pct * 100.0))
+        ramwait_pct = float(m.group("ram_wait")) / float(m.group("ram_time"))
+        yield ("kgsl_pwrstats_ramwait", int(ramwait_pct * 100.0))
+
+class KgslClkDecoder(CounterEventDecoder):
+    # kgsl_clk: d_name=kgsl-3d0 flag=on active_freq=257000000
+    pattern = r"d_name=kgsl-3d0 flag=(?P<flag>\S+) active_freq=(?P<active_freq>\d+)"
+    examples = [ "d_name=kgsl-3d0 flag=on active_freq=257000000" ]
+    fields = ("active_freq", )
+
+    def counters(self, m, function):
+        yield ("kgsl_clk", int(m.group("active_freq")))
+
+class KgslGpubusyDecoder(CounterEventDecoder):
+    # kgsl_gpubusy: d_name=kgsl-3d0 busy=1032838 elapsed=1032834
+    pattern = r"d_name=kgsl-3d0 busy=(?P<busy>\d+) elapsed=(?P<elapsed>\d+)"
+    examples = [ "d_name=kgsl-3d0 busy=1032838 elapsed=1032834" ]
+    fields = ("busy", "elapsed")
+
+    def counters(self, m, function):
+        busy_pct = float(m.group("busy")) / float(m.group("elapsed"))
+        yield ("kgsl_gpubusy", int(busy_pct * 100.0))
+
+class KgslBuslevelDecoder(CounterEventDecoder):
+    # kgsl_buslevel: d_name=kgsl-3d0 pwrlevel=4 bus=6
+    pattern = r"d_name=kgsl-3d0 pwrlevel=(?P<pwrlevel>\d+) bus=(?P<bus>\d+)"
+    examples = [ "d_name=kgsl-3d0 pwrlevel=4 bus=6" ]
+    fields = ("pwrlevel", "bus")
+
+    def counters(self, m, function):
+        yield ("kgsl_buslevel_bus", int(m.group("bus")))
+        yield ("kgsl_buslevel_pwr", int(m.group("pwrlevel")))
+
+class KgslPwrlevelDecoder(CounterEventDecoder):
+    # kgsl_pwrlevel: d_name=kgsl-3d0 pwrlevel=5 freq=214000000 prev_pwrlevel=0 prev_freq=624000000
+    pattern = r"d_name=kgsl-3d0 pwrlevel=(?P<pwrlevel>\d+) freq=(?P<freq>\d+) prev_pwrlevel=(?P<prev_pwrlevel>\d+) prev_freq=(?P<prev_freq>\d+)"
+    examples = [ "d_name=kgsl-3d0 pwrlevel=5 freq=214000000 prev_pwrlevel=0 prev_freq=624000000" ]
+    fields = ("pwrlevel", "freq", "prev_pwrlevel", "prev_freq")
+
+    def counters(self, m, function):
+        yield ("kgsl_pwrlevel_freq", int(m.group("freq")))
+
+# Decoders by tracepoint function name, see register_event_decoder
+EVENT_DECODERS = {}
+
+def register_event_decoder(function, decoder):
+    """
+    Register the decoder for a tracepoint, replacing any previous one
+
+    :param function: tracepoint name as it appears in the trace, eg "sched_switch"
+    :param decoder: EventDecoder instance
+    """
+    # Self-check the pattern against the samples
+    for p in decoder.examples:
+        assert decoder.regexp.match(p) is not None, "Pattern %s fails self check for decoder %s of %s" % (repr(p), decoder.__class__.__name__, function)
+    EVENT_DECODERS[function] = decoder
+
+register_event_decoder("cpu_frequency", CpuFrequencyDecoder())
+register_event_decoder("sched_switch", SchedSwitchDecoder())
+register_event_decoder("sched_wakeup", EventDecoder())
+register_event_decoder("net_dev_xmit", NetDeviceDecoder())
+register_event_decoder("netif_receive_skb", NetDeviceDecoder())
+register_event_decoder("kgsl_pwrstats", KgslPwrstatsDecoder())
+register_event_decoder("kgsl_clk", KgslClkDecoder())
+register_event_decoder("kgsl_gpubusy", KgslGpubusyDecoder())
+register_event_decoder("kgsl_buslevel", KgslBuslevelDecoder())
+register_event_decoder("kgsl_pwrlevel", KgslPwrlevelDecoder())
+# kgsl_register_event: ctx=0 ts=2410408 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28
+register_event_decoder("kgsl_register_event", EventDecoder())
+# kgsl_process_events: work:ffffffc001b200d0, process_one_work+0x28c/0x444
+register_event_decoder("kgsl_process_events", EventDecoder())
+# kgsl_fire_event: ctx=0 ts=2412008 type=retired age=0 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28
+register_event_decoder("kgsl_fire_event", EventDecoder())
+# kgsl_issueibcmds: d_name=kgsl-3d0 ctx=24 ib=0x0 numibs=1 ts=14192 flags=CTX_SWITCH result=0 type=GL
+register_event_decoder("kgsl_issueibcmds", EventDecoder())
+# kgsl_active_count_put: work:ffffffc001b1f738, adreno_dispatcher_work+0xa14/0xac8
+register_event_decoder("kgsl_active_count_put", EventDecoder())
+# kgsl_add_event: ctx:0, ts:2412470, retired:2412470, work:0xffffffc08702f740, adreno_ringbuffer_mmu_disable_clk_on_ts+0x24/0x5c
+register_event_decoder("kgsl_add_event", EventDecoder())
+# kgsl_deep_nap_timer: work:ffffffc001b1f738, call_timer_fn+0x88/0x174
+register_event_decoder("kgsl_deep_nap_timer", EventDecoder())
+# kgsl_timer: work:ffffffc001b1f738, call_timer_fn+0x88/0x174
+register_event_decoder("kgsl_timer", EventDecoder())
+
+# Kinds of lines returned by parse_systrace_line
+LINE_NO_MATCH = 0
+LINE_COMMENT = 1
+LINE_EVENT = 2
+LINE_CORRUPTED = 3
+
+# Size of the shards the trace is split into when parsing in parallel
+PARALLEL_CHUNK_SIZE_IN_BYTES = 8 * 1024 * 1024
+
+def parse_systrace_line(l):
+    """
+    Parse a raw systrace line, this is the part of the processing that doesn't
+    depend on any previous line, so it can be done out of order
+
+    :param l: raw line as read from the trace
+    :return: tuple (kind, stripped line, fields), where fields is None unless
+             kind is LINE_EVENT, in which case is a tuple (task, pid, tgid, cpu,
+             flags, timestamp, function, rest, rebuilt line)
+    """
+    m = SYSTRACE_PATTERN_REGEXP.match(l)
+    l = l.strip()
+
+    if (m is None):
+        return (LINE_NO_MATCH, l, None)
+
+    # Fetching all the groups at once is noticeably faster than one by one
+    comment, task, pid, _, tgid, cpu, flags, timestamp, function, rest = m.groups()
+
+    if (comment is not None):
+        return (LINE_COMMENT, l, None)
+
+    task = task.strip()
+    pid = int(pid)
+    if (tgid is None):
+        # This trace doesn't provide tgids, ignore
+        pass
+    elif (tgid == "-----"):
+        # This process doesn't have a tgid, set to zero
+        tgid = 0
+    else:
+        tgid = int(tgid)
+    cpu = int(cpu)
+    timestamp = float(timestamp)
+
+    # Build the line back, this will be used as is unless the task is later
+    # modified
+    ll = build_systrace_line(task, pid, tgid, cpu, flags, timestamp, function, rest)
+
+    return (LINE_EVENT, l, (task, pid, tgid, cpu, flags, timestamp, function, rest, ll))
+
+def parse_systrace_lines(lines):
+    """
+    :param lines: iterable of raw systrace lines
+    :return: generator of parse_systrace_line tuples, lines that fail to parse
+             are returned as LINE_CORRUPTED
+    """
+    for l in lines:
+        try:
+            yield parse_systrace_line(l)
+        except Exception:
+            yield (LINE_CORRUPTED, l.strip(), None)
+
+def split_systrace_file(filepath, chunk_size, start = 0, file_size = None):
+    """
+    Split a file in shards of roughly chunk_size bytes, aligned to line boundaries
+
+    :param start: byte offset to start at, must be at a line boundary
+    :param file_size: byte offset to stop at, None for the end of the file
+    :return: list of (start, end) byte offsets
+    """
+    chunks = []
+    if (file_size is None):
+        file_size = os.path.getsize(filepath)
+    with open(filepath, "rb") as f:
+        while (start < file_size):
+            f.seek(min(start + chunk_size, file_size))
+            # Move to the beginning of the next line
+            f.readline()
+            end = min(f.tell(), file_size)
+            chunks.append((start, end))
+            start = end
+
+    return chunks
+
+def parse_systrace_chunk(args):
+    """
+    Process pool worker, parses the lines in a shard of the trace
+
+    :param args: tuple (filepath, start, end) as returned by split_systrace_file
+    :return: list of parse_systrace_line tuples
+    """
+    filepath, start, end = args
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        lines = io.BytesIO(f.read(end - start))
+    if (PY3):
+        lines = io.TextIOWrapper(lines, encoding=TRACE_ENCODING, newline="\n")
+
+    return list(parse_systrace_lines(lines))
+
+def parse_systrace_file_parallel(filepath, num_jobs, start = 0, end = None):
+    """
+    Parse the trace in a process pool
+
+    :param filepath: trace to parse, needs to be seekable (ie not gzip)
+    :param num_jobs: number of worker processes
+    :param start: byte offset to start parsing at, at a line boundary
+    :param end: byte offset to stop parsing at, None for the end of the file
+    :return: generator of parse_systrace_line tuples, in the same order as the
+             lines in the file
+    """
+    import multiprocessing
+
+    chunks = [(filepath, start, end) for start, end in
+              split_systrace_file(filepath, PARALLEL_CHUNK_SIZE_IN_BYTES, start, end)]
+
+    pool = multiprocessing.Pool(num_jobs)
+    try:
+        # Keep a bounded number of shards in flight so memory doesn't grow with
+        # the trace size when the consumer is slower than the workers
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.apply_async(parse_systrace_chunk, (chunk,)))
+            if (len(pending) > num_jobs * 2):
+                for record in pending.pop(0).get():
+                    yield record
+
+        while (len(pending) > 0):
+            for record in pending.pop(0).get():
+                yield record
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+def find_last_line_end(filepath, start):
+    """
+    :return: byte offset just past the last newline in the file after start, or
+             start if there's none, so a line still being appended is left out
+    """
+    block_size = 64 * 1024
+    with open(filepath, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        while (end > start):
+            block_start = max(start, end - block_size)
+            f.seek(block_start)
+            block = f.read(end - block_start)
+            i = block.rfind(b"\n")
+            if (i >= 0):
+                return block_start + i + 1
+            end = block_start
+
+    return start
+
+def read_systrace_lines(filepath, start, end):
+    """
+    Generator of the lines in a trace between the byte offsets start and end,
+    which must be at line boundaries
+    """
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        for l in f:
+            if (remaining <= 0):
+                break
+            remaining -= len(l)
+            yield l.decode(TRACE_ENCODING) if PY3 else l
+
+# Checkpoints are only valid for the same format version and interpreter
+CHECKPOINT_VERSION = 2
+# Bytes before the checkpointed offset used to check the trace is the same
+CHECKPOINT_DIGEST_SIZE_IN_BYTES = 4096
+
+def digest_trace(filepath, offset):
+    """
+    :return: digest of the bytes of the trace right before offset
+    """
+    with open(filepath, "rb") as f:
+        start = max(0, offset - CHECKPOINT_DIGEST_SIZE_IN_BYTES)
+        f.seek(start)
+        return hashlib.md5(f.read(offset - start)).hexdigest()
+
+def save_checkpoint(filepath, checkpoint):
+    """
+    Atomically write the checkpoint, a Struct with the parsing state, see main
+    """
+    tmp_filepath = filepath + ".tmp"
+    with open(tmp_filepath, "wb") as f:
+        pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+    if (os.path.exists(filepath)):
+        os.remove(filepath)
+    os.rename(tmp_filepath, filepath)
+
+def load_checkpoint(filepath, src_filepath, dst_filepath):
+    """
+    :return: checkpoint saved with save_checkpoint, None if there's no
+             checkpoint or it doesn't match the source or output traces
+    """
+    if (not os.path.exists(filepath)):
+        return None
+
+    try:
+        with open(filepath, "rb") as f:
+            checkpoint = pickle.load(f)
+    except Exception as e:
+        logger.warning("Ignoring unreadable checkpoint %s: %s" % (repr(filepath), e))
+        return None
+
+    if ((checkpoint.version != CHECKPOINT_VERSION) or (checkpoint.python != sys.version_info[0])):
+        logger.warning("Ignoring checkpoint %s from a different version" % repr(filepath))
+        return None
+
+    # The trace may have been appended to, but not modified
+    if ((os.path.getsize(src_filepath) < checkpoint.src_offset) or
+        (digest_trace(src_filepath, checkpoint.src_offset) != checkpoint.src_digest)):
+        logger.warning("Ignoring checkpoint %s, %s has changed" % (repr(filepath), repr(src_filepath)))
+        return None
+
+    # The output is truncated and appended to, it must still hold what was
+    # written up to the checkpoint
+    if ((not os.path.exists(dst_filepath)) or
+        (os.path.getsize(dst_filepath) < checkpoint.dst_offset) or
+        (digest_trace(dst_filepath, checkpoint.dst_offset) != checkpoint.dst_digest)):
+        logger.warning("Ignoring checkpoint %s, %s has changed" % (repr(filepath), repr(dst_filepath)))
+        return None
+
+    return checkpoint
+
+# Maximum number of decoded integer fields stored per event
+EVENT_STORE_NUM_FIELDS = 4
+
+class EventStore(object):
+    """
+    Columnar dump of the events in a trace, so the trace can be queried later
+    without parsing it again (eg memory-mapped with load_event_store).
+
+    The store is a directory with one .npy file per column:
+    - timestamp: float64 seconds
+    - cpu, pid: int32
+    - tgid: int32, -1 if the trace doesn't have tgids
+    - event: int16 index into the "events" string table
+    - comm: int32 index into the "comms" string table
+    - field0 to field3: int64 decoded integer fields, 0 if not present, the
+      field names for each event are in the "fields" table
+
+    The string tables are in events.json
+    """
+    COLUMNS = [ ("timestamp", "d"), ("cpu", "i"), ("pid", "i"), ("tgid", "i"),
+                ("event", "h"), ("comm", "i") ] + \
+              [ ("field%d" % i, int64_typecode()) for i in range(EVENT_STORE_NUM_FIELDS) ]
+
+    def __init__(self, dirpath):
+        if (not os.path.exists(dirpath)):
+            os.makedirs(dirpath)
+        self.dirpath = dirpath
+        self.columns = [ NpyWriter(os.path.join(dirpath, "%s.npy" % name), typecode)
+                         for name, typecode in self.COLUMNS ]
+        self.num_events = 0
+
+        # String tables
+        self.event_ids = {}
+        self.events = []
+        self.fields = []
+        self.comm_ids = {}
+        self.comms = []
+        # "<...>" comms get a placeholder entry per pid, so they can be resolved
+        # when the store is closed
+        self.unknown_comm_ids = {}
+
+    def internEvent(self, function, decoder):
+        try:
+            return self.event_ids[function]
+        except KeyError:
+            event_id = len(self.events)
+            self.event_ids[function] = event_id
+            self.events.append(function)
+            self.fields.append(list(decoder.fields) if (decoder is not None) else [])
+            return event_id
+
+    def internComm(self, comm, pid):
+        if (comm == UNKNOWN_COMM):
+            try:
+                return self.unknown_comm_ids[pid]
+            except KeyError:
+                comm_id = len(self.comms)
+                self.comms.append(comm)
+                self.unknown_comm_ids[pid] = comm_id
+                return comm_id
+
+        try:
+            return self.comm_ids[comm]
+        except KeyError:
+            comm_id = len(self.comms)
+            self.comm_ids[comm] = comm_id
+            self.comms.append(comm)
+            return comm_id
+
+    def add(self, timestamp, cpu, pid, tgid, comm, function, decoder, m):
+        """
+        :param decoder: EventDecoder for this function, None if there is none
+        :param m: arguments as returned by decoder.decode, None if not decoded
+        """
+        values = [ timestamp, cpu, pid, tgid if (tgid is not None) else -1,
+                   self.internEvent(function, decoder), self.internComm(comm, pid) ]
+        if (m is not None):
+            fields = [ int(m.group(field)) for field in decoder.fields ]
+            values.extend(fields)
+            values.extend([0] * (EVENT_STORE_NUM_FIELDS - len(fields)))
+        else:
+            values.extend([0] * EVENT_STORE_NUM_FIELDS)
+
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        self.num_events += 1
+
+    def close(self, task_names = None):
+        """
+        :param task_names: dict of task names indexed by pid, used to resolve
+                           the "<...>" comms
+        """
+        for column in self.columns:
+            column.close()
+
+        # Point the resolved "<...>" placeholders to the real comm
+        comm_remap = {}
+        for pid, comm_id in sorted(self.unknown_comm_ids.items()):
+            if ((task_names is not None) and (pid in task_names)):
+                comm_remap[comm_id] = self.internComm(task_names[pid], pid)
+        if (len(comm_remap) > 0):
+            self.remapColumn("comm", comm_remap)
+
+        with open(os.path.join(self.dirpath, "events.json"), "w") as f:
+            json.dump({ "num_events" : self.num_events,
+                        "events" : self.events,
+                        "fields" : self.fields,
+                        "comms" : self.comms }, f, indent = 1)
+
+    def remapColumn(self, name, remap):
+        """
+        Replace values of a closed column in place, in chunks
+
+        :param remap: dict with the new values indexed by old value
+        """
+        filepath = os.path.join(self.dirpath, "%s.npy" % name)
+        with open(filepath, "r+b") as f:
+            descr, length = read_npy_header(f)
+            typecode = descr_to_typecode(descr)
+            offset = f.tell()
+            while (length > 0):
+                values = array.array(typecode)
+                f.seek(offset)
+                values.fromfile(f, min(length, NPY_BUFFER_ELEMENTS))
+                if (sys.byteorder != "little"):
+                    values.byteswap()
+                values = array.array(typecode, [remap.get(v, v) for v in values])
+                if (sys.byteorder != "little"):
+                    values.byteswap()
+                f.seek(offset)
+                values.tofile(f)
+                offset += len(values) * values.itemsize
+                length -= len(values)
+
+def load_event_store(dirpath):
+    """
+    Load an event store written with EventStore
+
+    :return: Struct with the memory-mapped columns as arrays (numpy arrays if
+             NumPy is available) and the string tables
+    """
+    with open(os.path.join(dirpath, "events.json"), "r") as f:
+        store = Struct(**json.load(f))
+    for name, typecode in EventStore.COLUMNS:
+        store[name] = load_npy(os.path.join(dirpath, "%s.npy" % name))
+
+    return store
+
+def backfill_task_names(filepath, task_names, start = 0):
+    """
+    Replace "<...>" task names in an enhanced trace in place
+
+    Lines are written with the task name right-aligned to 16 characters and
+    kernel comm names are at most 15, so the names can be replaced without
+    moving the rest of the file.
+
+    Compressed traces cannot be modified in place, those are rewritten.
+
+    :param filepath: enhanced trace as written by main
+    :param task_names: dict of task names to use, indexed by pid
+    :param start: byte offset of the first line to look at, ignored for
+                  compressed traces
+    """
+    if (len(task_names) == 0):
+        return
+
+    unknown_task = to_trace_bytes("%16s-" % UNKNOWN_COMM)
+    num_lines = 0
+    if (is_compressed(filepath)):
+        root, ext = os.path.splitext(filepath)
+        tmp_filepath = root + ".tmp" + ext
+        with xopen(filepath, "rb") as f_in:
+            with xopen(tmp_filepath, "wb") as f_out:
+                for l in f_in:
+                    if (l.startswith(unknown_task)):
+                        pid = int(l[len(unknown_task):].split(b" ", 1)[0])
+                        task = task_names.get(pid)
+                        if ((task is not None) and (len(task) <= 16)):
+                            l = to_trace_bytes("%16s" % task) + l[16:]
+                            num_lines += 1
+                    f_out.write(l)
+        os.remove(filepath)
+        os.rename(tmp_filepath, filepath)
+
+    else:
+        with open(filepath, "rb") as f_in:
+            with open(filepath, "r+b") as f_out:
+                f_in.seek(start)
+                offset = start
+                for l in f_in:
+                    if (l.startswith(unknown_task)):
+                        pid = int(l[len(unknown_task):].split(b" ", 1)[0])
+                        task = task_names.get(pid)
+                        if ((task is not None) and (len(task) <= 16)):
+                            f_out.seek(offset)
+                            f_out.write(to_trace_bytes("%16s" % task))
+                            num_lines += 1
+                    offset += len(l)
+
+    logger.info("Translated %d <...> lines on the second pass" % num_lines)
+
+# Size of the chunks used when copying files
+COPY_BUFFER_SIZE_IN_BYTES = 1024 * 1024
+
+SYSTRACE_PY_DIR = os.path.dirname(os.path.realpath(__file__))
+
+#
+# This is lifted from sdk\platform-tools\systrace\catapult\systrace\systrace\output_generator.py
+#
+
+SYSTRACE_PY_PREFIX_HTML = os.path.join(SYSTRACE_PY_DIR, "prefix.html")
+SYSTRACE_PY_SUFFIX_HTML = os.path.join(SYSTRACE_PY_DIR, "suffix.html")
+SYSTRACE_PY_INFIX_HTML = os.path.join(SYSTRACE_PY_DIR, "systrace_trace_viewer.html")
+# The prefix with the trace viewer spliced in, see get_html_prefix_filepath
+SYSTRACE_PY_PREFIX_CACHE_HTML = "psytrace_prefix_cache.html"
+
+def build_html_prefix(filepath):
+    """
+    Write the prefix with {{SYSTRACE_TRACE_VIEWER_HTML}} replaced with the
+    trace viewer to filepath, without loading the viewer in memory
+    """
+    with open(SYSTRACE_PY_PREFIX_HTML, "rb") as f:
+        prefix = f.read()
+    prefix_parts = prefix.split(b"{{SYSTRACE_TRACE_VIEWER_HTML}}")
+
+    with open(filepath, "wb") as out:
+        for i, prefix_part in enumerate(prefix_parts):
+            if (i > 0):
+                with open(SYSTRACE_PY_INFIX_HTML, "rb") as f:
+                    shutil.copyfileobj(f, out, COPY_BUFFER_SIZE_IN_BYTES)
+            out.write(prefix_part)
+
+def get_html_prefix_filepath():
+    """
+    :return: filepath of the prefix with the trace viewer spliced in, cached
+             next to this script (or in the temp directory if that's not
+             writable) and rebuilt when the prefix or the viewer change
+    """
+    source_mtime = max(os.path.getmtime(SYSTRACE_PY_PREFIX_HTML),
+                       os.path.getmtime(SYSTRACE_PY_INFIX_HTML))
+    for dirpath in [ SYSTRACE_PY_DIR, tempfile.gettempdir() ]:
+        filepath = os.path.join(dirpath, SYSTRACE_PY_PREFIX_CACHE_HTML)
+        if (os.path.exists(filepath) and (os.path.getmtime(filepath) >= source_mtime)):
+            return filepath
+
+        # Build in a temporary file and rename, in case other psytrace
+        # processes are using the cache
+        try:
+            fd, tmp_filepath = tempfile.mkstemp(dir=dirpath, prefix=SYSTRACE_PY_PREFIX_CACHE_HTML)
+        except (IOError, OSError):
+            logger.debug("Unable to cache the html prefix in %s" % repr(dirpath))
+            continue
+        os.close(fd)
+        try:
+            build_html_prefix(tmp_filepath)
+            # mkstemp creates the file only readable by this user
+            os.chmod(tmp_filepath, 0o644)
+            if (os.path.exists(filepath)):
+                os.remove(filepath)
+            os.rename(tmp_filepath, filepath)
+        except (IOError, OSError):
+            # Another process may have won the race to create it
+            if (os.path.exists(tmp_filepath)):
+                os.remove(tmp_filepath)
+            if (not os.path.exists(filepath)):
+                raise
+        return filepath
+
+    raise IOError("Unable to cache the html prefix")
+
+def wrap_trace_in_html(src_filepath, dst_filepath):
+    """
+    Build the html for a trace, the files are streamed so memory use doesn't
+    depend on the trace size
+
+    :param src_filepath: trace to wrap, optionally gzipped
+    :param dst_filepath: html to write
+    """
     # Load the prefix, replace {{SYSTRACE_TRACE_VIEWER_HTML}} with the HTML
     # Insert the trace
     # add the suffix
-    infix = open(SYSTRACE_PY_INFIX_HTML, 'rb').read()
-    prefix = open(SYSTRACE_PY_PREFIX_HTML, 'rb').read()
-    suffix = open(SYSTRACE_PY_SUFFIX_HTML, 'rb').read()
-
-    trace = xopen(src_filepath, 'rb').read()
-
-    prefix = prefix.replace("{{SYSTRACE_TRACE_VIEWER_HTML}}", infix)
     # Open the file in binary mode to prevent python from changing the
     # line endings, then write the prefix.
     with open(dst_filepath, 'wb') as out:
-        out.write(prefix)
+        with open(get_html_prefix_filepath(), 'rb') as f:
+            shutil.copyfileobj(f, out, COPY_BUFFER_SIZE_IN_BYTES)
         # Write the trace data itself. There is a separate section of the form
         # <script class="trace-data" type="application/text"> ... </script>
         # for each tracing agent (including the controller tracing agent).
-        out.write('<!-- BEGIN TRACE-->\n')
-        out.write('  <script class="trace-data" type="application/text">\n')
-        out.write(trace)
-        out.write('<!-- END TRACE -->\n')
-        out.write(suffix)
-
-def main(src_filepath, dst_filepath, cpu_weights = None):
+        out.write(b'<!-- BEGIN TRACE-->\n')
+        out.write(b'  <script class="trace-data" type="application/text">\n')
+        with xopen(src_filepath, 'rb') as f:
+            shutil.copyfileobj(f, out, COPY_BUFFER_SIZE_IN_BYTES)
+        out.write(b'<!-- END TRACE -->\n')
+        with open(SYSTRACE_PY_SUFFIX_HTML, 'rb') as f:
+            shutil.copyfileobj(f, out, COPY_BUFFER_SIZE_IN_BYTES)
+
+def main(src_filepath, dst_filepath, cpu_weights = None, num_jobs = 1, events_dirpath = None,
+         resume = False, compression = None):
+    """
+    :param events_dirpath: if not None, directory where to write the columnar
+                           event store, see EventStore
+    :param resume: continue from the checkpoint of a previous resume run if
+                   there's one, only processing the bytes appended to the trace
+                   since, and write a checkpoint for the next run
+    :param compression: None or a key of COMPRESSION_EXTENSIONS to compress the
+                        output trace and csvs, the extension is appended to
+                        their filepaths
+    :return: filepath of the output trace
+    """
+    ext = COMPRESSION_EXTENSIONS[compression] if (compression is not None) else ""
+    trace_filepath = dst_filepath + ext
     is_html = ".html" in src_filepath.lower()
     soc = SoC()
     first_timestamp = None
     last_timestamp = 0
     num_lines = 0
-    max_lines = sys.maxint
+    max_lines = sys.maxsize
     corrupted_line = None
+    untranslated_pids = set()
+    event_store = EventStore(events_dirpath) if (events_dirpath is not None) else None
+
+    checkpoint_filepath = dst_filepath + "_checkpoint.pickle"
+    checkpoint = None
+    if (resume and is_compressed(src_filepath)):
+        # XXX Compressed files are not seekable, so they cannot be resumed
+        logger.warning("Compressed traces cannot be resumed, processing the whole trace")
+        resume = False
+    if (resume and (compression is not None)):
+        logger.warning("Compressed output cannot be resumed, processing the whole trace")
+        resume = False
+    if (resume and (event_store is not None)):
+        raise ValueError("The event store cannot be resumed, don't combine events_dirpath and resume")
+    if (resume):
+        checkpoint = load_checkpoint(checkpoint_filepath, src_filepath, trace_filepath)
+    elif (os.path.exists(checkpoint_filepath)):
+        # The output is regenerated, any checkpoint for it is stale
+        os.remove(checkpoint_filepath)
+
+    src_start = 0
+    dst_start = 0
+    if (checkpoint is not None):
+        logger.info("Resuming %s from byte %d" % (repr(src_filepath), checkpoint.src_offset))
+        soc = checkpoint.soc
+        first_timestamp = checkpoint.first_timestamp
+        last_timestamp = checkpoint.last_timestamp
+        num_lines = checkpoint.num_lines
+        corrupted_line = checkpoint.corrupted_line
+        untranslated_pids = checkpoint.untranslated_pids
+        src_start = checkpoint.src_offset
+        dst_start = checkpoint.dst_offset
+        # Remove the lines appended after the checkpoint, they are regenerated
+        with open(trace_filepath, "r+b") as f:
+            f.truncate(dst_start)
+    # Only resumable runs need to stop at a known line boundary
+    src_end = find_last_line_end(src_filepath, src_start) if resume else None
+    # The timestamp of the last line, used to close the last timeslices
+    timestamp = last_timestamp
+    resumed_untranslated_pids = set(untranslated_pids)
+
     with xopen(src_filepath, 'r') as f_in:
-        with open(dst_filepath, 'w') as f_out:
-            for l in f_in:
+        # Parsing the lines doesn't depend on the state, so it can be done in
+        # parallel, but the accounting needs to go through the lines in order
+        # XXX Compressed files are not seekable, those are always parsed serially
+        if ((num_jobs > 1) and (not is_compressed(src_filepath))):
+            logger.info("Parsing with %d jobs" % num_jobs)
+            records = parse_systrace_file_parallel(src_filepath, num_jobs, src_start, src_end)
+        elif (resume):
+            records = parse_systrace_lines(read_systrace_lines(src_filepath, src_start, src_end))
+        else:
+            records = parse_systrace_lines(f_in)
+
+        with xopen(trace_filepath, 'a' if (checkpoint is not None) else 'w') as f_out:
+            for kind, l, fields in records:
                 # Assert if we found corruption before the last line
                 assert corrupted_line is None, "Corrupted line found before the last line %s" % repr(corrupted_line)
                 # Note that the last line can be corrupted, ignore it
@@ -364,36 +1286,21 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
                     if (num_lines > max_lines):
                         break
                     assert None is logger.debug("read: %s" % repr(l))
-                    m = SYSTRACE_PATTERN_REGEXP.match(l)
-                    l = l.strip()
 
                     # If the input file is html and there's no match, ignore
-                    if ((m is None) and is_html):
+                    if ((kind == LINE_NO_MATCH) and is_html):
                         continue
 
-
-                    if (m.group("comment") is not None):
+                    if (kind == LINE_COMMENT):
                         # Comment, ignore
                         pass
 
+                    elif (kind != LINE_EVENT):
+                        raise ValueError("Unable to parse line %s" % repr(l))
+
                     else:
 
-                        task = m.group("task").strip()
-                        pid = int(m.group("pid"))
-                        tgid = m.group("tgid")
-                        if (tgid is None):
-                            # This trace doesn't provide tgids, ignore
-                            pass
-                        elif (tgid == "-----"):
-                            # This process doesn't have a tgid, set to zero
-                            tgid = 0
-                        else:
-                            tgid = int(tgid)
-                        cpu = int(m.group("cpu"))
-                        flags = m.group("flags")
-                        timestamp = float(m.group("timestamp"))
-                        function = m.group("function")
-                        rest = m.group("rest")
+                        task, pid, tgid, cpu, flags, timestamp, function, rest, parsed_l = fields
 
                         assert None is logger.debug("task %s pid %s tgid %s function %s" %
                                                     (task, pid, tgid, function))
@@ -435,26 +1342,29 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
                         # misses you get "<...>" as task name.
                         # Change "<...>" to the right name using the CPU current task
                         # lookup
-                        if (task == "<...>"):
+                        if (task == UNKNOWN_COMM):
                             # Since this task appears in a systrace line, it has to
                             # be current in some cpu, look for this task's name in the
-                            # CPU current tasks
+                            # CPU current tasks, then in the tasks seen so far
                             # XXX The tasks translate this way don't have a TGID, find
                             #     out why and fix if possible?
-                            new_task = None
-                            for this_cpu in soc.cpus.values():
-                                this_cpu_current_task = this_cpu.getCurrentTask()
-                                if ((this_cpu_current_task is not None) and (this_cpu_current_task.pid == pid)):
-                                    new_task = this_cpu_current_task.comm
-
-                            if (new_task is not None):
-                                assert None is logger.debug("Translating %s-%d to %s" % (task, pid, new_task))
-                                task = new_task
+                            # Note the current task can be "<...>" too if it was
+                            # created by the initial fake sched_switch, the name
+                            # may be known from other lines of the same pid
+                            pid_task = soc.getRunningTask(pid)
+                            if ((pid_task is None) or (pid_task.comm == UNKNOWN_COMM)):
+                                pid_task = soc.getTaskByPid(pid)
+
+                            if ((pid_task is not None) and (pid_task.comm != task)):
+                                assert None is logger.debug("Translating %s-%d to %s" % (task, pid, pid_task.comm))
+                                task = pid_task.comm
                             else:
                                 # If this task was already in some CPU when the trace
                                 # started, we may not have seen its name yet and we
-                                # cannot do the translation
-                                logger.warning("Unable to translate task %s-%d" % (task, pid))
+                                # cannot do the translation, retry once the whole
+                                # trace has been seen
+                                logger.debug("Unable to translate task %s-%d, deferring" % (task, pid))
+                                untranslated_pids.add(pid)
 
                         if (first_timestamp is None):
                             first_timestamp = timestamp
@@ -464,166 +1374,25 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
                         assert last_timestamp <= timestamp, "Current timestamp %f is less than previous timestamp %f" % (last_timestamp, timestamp)
                         last_timestamp = timestamp
 
-                        if (function == "cpu_frequency"):
-                            #    cpu_frequency: state=2150400 cpu_id=2
-                            m = re.match("state=(?P<frequency>\d+) cpu_id=(?P<cpu_id>\d+)", rest)
-                            frequency = int(m.group("frequency"))
-                            cpu_id = int(m.group("cpu_id"))
-                            soc.changeFrequency(timestamp, cpu_id, frequency)
-
-                        elif (function == "sched_switch"):
-                            #    sched_switch: prev_comm=cfinteractive prev_pid=313 prev_prio=0 prev_state=D ==> next_comm=swapper/1 next_pid=0 next_prio=120
-                            m = SYSTRACE_SCHED_SWITCH_PATTERN_REGEXP.match(rest);
-                            prev_pid = int(m.group("prev_pid"))
-                            prev_comm = m.group("prev_comm")
-                            next_pid = int(m.group("next_pid"))
-                            next_comm = m.group("next_comm")
-                            soc.contextSwitch(timestamp, cpu, prev_comm, prev_pid, tgid, next_comm, next_pid)
-
-                        elif (function == "sched_wakeup"):
-                            pass
-
-                        # net_dev_xmit: dev=wlan0 skbaddr=ffffffc041327200 len=66 rc=0
-                        # netif_receive_skb: dev=wlan0 skbaddr=ffffffc028d95900 len=1470
-                        elif ((function == "net_dev_xmit") or
-                              (function == "netif_receive_skb")):
-                            m = re.match(r"dev=(?P<dev>\S+) skbaddr=\S+ len=(?P<len_bytes>\d+).*",
-                                         rest)
-                            len_bytes = int(m.group("len_bytes"))
-                            rx_tx = "tx" if (function == "net_dev_xmit") else "rx"
-                            rr = build_android_counter(8888, "%s %s" % (m.group("dev"), rx_tx),
-                                                       len_bytes)
-                            ll = build_systrace_line(task, pid, tgid, cpu,
-                                                     flags,
-                                                     timestamp,
-                                                     "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
-
-                            # The event is found when the buffer has been received
-                            # or sent, but there's no information on when the first
-                            # bytes started, so it doesn't make sense to render
-                            # as a block with non zero length.
-                            # Drop the counter to zero so this appears as
-                            # zero-length block in the trace.
-                            rr = build_android_counter(8888,
-                                                       "%s %s" % (m.group("dev"), rx_tx),
-                                                       0)
-                            ll = build_systrace_line(task, pid, tgid, cpu,
-                                                     flags,
-                                                     timestamp,
-                                                     "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
-
-                        elif (function == "kgsl_register_event"):
-                            # kgsl_register_event: ctx=0 ts=2410408 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28
-                            pass
-
-                        # kgsl_register_event: ctx=0 ts=2410408 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28
-                        elif (function == "kgsl_register_event"):
-                            pass
-
-                        # kgsl_process_events: work:ffffffc001b200d0, process_one_work+0x28c/0x444
-                        elif (function == "kgsl_process_events"):
-                            # kgsl_register_event: ctx=0 ts=2410408 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28
-                            pass
-
-                        # kgsl_pwrstats: d_name=kgsl-3d0 total=12427 busy=8139 ram_time=1159316 ram_wait=301723\n'
-                        elif (function == "kgsl_pwrstats"):
-                            m = re.match(r"d_name=kgsl-3d0 total=(?P<total>\d+) busy=(?P<busy>\d+) ram_time=(?P<ram_time>\d+) ram_wait=(?P<ram_wait>\d+)", rest)
-                            busy_pct = float(m.group("busy")) / float(m.group("total"))
-                            rr = build_android_counter(8887, "kgsl_pwrstats_busy", int(busy_pct * 100.0))
-                            ll =build_systrace_line(task, pid, tgid, cpu, flags, timestamp, "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
-                            ramwait_pct = float(m.group("ram_wait")) / float(m.group("ram_time"))
-                            rr = build_android_counter(8887, "kgsl_pwrstats_ramwait",
-                                                       int(ramwait_pct * 100.0))
-                            ll = build_systrace_line(task, pid, tgid, cpu, flags,
-                                                     timestamp, "tracing_mark_write",
-                                                     rr)
-                            f_out.write("%s\n" % ll)
-
-                        # kgsl_clk: d_name=kgsl-3d0 flag=on active_freq=257000000
-                        elif (function == "kgsl_clk"):
-                            m = re.match(r"d_name=kgsl-3d0 flag=(?P<flag>\S+) active_freq=(?P<active_freq>\d+)", rest)
-                            active_freq = int(m.group("active_freq"))
-                            rr = build_android_counter(8887, "kgsl_clk", active_freq)
-                            ll = build_systrace_line(task, pid, tgid, cpu, flags,
-                                                     timestamp,
-                                                     "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
-
-                        # kgsl_gpubusy: d_name=kgsl-3d0 busy=1032838 elapsed=1032834
-                        elif (function == "kgsl_gpubusy"):
-                            m = re.match(
-                                r"d_name=kgsl-3d0 busy=(?P<busy>\d+) elapsed=(?P<elapsed>\d+)",
-                                rest)
-                            busy_pct = float(m.group("busy")) / float(
-                                m.group("elapsed"))
-                            rr = build_android_counter(8887, "kgsl_gpubusy",
-                                                       int(busy_pct * 100.0))
-                            ll = build_systrace_line(task, pid, tgid, cpu, flags,
-                                                     timestamp,
-                                                     "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
-
-                        # kgsl_fire_event: ctx=0 ts=2412008 type=retired age=0 cb=adreno_ringbuffer_mmu_clk_disable_event+0x0/0x28\n'
-                        elif (function == "kgsl_fire_event"):
-                            pass
-
-                        # kgsl_issueibcmds: d_name=kgsl-3d0 ctx=24 ib=0x0 numibs=1 ts=14192 flags=CTX_SWITCH result=0 type=GL\n'
-                        elif (function == "kgsl_issueibcmds"):
-                            pass
-
-                        # kgsl_active_count_put: work:ffffffc001b1f738, adreno_dispatcher_work+0xa14/0xac8\n'
-                        elif (function == "kgsl_active_count_put"):
-                            pass
-
-                        # kgsl_add_event: ctx:0, ts:2412470, retired:2412470, work:0xffffffc08702f740, adreno_ringbuffer_mmu_disable_clk_on_ts+0x24/0x5c\n'
-                        elif (function == "kgsl_add_event"):
-                            pass
-
-                        # kgsl_deep_nap_timer: work:ffffffc001b1f738, call_timer_fn+0x88/0x174\n'
-                        elif (function == "kgsl_deep_nap_timer"):
-                            pass
-
-                        # kgsl_timer: work:ffffffc001b1f738, call_timer_fn+0x88/0x174'
-                        elif (function == "kgsl_timer"):
-                            pass
-
-                        # kgsl_buslevel: d_name=kgsl-3d0 pwrlevel=4 bus=6\n'
-                        elif (function == "kgsl_buslevel"):
-                            m = re.match(r"d_name=kgsl-3d0 pwrlevel=(?P<pwrlevel>\d+) bus=(?P<bus>\d+)", rest)
-
-                            rr = build_android_counter(8887, "kgsl_buslevel_bus",
-                                                       int(m.group("bus")))
-                            ll = build_systrace_line(task, pid, tgid, cpu, flags, timestamp,
-                                                     "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
-
-                            rr = build_android_counter(8887, "kgsl_buslevel_pwr",
-                                                       int(m.group("pwrlevel")))
-                            ll = build_systrace_line(task, pid, tgid, cpu, flags,
-                                                timestamp, "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
-
-                        # kgsl_pwrlevel: d_name=kgsl-3d0 pwrlevel=5 freq=214000000 prev_pwrlevel=0 prev_freq=624000000
-                        elif (function == "kgsl_pwrlevel"):
-                            m = re.match(r"d_name=kgsl-3d0 pwrlevel=(?P<pwrlevel>\d+) freq=(?P<freq>\d+) prev_pwrlevel=(?P<prev_pwrlevel>\d+) prev_freq=(?P<prev_freq>\d+)",
-                                rest)
-
-                            rr = build_android_counter(8887, "kgsl_pwrlevel_freq",
-                                                       int(m.group("freq")))
-                            ll = build_systrace_line(task, pid, tgid, cpu, flags,
-                                                     timestamp,
-                                                     "tracing_mark_write", rr)
-                            f_out.write("%s\n" % ll)
+                        decoder = EVENT_DECODERS.get(function)
+                        m = None
+                        if (decoder is not None):
+                            if (decoder.regexp is not None):
+                                m = decoder.decode(rest)
+                            decoder.handle(soc, f_out, m, task, pid, tgid, cpu, flags, timestamp, function, rest)
 
                         elif ("kgsl" in function):
 
                             logger.debug("read: %s" % repr(l))
 
+                        if (event_store is not None):
+                            event_store.add(timestamp, cpu, pid, tgid, task, function, decoder, m)
+
                         # Build the line back in case something was modified
-                        l = build_systrace_line(task, pid, tgid, cpu, flags, timestamp, function, rest)
+                        if (task == fields[0]):
+                            l = parsed_l
+                        else:
+                            l = build_systrace_line(task, pid, tgid, cpu, flags, timestamp, function, rest)
 
                     f_out.write("%s\n" % l)
 
@@ -634,6 +1403,11 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
                     corrupted_line = l
 
             logger.info("Total lines %d" % num_lines)
+            if (resume):
+                # The lines below are regenerated by resumed runs
+                f_out.flush()
+                dst_offset = os.fstat(f_out.fileno()).st_size
+
             # Insert sched_switch to the last timeslices so Chrome renders the
             # full bar for all the tasks currently on the CPUs
             # XXX This happens with any other counter like cpu_freq, etc, find a
@@ -641,7 +1415,9 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
             #     (start can be fixed putting "initial state information" in
             #      via trace_markers, end can be fixed by hooking on the last
             #      value and extending it to the last timestamp)
-            for this_cpu in soc.cpus.values():
+            # Go through the cpus in order so the output doesn't depend on the
+            # dict ordering
+            for this_cpu in sorted(soc.cpus.values(), key=lambda cpu: cpu.index):
                 cpu = this_cpu.index
                 this_cpu_current_task = this_cpu.getCurrentTask()
                 # The task can be none if this cpu never had any task on it
@@ -669,16 +1445,51 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
                                          timestamp, "sched_switch", rr)
                 f_out.write("%s\n" % ll)
 
+    # Fill in the names that couldn't be translated on the first pass
+    task_names = {}
+    if (len(untranslated_pids) > 0):
+        for pid in untranslated_pids:
+            pid_task = soc.getTaskByPid(pid)
+            if ((pid_task is not None) and (pid_task.comm != UNKNOWN_COMM)):
+                task_names[pid] = pid_task.comm
+            else:
+                logger.warning("Unable to translate task <...>-%d" % pid)
+        # Only the lines written by this run need to be looked at, unless a
+        # name left untranslated by a previous run has been found
+        if (len(resumed_untranslated_pids.intersection(task_names)) > 0):
+            dst_start = 0
+        backfill_task_names(trace_filepath, task_names, dst_start)
+
+    if (resume):
+        # Save the state before closing the last timeslice
+        save_checkpoint(checkpoint_filepath, Struct(
+            version=CHECKPOINT_VERSION, python=sys.version_info[0],
+            src_offset=src_end, src_digest=digest_trace(src_filepath, src_end),
+            dst_offset=dst_offset, dst_digest=digest_trace(trace_filepath, dst_offset),
+            soc=soc,
+            first_timestamp=first_timestamp, last_timestamp=last_timestamp,
+            num_lines=num_lines, corrupted_line=corrupted_line,
+            untranslated_pids=untranslated_pids.difference(task_names)))
+
+    if (event_store is not None):
+        event_store.close(task_names)
+        logger.info("Wrote %d events to %s" % (event_store.num_events, events_dirpath))
+
     # Account for the last timeslice
     soc.sync(last_timestamp)
 
     # Verify there are no duplicated pids (ignore swapper, the idle thread)
     if __debug__:
-        tasks = soc.tasks.values()
-        for t in tasks:
-            for t2 in tasks:
-                if ((t.pid == t2.pid) and (t.id() != t2.id()) and (t.pid != 0)):
-                    logger.warning("PID %d for task %s matches PID %d for task %s" % (t.pid, t.id(), t2.pid, t2.id()))
+        tasks_with_pid = {}
+        for t in soc.tasks.values():
+            tasks_with_pid.setdefault(t.pid, []).append(t)
+        for pid in tasks_with_pid:
+            tasks = tasks_with_pid[pid]
+            if ((len(tasks) > 1) and (pid != 0)):
+                for t in tasks:
+                    for t2 in tasks:
+                        if (t.id() != t2.id()):
+                            logger.warning("PID %d for task %s matches PID %d for task %s" % (t.pid, t.id(), t2.pid, t2.id()))
 
     # Gather statistics, grouping by comm name
     tasks = soc.tasks.values()
@@ -691,7 +1502,9 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
         num_cpus = max(num_cpus, len(cpu_weights))
     assert len(cpu_weights) >= num_cpus
 
-    grouped_tasks = {}
+    # Keep the groups in comm order so ties in the schedstats sort don't depend
+    # on the dict ordering
+    grouped_tasks = collections.OrderedDict()
     for t in tasks:
 
         comm = t.comm
@@ -700,11 +1513,12 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
             # "swapper/0" for cpu 0, etc
             comm = comm.replace("swapper/", "IDLE CPU")
 
-        # If we couldn't resolve the tgid name for the duration of the trace,
-        # set to the tgid numerical value
+        # If we couldn't resolve the tgid name while tracing, look it up
+        # now that all the tasks are known, or set to the tgid numerical value
         tgid_name = t.tgid_name
         if (tgid_name is None):
-            tgid_name = str(t.tgid)
+            tgid_task = soc.getTaskByPid(t.tgid)
+            tgid_name = tgid_task.comm if ((tgid_task is not None) and (tgid_task.comm != UNKNOWN_COMM)) else str(t.tgid)
         # Set an empty name if the tgid is the same as the pid
         if (t.tgid == t.pid):
             tgid_name = ""
@@ -722,127 +1536,22 @@ def main(src_filepath, dst_filepath, cpu_weights = None):
 
         grouped_task.npids += 1
 
-    with open(dst_filepath + "_schedstats.csv", "w") as f_out:
-
-        # Sort tasks by cycles first, seconds second (in case cycles are 0 because
-        # no frequency changes were seen in the trace)
-        tasks = sorted(grouped_tasks.values(), cmp=lambda a, b:
-            -1 if ((wsum(a.cycles, cpu_weights) < wsum(b.cycles, cpu_weights)) or
-                   ((wsum(a.cycles, cpu_weights) == wsum(b.cycles, cpu_weights)) and
-                    (wsum(a.seconds, cpu_weights) < wsum(b.seconds, cpu_weights)))) else 1, reverse=True)
-
-        # Write headers
-        f_out.write("%16s, %16s, %4s, %8s, %12s, %5s, %5s, %5s, %5s" % ("process", "parent", "pids", "seconds", "cycles", "sec%", "cyc%", "nsec%", "ncyc%"))
-        for cpu_id in xrange(num_cpus):
-            f_out.write(", CPU %d %5s, %5s, %5s, %5s" % (cpu_id, "sec%", "cyc%", "nsec%", "ncyc%"))
-        f_out.write("\n")
-
-        # Note that total cycles can be zero if no frequency changes were observed
-        total_cycles = sum([sum(t.cycles) for t in tasks])
-        weighted_total_cycles = sum([wsum(t.cycles, cpu_weights) for t in tasks])
-        total_seconds = sum([sum(t.seconds) for t in tasks])
-        weighted_total_seconds = sum([wsum(t.seconds, cpu_weights) for t in tasks])
-
-        # XXX Some traces (dropdead startup) give a 3.7 instead of 4 scale, need
-        #     to investigate if this is ok because of cores down, or not ok because
-        #     of accumulated errors when adding seconds (unlikely).
-        logger.info("Calculated total seconds/total seconds is %f" % (total_seconds / (last_timestamp - first_timestamp)))
-
-        for t in tasks:
-            # Write global information, using global percentages
-            total_seconds_this_task = sum(t.seconds)
-            weighted_total_seconds_this_task = wsum(t.seconds, cpu_weights)
-            pct_seconds_this_task = total_seconds_this_task * 100.0 / total_seconds
-            weighted_pct_seconds_this_task = weighted_total_seconds_this_task * 100.0 / weighted_total_seconds
-            assert pct_seconds_this_task <= 100.0
-
-            total_cycles_this_task = sum(t.cycles)
-            weighted_total_cycles_this_task = wsum(t.cycles, cpu_weights)
-            pct_cycles_this_task = total_cycles_this_task * 100.0 / total_cycles if total_cycles > 0 else 0
-            weighted_pct_cycles_this_task  = weighted_total_cycles_this_task * 100.0 / weighted_total_cycles if weighted_total_cycles > 0 else 0
-            assert pct_cycles_this_task <= 100.0
-
-            f_out.write("%16s, %16s, %4d, %8.4f, %12.2f, %5.2f, %5.2f, %5.2f, %5.2f, " %
-                        (t.comm, t.tgid_name, t.npids,
-                         total_seconds_this_task, total_cycles_this_task,
-                         pct_seconds_this_task, pct_cycles_this_task,
-                         weighted_pct_seconds_this_task,
-                         weighted_pct_cycles_this_task))
-
-            # Write per cpu information, using per-cpu percentages
-            for cpu_id in xrange(num_cpus):
-                try:
-                    cpu = soc.cpus[cpu_id]
-                    cpu_seconds = cpu.seconds
-                    cpu_cycles = cpu.cycles
-                except KeyError:
-                    # This cpu_id didn't run for the whole test, set values to 0
-                    cpu_seconds = 0
-                    cpu_cycles = 0
-
-                total_seconds_this_cpu = cpu_seconds
-                weighted_total_seconds_this_cpu = cpu_seconds * cpu_weights[cpu_id]
-                seconds_this_cpu = t.seconds[cpu_id]
-                weighted_seconds_this_cpu = t.seconds[cpu_id] * cpu_weights[cpu_id]
-                pct_seconds_this_cpu = seconds_this_cpu * 100.0 / total_seconds_this_cpu if total_seconds_this_cpu > 0 else 0
-                weighted_pct_seconds_this_cpu = weighted_seconds_this_cpu * 100.0 / weighted_total_seconds_this_cpu if weighted_total_seconds_this_cpu > 0 else 0
-                assert pct_seconds_this_cpu <= 100.0
-
-                total_cycles_this_cpu = cpu_cycles
-                weighted_total_cycles_this_cpu = cpu_cycles * cpu_weights[cpu_id]
-                cycles_this_cpu = t.cycles[cpu_id]
-                weighted_cycles_this_cpu = t.cycles[cpu_id] * cpu_weights[cpu_id]
-                pct_cycles_this_cpu = cycles_this_cpu * 100.0 / total_cycles_this_cpu if total_cycles_this_cpu > 0 else 0
-                weighted_pct_cycles_this_cpu = weighted_cycles_this_cpu * 100.0 / weighted_total_cycles_this_cpu if weighted_total_cycles_this_cpu > 0 else 0
-                # Use some epsilon in case of accumulated error on calculations
-                ## assert pct_cycles_this_cpu <= 101.0, "pct_cycles_this_cpu %f > 100.0" % pct_cycles_this_cpu
-
-                f_out.write("      %5.2f, %5.2f, %5.2f, %5.2f, " % (pct_seconds_this_cpu, pct_cycles_this_cpu,
-                                                                    weighted_pct_seconds_this_cpu, weighted_pct_cycles_this_cpu))
-
-
-            f_out.write("\n")
+    # Note the cpu_id may not have run for the whole test, set its values to 0
+    cpu_seconds = [ soc.cpus[cpu_id].seconds if (cpu_id in soc.cpus) else 0 for cpu_id in range(num_cpus) ]
+    cpu_cycles = [ soc.cpus[cpu_id].cycles if (cpu_id in soc.cpus) else 0 for cpu_id in range(num_cpus) ]
+    with xopen(dst_filepath + "_schedstats.csv" + ext, "w") as f_out:
+        total_seconds = write_schedstats(f_out, list(grouped_tasks.values()), cpu_seconds, cpu_cycles, cpu_weights)
 
-    # output freqstats, percentage of time spent on each frequency and CPU
-    with open(dst_filepath + "_freqstats.csv", "w") as f_out:
-
-        # Collect all frequencies, sorted higher to lower
-        frequencies = []
-        for cpu_id in soc.cpus:
-            cpu = soc.cpus[cpu_id]
-            for freq in cpu.seconds_per_frequency:
-                if freq not in frequencies:
-                    frequencies.append(freq)
-        frequencies = sorted(frequencies)
-
-        # Write headers
-        f_out.write("        ")
-        for cpu_id in xrange(num_cpus):
-            f_out.write("CPU %2d, " % cpu_id)
-        f_out.write("\n")
-
-        # Write percentage of time at each frequency (note we cannot use
-        # percentage of cycles since we don't know the cycles speent in the "unknown"
-        # frequency)
-        for freq in frequencies:
-            if (freq == 0):
-                f_out.write("%8s " % "unknown")
-            else:
-                f_out.write("%8d " % freq)
-            for cpu_id in xrange(num_cpus):
-                try:
-                    cpu = soc.cpus[cpu_id]
-                    total_seconds_this_cpu = sum(cpu.seconds_per_frequency.values())
-                    seconds_this_frequency = cpu.seconds_per_frequency.get(freq, 0)
-                except KeyError:
-                    total_seconds_this_cpu = 0
-                    seconds_this_frequency = 0
+    # XXX Some traces (dropdead startup) give a 3.7 instead of 4 scale, need
+    #     to investigate if this is ok because of cores down, or not ok because
+    #     of accumulated errors when adding seconds (unlikely).
+    logger.info("Calculated total seconds/total seconds is %f" % (total_seconds / (last_timestamp - first_timestamp)))
 
-                pct_seconds_this_frequency = ((seconds_this_frequency * 100.0 / total_seconds_this_cpu)
-                                             if (total_seconds_this_cpu > 0) else 0)
-                f_out.write("%6.2f, " % pct_seconds_this_frequency)
+    # output freqstats, percentage of time spent on each frequency and CPU
+    with xopen(dst_filepath + "_freqstats.csv" + ext, "w") as f_out:
+        write_freqstats(f_out, dict([ (cpu_id, cpu.seconds_per_frequency) for cpu_id, cpu in soc.cpus.items() ]), num_cpus)
 
-            f_out.write("\n")
+    return trace_filepath
 
 
 logger.info("Starting")
@@ -854,22 +1563,36 @@ if (__name__ == "__main__"):
     logger.addHandler(logger_handler)
     logger.setLevel(logging.INFO)
 
-    src_filepath = r"c:\Users\atejada\Documents\projects\tomatoee2\trace.html"
-    dst_filepath = "psytrace"
-
-    if (len(sys.argv) > 1):
-        src_filepath = sys.argv[1]
-    if (len(sys.argv) > 2):
-        dst_filepath = sys.argv[2]
+    parser = argparse.ArgumentParser(description="Enhances a systrace and builds an html")
+    parser.add_argument("src_filepath", nargs="?",
+                        default=r"c:\Users\atejada\Documents\projects\tomatoee2\trace.html",
+                        help="Input trace, optionally gzipped")
+    parser.add_argument("dst_filepath", nargs="?", default="psytrace",
+                        help="Output trace, the stats csvs and the html use this as prefix")
+    parser.add_argument("cpu_weights", nargs="?", default=None,
+                        help="Comma-separated list of per-cpu weights, eg 1,1,1,1,2,2,2,2")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes used to parse the trace")
+    parser.add_argument("--events", metavar="DIRPATH", default=None,
+                        help="Also write the events as .npy columns to this directory")
+    parser.add_argument("--compress", choices=sorted(COMPRESSION_EXTENSIONS.keys()), default=None,
+                        help="Compress the output trace and csvs, zst needs the zstandard package")
+    parser.add_argument("--resume", action="store_true",
+                        help="Only process what was appended to the trace since the last --resume run, "
+                             "using the state checkpointed next to the output trace")
+    args = parser.parse_args()
+
+    src_filepath = args.src_filepath
+    dst_filepath = args.dst_filepath
 
     cpu_weights = None
-    if (len(sys.argv) > 3):
-        cpu_weights = sys.argv[3]
+    if (args.cpu_weights is not None):
+        cpu_weights = args.cpu_weights
         cpu_weights = cpu_weights.split(",")
         cpu_weights = [float(w) for w in cpu_weights]
 
     logger.info("Input trace %s output trace %s weights %s" % (repr(src_filepath), repr(dst_filepath), repr(cpu_weights)))
 
-    main(src_filepath, dst_filepath, cpu_weights)
+    trace_filepath = main(src_filepath, dst_filepath, cpu_weights, args.jobs, args.events, args.resume, args.compress)
 
-    wrap_trace_in_html(dst_filepath, "%s.html" % dst_filepath)
\ No newline at end of file
+    wrap_trace_in_html(trace_filepath, "%s.html" % dst_filepath)
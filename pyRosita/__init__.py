@@ -8,5 +8,13 @@ from .rt_hardware import(
 )
 
 from .sequencer import(
-    Sequencer
-)
\ No newline at end of file
+    Sequencer,
+    SequenceError,
+    UnknownActionError,
+    ActionArgumentError
+)
+
+from .timeline import(
+    Keyframe,
+    Timeline
+)
@@ -1,3 +1,8 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def check_timing(name, diff, range):
     """Return a float that is the amount of time needed to move the specified distance
     
@@ -109,6 +114,52 @@ def limit_change(amt, current, max, min):
         print("Setting value to {}".format(min))
         return new
 
+def limit_values(vals):
+    """Return a NumPy array of the values clipped between 0 and 100
+    
+    The batch version of limit_value(), used by the move_path() methods. Prints a
+    single warning for all the values out of range.
+    
+    """
+    vals = numpy.asarray(vals)
+    out_of_range = numpy.count_nonzero((vals > 100) | (vals < 0))
+    if out_of_range:
+        print("Values must be between 0 and 100.")
+        print("{} requested values exceeded the maximum or minimum. Setting them to 100 or 0".format(out_of_range))
+        vals = numpy.clip(vals, 0, 100)
+    return vals
+
+def map_path(vals, range):
+    """Return a NumPy int array of values from 0-100 mapped onto an attr range, like
+    round(val / 100 * range) does for a single value"""
+    return numpy.rint(vals / 100 * range).astype(numpy.int64)
+
+def path_changes(current, targets):
+    """Return two NumPy arrays: a bool array, True where each target differs from the
+    value before it, and the values before each target
+    
+    Parameters
+    ----------
+    current : int
+        The value of the attribute before the first target
+    targets : NumPy array
+        The successive values requested for the attribute
+    
+    """
+    previous = numpy.concatenate(([current], targets))[:-1]
+    return targets != previous, previous
+
+def hold_path(current, values, changed):
+    """Return a NumPy array of the value held after each step: values where changed,
+    the last one changed otherwise (current before any)
+    
+    This is how coupled attributes, like the elbow of an arm, follow the attribute
+    they are set with.
+    
+    """
+    last = numpy.maximum.accumulate(numpy.where(changed, numpy.arange(len(values)), -1))
+    return numpy.where(last >= 0, values[last], current)
+
 class Head:
     """Has nod, turn, and roll attr. Can set_ or change_ any of these attr, given an amt
     
@@ -242,6 +293,47 @@ class Head:
             string += "Head Nod={}\n".format(self.nod)
             
         return [string, time]
+    
+    def move_path(self, xs, ys):
+        """Change head nod and turn values along a path; return a list of the channels and
+        timings
+        
+        The batch version of move(), computing with NumPy the values and timing that
+        move() would return for each point of the path, called in order. Requires
+        NumPy.
+        
+        Parameters
+        ----------
+        xs : array of int
+            The requested 'turn' values. Must be between 0 and 100.
+        ys : array of int
+            The requested 'nod' values. Must be between 0 and 100.
+            
+        Returns
+        -------
+        list
+            0: list of tuples
+                (channel name, NumPy array of its value after each point, NumPy bool
+                array of whether it's written at each point), in the order move()
+                writes them
+            1: NumPy array
+                The amount of time each point should take to complete
+        
+        """
+        mapX = map_path(limit_values(xs), self.TURN_RANGE)
+        mapY = map_path(limit_values(ys), self.NOD_RANGE)
+        turns = self.TURN_MIN + mapX
+        nods = self.NOD_MIN + mapY
+        turn_changed, turn_previous = path_changes(self.turn, turns)
+        nod_changed, nod_previous = path_changes(self.nod, nods)
+        # like move(), the turn timing is measured up to the mapped nod value
+        times = numpy.where(turn_changed, check_timing("head", turn_previous - (self.TURN_MIN+mapY),
+                                                       self.TURN_RANGE), 0.40)
+        times = numpy.where(nod_changed, check_timing("head", nod_previous - nods, self.NOD_RANGE), times)
+        if len(turns):
+            self.turn = int(turns[-1])
+            self.nod = int(nods[-1])
+        return [[("Head Turn", turns, turn_changed), ("Head Nod", nods, nod_changed)], times]
         
     def set(self, part, amt):
         """Return string (formatted for .sequence file) and int (amount of time needed)
@@ -463,6 +555,42 @@ class Torso:
             self.bendForward = self.BENDFORWARD_MAX - mapY
             string += "Torso Bend Forward={}\n".format(self.bendForward)
         return [string, time]
+    
+    def move_path(self, xs, ys):
+        """Change torso turn and bendForward values along a path; return a list of the
+        channels and timings
+        
+        The batch version of move(). Requires NumPy.
+        
+        Parameters
+        ----------
+        xs : array of int
+            The requested 'turn' values. Must be between 0 and 100.
+        ys : array of int
+            The requested 'bendForward' values. Must be between 0 and 100.
+            
+        Returns
+        -------
+        list
+            0: list of tuples
+                (channel name, NumPy array of its value after each point, NumPy bool
+                array of whether it's written at each point), in the order move()
+                writes them
+            1: NumPy array
+                The amount of time each point should take to complete
+        
+        """
+        turns = self.TURN_MIN + map_path(limit_values(xs), self.TURN_RANGE)
+        bends = self.BENDFORWARD_MAX - map_path(limit_values(ys), self.BENDFORWARD_RANGE)
+        turn_changed, turn_previous = path_changes(self.turn, turns)
+        bend_changed, bend_previous = path_changes(self.bendForward, bends)
+        times = numpy.where(turn_changed, check_timing("torso", turn_previous - turns, self.TURN_RANGE), 0.40)
+        times = numpy.where(bend_changed, check_timing("torso", bend_previous - bends, self.BENDFORWARD_RANGE),
+                            times)
+        if len(turns):
+            self.turn = int(turns[-1])
+            self.bendForward = int(bends[-1])
+        return [[("Torso Turn", turns, turn_changed), ("Torso Bend Forward", bends, bend_changed)], times]
         
     def set(self, part, amt):
         """Return string (formatted for .sequence file) and int (amount of time needed)
@@ -746,6 +874,53 @@ class Arm:
             string += "{} Arm Out={}\n".format(self.side, self.out)
             string += "{} Arm Twist={}\n".format(self.side, self.twist)
         return [string, time]
+    
+    def move_path(self, xs, ys):
+        """Change arm up/elbow and out/twist values along a path; return a list of the
+        channels and timings
+        
+        The batch version of move(). The elbow and twist follow the up and out values
+        they are coupled with, and keep their value while those don't change. Requires
+        NumPy.
+        
+        Parameters
+        ----------
+        xs : array of int
+            The requested 'out' values. Must be between 0 and 100.
+        ys : array of int
+            The requested 'up' values. Must be between 0 and 100.
+            
+        Returns
+        -------
+        list
+            0: list of tuples
+                (channel name, NumPy array of its value after each point, NumPy bool
+                array of whether it's written at each point), in the order move()
+                writes them
+            1: NumPy array
+                The amount of time each point should take to complete
+        
+        """
+        xs = limit_values(xs)
+        ys = limit_values(ys)
+        ups = self.UP_MIN + map_path(ys, self.UP_RANGE)
+        outs = self.OUT_MIN + map_path(xs, self.OUT_RANGE)
+        up_changed, up_previous = path_changes(self.up, ups)
+        out_changed, out_previous = path_changes(self.out, outs)
+        elbows = hold_path(self.elbow, self.ELBOW_MIN + numpy.rint(1.05 ** ys * 4).astype(numpy.int64), up_changed)
+        twists = hold_path(self.twist, self.TWIST_MIN + numpy.rint(1.05 ** xs * 3.75).astype(numpy.int64),
+                           out_changed)
+        times = numpy.where(up_changed, check_timing("arm", up_previous - ups, self.UP_RANGE), 0.40)
+        times = numpy.where(out_changed, check_timing("arm", out_previous - outs, self.OUT_RANGE), times)
+        if len(ups):
+            self.up = int(ups[-1])
+            self.elbow = int(elbows[-1])
+            self.out = int(outs[-1])
+            self.twist = int(twists[-1])
+        return [[("{} Arm Elbow".format(self.side), elbows, up_changed),
+                 ("{} Arm Up".format(self.side), ups, up_changed),
+                 ("{} Arm Out".format(self.side), outs, out_changed),
+                 ("{} Arm Twist".format(self.side), twists, out_changed)], times]
 	
     def set(self, attr, amt):
         """Return string (formatted for .sequence file) and int (amount of time needed)
@@ -1241,6 +1416,51 @@ class Robot:
         times = [left[1], right[1], head[1], torso[1]]
         time = max(times)
         return [string, time]
+    
+    def aim_path(self, xs, ys, side):
+        """Returns a list of the channels and timings of aiming at each point of a path
+        
+        The batch version of left_aim() and right_aim(), e.g. to follow a tracked
+        target. The values and timings every aim would return, called in order, are
+        computed at once with NumPy. Requires NumPy.
+        
+        Parameters
+        ----------
+        xs : array of int
+            The x coordinates of the points aimed at, between 0 and 100
+        ys : array of int
+            The y coordinates of the points aimed at, between 0 and 100
+        side : string
+            "left" or "right", the arm aiming
+        
+        Returns
+        -------
+        list
+            0: list of tuples
+                (channel name, NumPy array of its value after each point, NumPy bool
+                array of whether it's written at each point), in the order the aim
+                methods write them
+            1: NumPy array
+                The amount of time to reserve for the movement to each point
+        
+        """
+        if side not in ("left", "right"):
+            raise ValueError("side must be 'left' or 'right', not {!r}".format(side))
+        xs = numpy.asarray(xs)
+        ys = numpy.asarray(ys)
+        look_xs = numpy.rint(0.0004*(xs-50)**3+50)
+        raised_xs = numpy.zeros(len(xs), dtype=numpy.int64)
+        raised_ys = numpy.full(len(xs), 99, dtype=numpy.int64)
+        if side == "left":
+            left = self.leftArm.move_path(xs, ys)
+            right = self.rightArm.move_path(raised_xs, raised_ys)
+        else:
+            right = self.rightArm.move_path(xs, ys)
+            left = self.leftArm.move_path(raised_xs, raised_ys)
+        head = self.head.move_path(look_xs, ys)
+        torso = self.torso.move_path(xs, ys)
+        times = numpy.maximum(numpy.maximum(left[1], right[1]), numpy.maximum(head[1], torso[1]))
+        return [left[0] + right[0] + head[0] + torso[0], times]
 		
     def triggerBoth(self):
         """Returns a list with a string for the .sequence file and a timing int
@@ -1,12 +1,124 @@
+from functools import partial
 from random import randint
 from datetime import datetime
-        
+
+from .timeline import Timeline
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Kinds of arguments taken by the actions of Sequencer.add
+NO_ARGUMENT = 0
+# an int, positional or amt=
+AMOUNT_ARGUMENT = 1
+# an (x, y) tuple, or x= and y=
+POINT_ARGUMENT = 2
+# seconds, positional or time=
+TIME_ARGUMENT = 3
+
+HEAD_PARTS = ("nod", "turn", "roll")
+TORSO_PARTS = ("bend_forward", "sideways", "turn")
+ARM_PARTS = ("up", "out", "twist", "fore_arm", "elbow", "wrist")
+# Prefix of the nouns for each side and the attribute names of its limbs on Robot
+SIDES = (("left", "leftArm", "leftHand"), ("right", "rightArm", "rightHand"))
+# Component that stands for the Sequencer itself in ACTION_SPECS
+SEQUENCER = "sequencer"
+# Digits kept for the "length=" header of streamed sequences, written before the
+# length is known and patched at the end
+LENGTH_DIGITS = 10
+
+class SequenceError(ValueError):
+    """Base class of the errors raised when building a sequence"""
+
+class UnknownActionError(SequenceError):
+    """Raised by Sequencer.add for an action that isn't "<verb> <noun>" with a known
+    verb and noun
+    
+    Attributes
+    ----------
+    action : string
+        The action string passed to .add()
+    
+    """
+    def __init__(self, action):
+        self.action = action
+        SequenceError.__init__(self,
+            "Unknown action '{}'. Actions must be in the format '<verb> <noun>', the verb "
+            "'set' or 'change' and the noun any robot component in snake case, "
+            "e.g. 'set left_arm_aim' or 'change torso_turn'".format(action))
+
+class ActionArgumentError(SequenceError):
+    """Raised by Sequencer.add when an action is missing its argument or it has the
+    wrong type
+    
+    Attributes
+    ----------
+    action : string
+        The action string passed to .add()
+    
+    """
+    def __init__(self, action, requirement, example):
+        self.action = action
+        SequenceError.__init__(self, "'{}' requires {}. Try again in this format: {}".format(
+            action, requirement, example))
+
+def build_action_specs():
+    """Return a dict of every action string accepted by Sequencer.add
+    
+    Returns
+    -------
+    dict
+        Key: action string, "<verb> <noun>"
+        Value: tuple of the component of the Robot that performs the action (an
+        attribute name, None for the Robot itself or SEQUENCER), the name of its
+        method, the part passed as its first argument (None if it takes none) and
+        the kind of argument the action takes
+    
+    """
+    specs = {}
+    specs["set default"] = (None, "default", None, NO_ARGUMENT)
+    specs["set wait"] = (SEQUENCER, "wait", None, TIME_ARGUMENT)
+    specs["set pause"] = (SEQUENCER, "wait", None, TIME_ARGUMENT)
+    for verb in ("set", "change"):
+        for part in HEAD_PARTS:
+            specs["{} head_{}".format(verb, part)] = ("head", verb, part, AMOUNT_ARGUMENT)
+        for part in TORSO_PARTS:
+            specs["{} torso_{}".format(verb, part)] = ("torso", verb, part, AMOUNT_ARGUMENT)
+        for side, arm, hand in SIDES:
+            for part in ARM_PARTS:
+                specs["{} {}_arm_{}".format(verb, side, part)] = (arm, verb, part, AMOUNT_ARGUMENT)
+    for side, arm, hand in SIDES:
+        specs["set {}_arm_aim".format(side)] = (None, "{}_aim".format(side), None, POINT_ARGUMENT)
+        specs["set {}_arm_move".format(side)] = (arm, "move", None, POINT_ARGUMENT)
+        for button in ("trigger", "grip", "drop"):
+            specs["set {}_{}".format(side, button)] = (hand, button, None, NO_ARGUMENT)
+    specs["set both_trigger"] = (None, "triggerBoth", None, NO_ARGUMENT)
+    specs["set both_grip"] = (None, "gripBoth", None, NO_ARGUMENT)
+    specs["set both_drop"] = (None, "dropBoth", None, NO_ARGUMENT)
+    for direction in ("forward", "left", "right"):
+        specs["set look_point_{}".format(direction)] = (None, "look_point_{}".format(direction), None, NO_ARGUMENT)
+    return specs
+
+# Built once, Sequencer binds it to its robot
+ACTION_SPECS = build_action_specs()
+
+def path_ms(timers):
+    """Return a list of int milliseconds of a NumPy array of timer values, rounded like
+    Sequencer.timer_ms()"""
+    hundredths = timers * 100
+    rounded = numpy.rint(hundredths)
+    for i in numpy.flatnonzero(numpy.abs(numpy.abs(hundredths - rounded) - 0.5) < 1e-6):
+        rounded[i] = round(round(float(timers[i]), 2) * 100)
+    return (rounded.astype(numpy.int64) * 10).tolist()
+
 class Sequencer:
     """Has attr for RoboThespian metadata. Writes sequences to a file recognized by RT.
     
     The Sequencer class is what the user primarily interacts with. Users create an
-    instance and add movements using the .add() method. These are appended to a 
-    keyframes dictionary, which gives timing and device instructions in a format
+    instance and add movements using the .add() method. These are added to a 
+    keyframes timeline, which gives timing and device instructions in a format
     recognized by RoboThespian. When the sequence is completed, the user calls
     generate_animation() to write all of the instructions to the file, which can
     then be uploaded and played on Rosita.
@@ -29,15 +141,31 @@ class Sequencer:
         A string-formatted "datetime" timestamp, used by VirtualRobot GUI
     modified : string
         A string-formatted "datetime" timestamp, used by VirtualRobot GUI
-    timer : int
-        Timer used for the KEY of keyframes dict. Begins at 0.00
-    keyframes : dict
-        Keeps track of animation. KEY is timer, VALUE is string of instructions
+    timer : float
+        Time of the next action, in seconds. Begins at 0.00
+    keyframes : Timeline
+        Keeps track of animation. Keyframes sorted by int millisecond time, each with
+        the .sequence commands to run at that time. See timeline for details
     actions : dict
         A mapping of accepted strings from .add() method to actual robot commands
+    stream : bool
+        Whether keyframes are written as soon as the timer has passed them instead of
+        all at once by generate_animation(). See flush() for details
+    batch_size : int
+        Number of keyframes that make the sequencer flush when streaming, written
+        with one file write
+    length_position : int
+        Position of the "length=" header line in file, for streamed sequences whose
+        header is already written. None otherwise
+    header_written : bool
+        Whether the header has been written to file
+    delta : bool
+        Whether a channel is only written when its value changes, see last_values
+    last_values : dict
+        KEY is a channel name, VALUE the last value written for it, when writing deltas
     
     """
-    def __init__(self, file, robot, user, id, description):
+    def __init__(self, file, robot, user, id, description, stream=False, batch_size=1000, delta=False):
         self.file = file
         self.robot = robot
         self.user = user
@@ -47,7 +175,42 @@ class Sequencer:
         self.created = datetime.now().strftime("%Y-%m-%dT%I:%M.%S")
         self.modified = datetime.now().strftime("%Y-%m-%dT%I:%M.%S")
         self.timer = 0.00
-        self.keyframes = {}
+        self.keyframes = Timeline()
+        self.actions = self.bind_actions()
+        self.stream = stream
+        self.batch_size = batch_size
+        self.length_position = None
+        self.header_written = False
+        self.delta = delta
+        self.last_values = {}
+    
+    def bind_actions(self):
+        """Return a dict of the action strings accepted by .add() and their handlers
+        
+        Resolves ACTION_SPECS against this sequencer's robot once, so .add() runs an
+        action with a single dict lookup.
+        
+        Returns
+        -------
+        dict
+            Key: action string, "<verb> <noun>"
+            Value: tuple of the bound method performing the action and the kind of
+            argument it takes
+        
+        """
+        actions = {}
+        for action, (component, method, part, argument) in ACTION_SPECS.items():
+            if component is None:
+                target = self.robot
+            elif component == SEQUENCER:
+                target = self
+            else:
+                target = getattr(self.robot, component)
+            handler = getattr(target, method)
+            if part is not None:
+                handler = partial(handler, part)
+            actions[action] = (handler, argument)
+        return actions
     
     def write(self, content):
         """Writes content to file, auto-appending newline to insert line breaks
@@ -58,6 +221,21 @@ class Sequencer:
         """
         self.file.write(content + '\n')
     
+    def timer_ms(self):
+        """Return the timer as int milliseconds, rounded to the hundredths of a second
+        of the .sequence headings
+        
+        Rounds like the "time=0.00" formatting, so actions whose timer values share a
+        heading share a keyframe.
+        
+        """
+        hundredths = self.timer * 100
+        rounded = round(hundredths)
+        if abs(abs(hundredths - rounded) - 0.5) < 1e-6:
+            # the product may have rounded across a half hundredth, round exactly
+            rounded = round(round(self.timer, 2) * 100)
+        return rounded * 10
+    
     def wait(self, time):
         """Return a list of two int representing how long to pause the animation
         
@@ -76,13 +254,13 @@ class Sequencer:
         return [time, time]
     
     def add(self, action, *args, **kwargs):
-        """Adds new Key/Value pairs to keyframes attr
+        """Adds the commands of an action to the keyframes attr
         
         This is the primary method of the Sequencer. It takes in a string and
-        keyword arguments, identifies the robot commands to issue, passes along
-        relevant arguments, and stores the response. Then, for each element in the
-        response, it generates a new key/value pair in the keyframes dict with a
-        timer value and string of necessary .sequence commands.
+        keyword arguments, looks up the robot command to issue in the actions attr,
+        passes along relevant arguments, and stores the response. Then, for each
+        element in the response, it adds the .sequence commands to the keyframe at
+        the timer value.
         
         Parameters
         ----------
@@ -98,188 +276,123 @@ class Sequencer:
         **kwargs : kw=(int)
             Keyword arguments must be either x=__, y=__, time=__, or amt=__ . Values
             must be int.
-        
+
+        Raises
+        ------
+        UnknownActionError
+            If the action isn't one of the keys of the actions attr
+        ActionArgumentError
+            If the action is missing its argument
+
         """
-        # create the key for this dict entry. Keys should always be time signatures for the keyframe animation
-        key = "time={0:.2f}".format(self.timer)
-        
-        if " " in action:
-            command = action.split(" ")
-            verb = command[0]
-            noun = command[1]
-        else:
-            verb = ""
+        try:
+            handler, argument = self.actions[action]
+        except KeyError:
+            raise UnknownActionError(action)
         
-        if verb == "set":
-            if noun == "default":
-                response = self.robot.default()
-            elif noun == "wait" or noun == "pause":
-                response = self.wait(args[0])
-            elif "head_" in noun:
-                part = noun.split("head_")[1]
-                if len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.head.set(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.head.set(part, kwargs["amt"])
-                else:
-                    print("'{}' requires an 'amt' value that is an int between 0 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-            elif "torso_" in noun:
-                part = noun.split("torso_")[1]
-                if len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.torso.set(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.torso.set(part, kwargs["amt"])
-                    
-                else:
-                    print("'{}' requires an 'amt' value that is an int between 0 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-            elif "left_arm_" in noun:
-                part = noun.split("left_arm_")[1]
-                if part == "aim":
-                    x = args[0][0]
-                    y = args[0][1]
-                    print("AIM called with x={} y={}".format(x, y))
-                    response = self.robot.left_aim(x, y)
-                elif part == "move":
-                    x = args[0][0]
-                    y = args[0][1]
-                    print("MOVE called with x={} y={}".format(x, y))
-                    response = self.robot.leftArm.move(x, y)
-                elif len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.leftArm.set(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.leftArm.set(part, kwargs["amt"])
-                else:
-                    print("'{}' requires an 'amt' value that is an int between 0 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-            elif "right_arm_" in noun:
-                part = noun.split("right_arm_")[1]
-                if part == "aim":
-                    x = args[0][0]
-                    y = args[0][1]
-                    print("AIM called with x={} y={}".format(x, y))
-                    response = self.robot.right_aim(x, y)
-                elif part == "move":
-                    x = args[0][0]
-                    y = args[0][1]
-                    print("MOVE called with x={} y={}".format(x, y))
-                    response = self.robot.rightArm.move(x, y)
-                elif len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.rightArm.set(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.rightArm.set(part, kwargs["amt"])
-                else:
-                    print("'{}' requires an 'amt' value that is an int between 0 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-            elif noun == "left_trigger":
-                response = self.robot.leftHand.trigger()
-            elif noun == "right_trigger":
-                response = self.robot.rightHand.trigger()
-            elif noun == "both_trigger":
-                response = self.robot.triggerBoth()
-            elif noun == "left_grip":
-                response = self.robot.leftHand.grip()
-            elif noun == "right_grip":
-                response = self.robot.rightHand.grip()
-            elif noun == "both_grip":
-                response = self.robot.gripBoth()
-            elif noun == "left_drop":
-                response = self.robot.leftHand.drop()
-            elif noun == "right_drop":
-                response = self.robot.rightHand.drop()
-            elif noun == "both_drop":
-                response = self.robot.dropBoth()
-            elif noun == "look_point_forward":
-                response = self.robot.look_point_forward()
-            elif noun == "look_point_left":
-                response = self.robot.look_point_left()
-            elif noun == "look_point_right":
-                response = self.robot.look_point_right()
-        elif verb == "change":
-            if "head_" in noun:
-                part = noun.split("head_")[1]
-                if len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.head.change(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.head.change(part, kwargs["amt"])
-                else:
-                    print("'{}' requires an 'amt' value that is an int between -100 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-            elif "torso_" in noun:
-                part = noun.split("torso_")[1]
-                if len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.torso.change(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.torso.change(part, kwargs["amt"])
-                    
-                else:
-                    print("'{}' requires an 'amt' value that is an int between -100 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-            elif "left_arm_" in noun:
-                part = noun.split("left_arm_")[1]
-                if len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.leftArm.change(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.leftArm.change(part, kwargs["amt"])
-                else:
-                    print("'{}' requires an 'amt' value that is an int between -100 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-            elif "right_arm_" in noun:
-                part = noun.split("right_arm_")[1]
-                if len(args) == 1 and type(args[0]) == int:
-                    response = self.robot.rightArm.change(part, args[0])
-                elif "amt" in kwargs:
-                    response = self.robot.rightArm.change(part, kwargs["amt"])
-                else:
-                    print("'{}' requires an 'amt' value that is an int between -100 and 100.".format(action))
-                    print("Try again in this format: seq.add('{}', <int>)".format(action))
-        else:
-            print("Sorry, I didn't understand that command. You asked me to {}".format(action))
-            print("To add movements to the sequence, you must use the format seq.add('<verb> <noun>', args)")
-            print("You can say 'set' or 'change', and for nouns you may choose any robot component in snake case")
-            print("Example: seq.add('set left_arm_aim', (75, 6)) or seq.add('set both_trigger')")
-            response = ["", 0]
+        if argument == NO_ARGUMENT:
+            response = handler()
+        elif argument == AMOUNT_ARGUMENT:
+            if len(args) == 1 and type(args[0]) == int:
+                response = handler(args[0])
+            elif "amt" in kwargs:
+                response = handler(kwargs["amt"])
+            else:
+                raise ActionArgumentError(action, "an 'amt' value that is an int",
+                                          "seq.add('{}', <int>)".format(action))
+        elif argument == POINT_ARGUMENT:
+            if len(args) == 1 and type(args[0]) in (tuple, list) and len(args[0]) == 2:
+                response = handler(args[0][0], args[0][1])
+            elif "x" in kwargs and "y" in kwargs:
+                response = handler(kwargs["x"], kwargs["y"])
+            else:
+                raise ActionArgumentError(action, "an (x, y) tuple",
+                                          "seq.add('{}', (<int>, <int>))".format(action))
+        elif argument == TIME_ARGUMENT:
+            if len(args) == 1:
+                response = handler(args[0])
+            elif "time" in kwargs:
+                response = handler(kwargs["time"])
+            else:
+                raise ActionArgumentError(action, "a 'time' value in seconds",
+                                          "seq.add('{}', <int>)".format(action))
         
         response_string = response[0]
         response_timing = response[1]
             
         # if a method returns a list of strings, handle them all here to control timing without holding up the 
         # rest of the animation. This will auto-add pauses for things like button presses. If it's an int
-        # instead of a string, then wait was called; adjust timer for future events. If it's just a string, 
-        # add to the keyframes!
+        # instead of a string, then wait was called; mark the pause and adjust timer for future events. If it's
+        # just a string, add to the keyframes!
         if type(response_string) is list:
             for item in response_string:
-                key = "time={0:.2f}".format(self.timer)
-                self.keyframes[key] = item
+                self.keyframes.add_commands(self.timer_ms(), item)
                 self.timer += response_timing
         elif type(response_string) is int:
-            self.keyframes[key] = ""
+            self.keyframes.keyframe(self.timer_ms())
             self.timer += response_timing
         else:
-            # check to see if there's already a key for the entry. If so, append the next action to the existing 
-            # key. If not, create a new dict key and value
-            try:
-                self.keyframes[key] += "\n"+response_string
-            except KeyError:
-                self.keyframes[key] = response_string
+            self.keyframes.add_commands(self.timer_ms(), response_string)
             self.timer += response_timing
         
-    def generate_animation(self):
-        """Outputs text to the file given on instantiation. Call after done using .add()
+        # actions are only added at the timer, so the keyframes before it are final
+        if self.stream and len(self.keyframes) >= self.batch_size:
+            self.flush(self.timer_ms())
         
-        This method actually writes to the .sequence file. It first writes metadata
-        for the VirtualRobot/RoboThespian visual interfaces to keep organized. It then
-        iterates over the keyframes attribute to write headings for each keyframe in
-        the format of "time=0.00" and then write robot commands that can be read by
-        RoboThespian ("L Arm Out=1800")
+    def add_aim_path(self, xs, ys, side):
+        """Adds the commands of aiming at each point of a path, one after the other
+        
+        Does what .add("set left_arm_aim", (x, y)) or .add("set right_arm_aim", (x, y))
+        does for every point, but has the robot compute the whole path at once with
+        Robot.aim_path(). Without NumPy, the points are added one by one with .add().
+        
+        Parameters
+        ----------
+        xs : sequence of int
+            The x coordinates of the points aimed at, between 0 and 100
+        ys : sequence of int
+            The y coordinates of the points aimed at, between 0 and 100
+        side : string
+            "left" or "right", the arm aiming
+        
+        """
+        if numpy is None:
+            for x, y in zip(xs, ys):
+                self.add("set {}_arm_aim".format(side), (x, y))
+            return
+        
+        channels, times = self.robot.aim_path(xs, ys, side)
+        # the "Channel=value" line of each channel at each point, empty where it isn't written
+        columns = [[channel + "=" + str(value) + "\n" if written else "" for value, written in
+                    zip(values.tolist(), changed.tolist())] for channel, values, changed in channels]
+        # cumsum adds the times one after the other, like .add() does to the timer
+        timers = numpy.cumsum(numpy.concatenate(([self.timer], times)))
+        self.keyframes.extend(path_ms(timers[:-1]), map("".join, zip(*columns)))
+        self.timer = float(timers[-1])
+        if self.stream and len(self.keyframes) >= self.batch_size:
+            self.flush(self.timer_ms())
+    
+    def write_header(self, length=None):
+        """Writes the metadata for the VirtualRobot/RoboThespian visual interfaces and
+        the heading of the keyframes
+        
+        Parameters
+        ----------
+        length : int
+            The length of the animation, in seconds. If None, the "length=" line is
+            left blank for generate_animation() to fill in, and its position is kept
+            in the length_position attr
         
         """
         self.write("[Sequence Header]")
         self.write("name={}".format(self.file.name.split(".")[0]))
         self.write("description={}".format(self.description))
         self.write("number={}".format(self.sequence_id))
-        self.write('length={}'.format(round(self.timer)))
+        if length is None:
+            self.length_position = self.file.tell()
+            self.write("length=" + " " * LENGTH_DIGITS)
+        else:
+            self.write('length={}'.format(length))
         self.write('[Meta]')
         self.write('robot_model=RoboThespian4')
         self.write('virtualrobot_id={}'.format(self.id))
@@ -288,7 +401,87 @@ class Sequencer:
         self.write('virtualrobot_modified={}'.format(self.modified))
         self.write('')
         self.write('[Sequence Events]')
-        for frame, value in self.keyframes.items():
-            self.write(frame)
-            self.write(value)
-            
+        self.header_written = True
+    
+    def write_keyframes(self, keyframes):
+        """Writes the headings and commands of a Timeline, batch_size keyframes per write
+        
+        Headings are in the format of "time=0.00", followed by robot commands that can
+        be read by RoboThespian ("L Arm Out=1800"). Keyframes with the same heading
+        are merged. When writing deltas, commands that don't change their channel are
+        dropped, and so are the headings left empty
+        
+        """
+        if self.delta:
+            formatted = keyframes.format_deltas(self.last_values)
+        else:
+            formatted = keyframes.format_keyframes()
+        lines = []
+        for heading, commands in formatted:
+            lines.append(heading)
+            lines.append(commands)
+            if len(lines) >= 2 * self.batch_size:
+                self.write("\n".join(lines))
+                lines = []
+        if lines:
+            self.write("\n".join(lines))
+    
+    def flush(self, before=None):
+        """Writes the keyframes before a time to file and removes them from keyframes
+        
+        Called by .add() when streaming, once batch_size keyframes are kept. The first
+        flush writes the header with a blank "length=" line, as the length isn't known
+        yet; generate_animation() seeks back to fill it in, so the file must be opened
+        with "w" or "r+". Files that can't seek, like pipes, and files opened for
+        appending, whose writes all go to the end, can't be streamed: streaming is
+        turned off and the keyframes are all written by generate_animation().
+        
+        Parameters
+        ----------
+        before : int
+            Time in milliseconds, the keyframes before it are written. All of them are
+            written if None
+        
+        """
+        if not self.header_written:
+            seekable = getattr(self.file, "seekable", None)
+            if seekable is None or not seekable() or "a" in getattr(self.file, "mode", ""):
+                self.stream = False
+                return
+            self.write_header()
+        if before is None:
+            before = self.keyframes.times[-1] + 1 if len(self.keyframes) else self.keyframes.start
+        self.write_keyframes(self.keyframes.pop_before(before))
+    
+    def generate_animation(self):
+        """Outputs text to the file given on instantiation. Call after done using .add()
+        
+        This method actually writes to the .sequence file. It first writes metadata
+        for the VirtualRobot/RoboThespian visual interfaces to keep organized. It then
+        iterates over the keyframes attribute to write headings for each keyframe in
+        the format of "time=0.00" and then write robot commands that can be read by
+        RoboThespian ("L Arm Out=1800"). Keyframes with the same heading are merged
+        
+        When streaming and the header is already written, the keyframes left are
+        flushed and the "length=" line is filled in instead.
+        
+        Raises
+        ------
+        SequenceError
+            When streaming and the length has more than LENGTH_DIGITS digits, it
+            doesn't fit in the "length=" line left blank by the header
+        
+        """
+        if not self.header_written:
+            self.write_header(round(self.timer))
+            self.write_keyframes(self.keyframes)
+        else:
+            length = "length={}".format(round(self.timer))
+            if len(length) > len("length=") + LENGTH_DIGITS:
+                raise SequenceError("The length of the sequence, {} seconds, doesn't fit in the {} digits "
+                                    "of its streamed header".format(round(self.timer), LENGTH_DIGITS))
+            self.flush()
+            end = self.file.tell()
+            self.file.seek(self.length_position)
+            self.file.write(length.ljust(len("length=") + LENGTH_DIGITS))
+            self.file.seek(end)
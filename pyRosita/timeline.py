@@ -0,0 +1,208 @@
+import re
+from bisect import bisect_left
+
+# A "Channel=value" line of .sequence commands
+COMMAND_REGEXP = re.compile(r"^([^=\n]+)=([^\n]*)$", re.M)
+
+class Keyframe:
+    """Has a time and the commands RoboThespian should reach at that time
+
+    Attributes
+    ----------
+    time : int
+        The time of the keyframe, in milliseconds from the start of the animation
+    commands : list
+        The "Channel=value" strings added at that time, in order. Each string can
+        hold several lines, as returned by the rt_hardware methods
+
+    """
+    __slots__ = ("time", "commands")
+
+    def __init__(self, time):
+        self.time = time
+        self.commands = []
+
+    def values(self):
+        """Return a dict of the channel values of the keyframe
+
+        Returns
+        -------
+        dict
+            KEY is a channel name as written in .sequence files ("L Arm Up"), VALUE
+            is its value as written ("1800"). Later values for a channel replace
+            earlier ones
+
+        """
+        values = {}
+        for commands in self.commands:
+            values.update(COMMAND_REGEXP.findall(commands))
+        return values
+
+def format_time(time):
+    """Return the .sequence heading of a time in milliseconds, e.g. "time=0.40" """
+    return "time={0:.2f}".format(time / 1000)
+
+class Timeline:
+    """Keyframes of an animation, sorted by time
+
+    The times are kept in a sorted list of int milliseconds next to a list of the
+    Keyframe at each time, so finding the keyframe of any time is a binary search
+    and appending at the end of the animation, the common case, doesn't move
+    anything. Adding commands only appends them to their keyframe; they are parsed
+    into channel values and formatted when the animation is written.
+
+    Attributes
+    ----------
+    times : list
+        The int millisecond times of the keyframes, ascending
+    frames : list
+        The Keyframe at each time of times
+    start : int
+        No keyframe can be added before this time, in milliseconds. Moved forward by
+        pop_before() once earlier keyframes are written
+
+    """
+    def __init__(self):
+        self.times = []
+        self.frames = []
+        self.start = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def keyframe(self, time):
+        """Return the Keyframe at time (int milliseconds), inserting an empty one if needed"""
+        times = self.times
+        if times and times[-1] <= time:
+            if times[-1] == time:
+                return self.frames[-1]
+            i = len(times)
+        else:
+            if time < self.start:
+                raise ValueError("Can't add a keyframe at {} ms, the keyframes before {} ms "
+                                 "are already written".format(time, self.start))
+            i = bisect_left(times, time)
+            if i < len(times) and times[i] == time:
+                return self.frames[i]
+        frame = Keyframe(time)
+        times.insert(i, time)
+        self.frames.insert(i, frame)
+        return frame
+
+    def pop_before(self, time):
+        """Remove the keyframes before time (int milliseconds) and return them
+
+        Returns
+        -------
+        Timeline
+            The keyframes removed, its start is the start of this timeline. Keyframes
+            can't be added before time anymore
+
+        """
+        i = bisect_left(self.times, time)
+        popped = Timeline()
+        popped.start = self.start
+        popped.times = self.times[:i]
+        popped.frames = self.frames[:i]
+        del self.times[:i]
+        del self.frames[:i]
+        self.start = max(self.start, time)
+        return popped
+
+    def set(self, time, channel, value):
+        """Set a channel to value at time (int milliseconds)"""
+        self.keyframe(time).commands.append("{}={}".format(channel, value))
+
+    def add_commands(self, time, commands):
+        """Add .sequence commands at time (int milliseconds)
+
+        Parameters
+        ----------
+        time : int
+            The time of the commands, in milliseconds from the start of the animation
+        commands : string
+            "Channel=value" lines, as returned by the rt_hardware methods. Blank lines
+            are skipped; the keyframe is created even if there are no commands
+
+        """
+        frame = self.keyframe(time)
+        if commands:
+            frame.commands.append(commands)
+
+    def extend(self, times, commands):
+        """Add .sequence commands at each of times (int milliseconds), in order
+
+        The same as calling add_commands() for each time and commands, faster when the
+        times follow each other at the end of the animation.
+
+        """
+        frames = self.frames
+        for time, command in zip(times, commands):
+            if self.times and self.times[-1] == time:
+                frame = frames[-1]
+            elif not self.times or self.times[-1] < time:
+                frame = Keyframe(time)
+                self.times.append(time)
+                frames.append(frame)
+            else:
+                frame = self.keyframe(time)
+            if command:
+                frame.commands.append(command)
+
+    def group_keyframes(self):
+        """Yield a (heading, list of Keyframe) per "time=0.00" heading, in order"""
+        headings = [format_time(time) for time in self.times]
+        frames = self.frames
+        i = 0
+        while i < len(frames):
+            heading = headings[i]
+            j = i + 1
+            while j < len(frames) and headings[j] == heading:
+                j += 1
+            yield heading, frames[i:j]
+            i = j
+
+    def format_keyframes(self):
+        """Yield a (heading, "Channel=value" lines) per keyframe heading
+
+        Keyframes whose times round to the same "time=0.00" heading are merged, the
+        later values for a channel replacing the earlier ones. The commands of a
+        keyframe added at once are written as they are, without parsing them.
+
+        """
+        for heading, frames in self.group_keyframes():
+            commands = frames[0].commands
+            if len(frames) == 1 and len(commands) <= 1:
+                yield heading, commands[0].rstrip("\n") if commands else ""
+            else:
+                values = {}
+                for frame in frames:
+                    values.update(frame.values())
+                yield heading, "\n".join(map("=".join, values.items()))
+
+    def format_deltas(self, last_values):
+        """Yield a (heading, "Channel=value" lines) per keyframe heading that changes
+        a channel
+
+        Like format_keyframes(), but a channel is only written when its value differs
+        from the last one written, and headings left without commands are skipped.
+
+        Parameters
+        ----------
+        last_values : dict
+            KEY is a channel name, VALUE the last value written for it. Updated with
+            the values yielded, so the deltas can carry on over several timelines
+
+        """
+        last_items = last_values.items()
+        for heading, frames in self.group_keyframes():
+            values = frames[0].values()
+            for frame in frames[1:]:
+                values.update(frame.values())
+            changed = [item for item in values.items() if item not in last_items]
+            if changed:
+                last_values.update(changed)
+                yield heading, "\n".join(map("=".join, changed))
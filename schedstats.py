@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+Scheduler and frequency statistics csv writers for psytrace.
+
+The per-task aggregation is done with NumPy matrix operations when NumPy is
+available, falling back to plain Python otherwise. Both paths perform the
+same floating point operations in the same order, so the csvs are identical.
+
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def wsum(l, w):
+    """
+    Weighted sum
+
+    :param l: list of numbers
+    :param w: list of weights, with at least as many weights as numbers in l
+    :return: l[i] * w[i] for all elements in l
+    """
+    return sum([w[i] * l[i] for i in range(len(l))])
+
+def build_schedstats_format(num_cpus):
+    """
+    :return: format for a schedstats row, taking the global columns followed by
+             four percentages per cpu
+    """
+    return ("%16s, %16s, %4d, %8.4f, %12.2f, %5.2f, %5.2f, %5.2f, %5.2f, " +
+            "      %5.2f, %5.2f, %5.2f, %5.2f, " * num_cpus + "\n")
+
+def write_schedstats_header(f_out, num_cpus):
+    f_out.write("%16s, %16s, %4s, %8s, %12s, %5s, %5s, %5s, %5s" % ("process", "parent", "pids", "seconds", "cycles", "sec%", "cyc%", "nsec%", "ncyc%"))
+    for cpu_id in range(num_cpus):
+        f_out.write(", CPU %d %5s, %5s, %5s, %5s" % (cpu_id, "sec%", "cyc%", "nsec%", "ncyc%"))
+    f_out.write("\n")
+
+def schedstats_rows_python(tasks, cpu_seconds, cpu_cycles, cpu_weights):
+    """
+    :return: (total_seconds, list of schedstats rows) computed with Python
+             loops, see write_schedstats
+    """
+    num_cpus = len(cpu_seconds)
+
+    # Sort tasks by cycles first, seconds second (in case cycles are 0 because
+    # no frequency changes were seen in the trace), the weighted sums are
+    # calculated once per task
+    keys = [ (wsum(t.cycles, cpu_weights), wsum(t.seconds, cpu_weights)) for t in tasks ]
+    order = sorted(range(len(tasks)), key=lambda i: keys[i], reverse=True)
+    tasks = [ tasks[i] for i in order ]
+    keys = [ keys[i] for i in order ]
+
+    # Note that total cycles can be zero if no frequency changes were observed
+    total_cycles = sum([sum(t.cycles) for t in tasks])
+    weighted_total_cycles = sum([weighted_cycles for weighted_cycles, _ in keys])
+    total_seconds = sum([sum(t.seconds) for t in tasks])
+    weighted_total_seconds = sum([weighted_seconds for _, weighted_seconds in keys])
+
+    rows = []
+    for t, (weighted_total_cycles_this_task, weighted_total_seconds_this_task) in zip(tasks, keys):
+        # Global information, using global percentages
+        total_seconds_this_task = sum(t.seconds)
+        pct_seconds_this_task = total_seconds_this_task * 100.0 / total_seconds
+        weighted_pct_seconds_this_task = weighted_total_seconds_this_task * 100.0 / weighted_total_seconds
+        assert pct_seconds_this_task <= 100.0
+
+        total_cycles_this_task = sum(t.cycles)
+        pct_cycles_this_task = total_cycles_this_task * 100.0 / total_cycles if total_cycles > 0 else 0
+        weighted_pct_cycles_this_task  = weighted_total_cycles_this_task * 100.0 / weighted_total_cycles if weighted_total_cycles > 0 else 0
+        assert pct_cycles_this_task <= 100.0
+
+        row = [ t.comm, t.tgid_name, t.npids,
+                total_seconds_this_task, total_cycles_this_task,
+                pct_seconds_this_task, pct_cycles_this_task,
+                weighted_pct_seconds_this_task, weighted_pct_cycles_this_task ]
+
+        # Per cpu information, using per-cpu percentages
+        for cpu_id in range(num_cpus):
+            total_seconds_this_cpu = cpu_seconds[cpu_id]
+            weighted_total_seconds_this_cpu = cpu_seconds[cpu_id] * cpu_weights[cpu_id]
+            seconds_this_cpu = t.seconds[cpu_id]
+            weighted_seconds_this_cpu = t.seconds[cpu_id] * cpu_weights[cpu_id]
+            pct_seconds_this_cpu = seconds_this_cpu * 100.0 / total_seconds_this_cpu if total_seconds_this_cpu > 0 else 0
+            weighted_pct_seconds_this_cpu = weighted_seconds_this_cpu * 100.0 / weighted_total_seconds_this_cpu if weighted_total_seconds_this_cpu > 0 else 0
+            assert pct_seconds_this_cpu <= 100.0
+
+            total_cycles_this_cpu = cpu_cycles[cpu_id]
+            weighted_total_cycles_this_cpu = cpu_cycles[cpu_id] * cpu_weights[cpu_id]
+            cycles_this_cpu = t.cycles[cpu_id]
+            weighted_cycles_this_cpu = t.cycles[cpu_id] * cpu_weights[cpu_id]
+            pct_cycles_this_cpu = cycles_this_cpu * 100.0 / total_cycles_this_cpu if total_cycles_this_cpu > 0 else 0
+            weighted_pct_cycles_this_cpu = weighted_cycles_this_cpu * 100.0 / weighted_total_cycles_this_cpu if weighted_total_cycles_this_cpu > 0 else 0
+            # Use some epsilon in case of accumulated error on calculations
+            ## assert pct_cycles_this_cpu <= 101.0, "pct_cycles_this_cpu %f > 100.0" % pct_cycles_this_cpu
+
+            row.extend([ pct_seconds_this_cpu, pct_cycles_this_cpu,
+                         weighted_pct_seconds_this_cpu, weighted_pct_cycles_this_cpu ])
+
+        rows.append(tuple(row))
+
+    return total_seconds, rows
+
+def _pct(values, totals):
+    """
+    :return: values * 100.0 / totals where totals > 0, 0 elsewhere
+    """
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(totals > 0, values * 100.0 / totals, 0.0)
+
+def schedstats_rows_numpy(tasks, cpu_seconds, cpu_cycles, cpu_weights):
+    """
+    :return: (total_seconds, list of schedstats rows) computed with NumPy
+             matrix operations, see write_schedstats
+
+    The matrices are (num_cpus, num_tasks) and reduced one cpu at a time, so
+    the sums are sequential like Python's sum instead of NumPy's pairwise
+    summation, which would round differently.
+    """
+    num_cpus = len(cpu_seconds)
+    seconds = numpy.array([ t.seconds for t in tasks ], dtype=numpy.float64).reshape(len(tasks), num_cpus).T.copy()
+    cycles = numpy.array([ t.cycles for t in tasks ], dtype=numpy.float64).reshape(len(tasks), num_cpus).T.copy()
+    # Broadcast the weights over the tasks
+    weights = numpy.array(cpu_weights[:num_cpus], dtype=numpy.float64)[:, numpy.newaxis]
+    weighted_seconds = seconds * weights
+    weighted_cycles = cycles * weights
+
+    def sum_cpus(m):
+        total = numpy.zeros(m.shape[1])
+        for cpu_id in range(num_cpus):
+            total += m[cpu_id]
+        return total
+
+    total_seconds_per_task = sum_cpus(seconds)
+    total_cycles_per_task = sum_cpus(cycles)
+    weighted_seconds_per_task = sum_cpus(weighted_seconds)
+    weighted_cycles_per_task = sum_cpus(weighted_cycles)
+
+    # Sort tasks by cycles first, seconds second, descending. lexsort is stable
+    # so ties keep their order like sorted(reverse=True) does
+    order = numpy.lexsort((-weighted_seconds_per_task, -weighted_cycles_per_task))
+    seconds = seconds[:, order]
+    cycles = cycles[:, order]
+    weighted_seconds = weighted_seconds[:, order]
+    weighted_cycles = weighted_cycles[:, order]
+    total_seconds_per_task = total_seconds_per_task[order]
+    total_cycles_per_task = total_cycles_per_task[order]
+    weighted_seconds_per_task = weighted_seconds_per_task[order]
+    weighted_cycles_per_task = weighted_cycles_per_task[order]
+
+    # Add the totals in task order with Python's sum to keep the rounding
+    total_cycles = sum(total_cycles_per_task.tolist())
+    weighted_total_cycles = sum(weighted_cycles_per_task.tolist())
+    total_seconds = sum(total_seconds_per_task.tolist())
+    weighted_total_seconds = sum(weighted_seconds_per_task.tolist())
+
+    pct_seconds = total_seconds_per_task * 100.0 / total_seconds
+    weighted_pct_seconds = weighted_seconds_per_task * 100.0 / weighted_total_seconds
+    assert numpy.all(pct_seconds <= 100.0)
+    pct_cycles = _pct(total_cycles_per_task, total_cycles)
+    weighted_pct_cycles = _pct(weighted_cycles_per_task, weighted_total_cycles)
+    assert numpy.all(pct_cycles <= 100.0)
+
+    # One row per task with the global columns followed by four percentages
+    # per cpu, converted to Python floats in one go
+    cpu_seconds = numpy.array(cpu_seconds, dtype=numpy.float64)[:, numpy.newaxis]
+    cpu_cycles = numpy.array(cpu_cycles, dtype=numpy.float64)[:, numpy.newaxis]
+    values = numpy.empty((len(tasks), 6 + num_cpus * 4))
+    values[:, 0] = total_seconds_per_task
+    values[:, 1] = total_cycles_per_task
+    values[:, 2] = pct_seconds
+    values[:, 3] = pct_cycles
+    values[:, 4] = weighted_pct_seconds
+    values[:, 5] = weighted_pct_cycles
+    values[:, 6::4] = _pct(seconds, cpu_seconds).T
+    values[:, 7::4] = _pct(cycles, cpu_cycles).T
+    values[:, 8::4] = _pct(weighted_seconds, cpu_seconds * weights).T
+    values[:, 9::4] = _pct(weighted_cycles, cpu_cycles * weights).T
+    assert numpy.all(values[:, 6::4] <= 100.0)
+
+    rows = [ tuple([ tasks[i].comm, tasks[i].tgid_name, tasks[i].npids ] + row_values)
+             for i, row_values in zip(order.tolist(), values.tolist()) ]
+
+    return total_seconds, rows
+
+def write_schedstats(f_out, tasks, cpu_seconds, cpu_cycles, cpu_weights, use_numpy = None):
+    """
+    Write the per task scheduler statistics csv, sorted by cycles and seconds
+
+    :param f_out: file to write the csv to
+    :param tasks: list of tasks grouped by comm, with comm, tgid_name, npids
+                  and per-cpu lists of seconds and cycles
+    :param cpu_seconds: list with the total seconds of each cpu
+    :param cpu_cycles: list with the total cycles of each cpu
+    :param cpu_weights: list with the weight of each cpu
+    :param use_numpy: use the NumPy aggregation, None to use it if available
+    :return: total seconds of all the tasks
+    """
+    num_cpus = len(cpu_seconds)
+    if (use_numpy is None):
+        use_numpy = (numpy is not None)
+
+    if (use_numpy and (len(tasks) > 0)):
+        total_seconds, rows = schedstats_rows_numpy(tasks, cpu_seconds, cpu_cycles, cpu_weights)
+    else:
+        total_seconds, rows = schedstats_rows_python(tasks, cpu_seconds, cpu_cycles, cpu_weights)
+
+    write_schedstats_header(f_out, num_cpus)
+    row_format = build_schedstats_format(num_cpus)
+    for row in rows:
+        f_out.write(row_format % row)
+
+    return total_seconds
+
+def write_freqstats(f_out, seconds_per_frequency, num_cpus):
+    """
+    Write the percentage of time spent on each frequency and cpu csv
+
+    :param f_out: file to write the csv to
+    :param seconds_per_frequency: dict of dicts with the seconds spent on each
+                                  frequency, indexed by cpu_id and frequency
+    :param num_cpus: number of cpu columns to write
+    """
+    # Collect all frequencies, sorted higher to lower
+    frequencies = set()
+    for cpu_id in seconds_per_frequency:
+        frequencies.update(seconds_per_frequency[cpu_id])
+    frequencies = sorted(frequencies)
+
+    # The total only depends on the cpu, calculate it once, adding in frequency
+    # order so the rounding doesn't depend on the dict ordering
+    total_seconds_per_cpu = {}
+    for cpu_id in seconds_per_frequency:
+        total_seconds_per_cpu[cpu_id] = sum([ seconds_per_frequency[cpu_id][freq] for freq in sorted(seconds_per_frequency[cpu_id]) ])
+
+    # Write headers
+    f_out.write("        ")
+    for cpu_id in range(num_cpus):
+        f_out.write("CPU %2d, " % cpu_id)
+    f_out.write("\n")
+
+    # Write percentage of time at each frequency (note we cannot use
+    # percentage of cycles since we don't know the cycles speent in the "unknown"
+    # frequency)
+    for freq in frequencies:
+        if (freq == 0):
+            f_out.write("%8s " % "unknown")
+        else:
+            f_out.write("%8d " % freq)
+        for cpu_id in range(num_cpus):
+            try:
+                total_seconds_this_cpu = total_seconds_per_cpu[cpu_id]
+                seconds_this_frequency = seconds_per_frequency[cpu_id].get(freq, 0)
+            except KeyError:
+                total_seconds_this_cpu = 0
+                seconds_this_frequency = 0
+
+            pct_seconds_this_frequency = ((seconds_this_frequency * 100.0 / total_seconds_this_cpu)
+                                         if (total_seconds_this_cpu > 0) else 0)
+            f_out.write("%6.2f, " % pct_seconds_this_frequency)
+
+        f_out.write("\n")
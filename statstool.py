@@ -1,18 +1,50 @@
 #!/usr/bin/env python
+from __future__ import print_function
+
+import argparse
+import collections
 import glob
+import gzip
+import io
 import logging
+import re
 import sys
 
+from sketches import P2Quantile, RunningStats
+
 logger = logging.getLogger(__name__)
 
 OP_CODE_AVERAGE = 0
 OP_CODE_SUBTRACT = 1
 OP_CODE_SUM = 2
+OP_CODE_P50 = 3
+OP_CODE_P90 = 4
+OP_CODE_P99 = 5
+OP_CODE_MIN = 6
+OP_CODE_MAX = 7
+OP_CODE_STDDEV = 8
 OP_NAMES_TO_CODE = { "avg" : OP_CODE_AVERAGE, "average" : OP_CODE_AVERAGE,
                      "diff" : OP_CODE_SUBTRACT, "sub" : OP_CODE_SUBTRACT,
                      "sum" : OP_CODE_SUM, "add" : OP_CODE_SUM,
+                     "p50" : OP_CODE_P50, "median" : OP_CODE_P50,
+                     "p90" : OP_CODE_P90,
+                     "p99" : OP_CODE_P99,
+                     "min" : OP_CODE_MIN,
+                     "max" : OP_CODE_MAX,
+                     "stddev" : OP_CODE_STDDEV,
                      }
 
+# Operations on the distribution of each column of a process across files, with
+# the function creating the sketch that accumulates a process given the number
+# of columns, and the sketch method returning the statistic
+OP_CODE_TO_DISTRIBUTION = { OP_CODE_P50 : (lambda num_values: P2Quantile(0.5, num_values), P2Quantile.quantile),
+                            OP_CODE_P90 : (lambda num_values: P2Quantile(0.9, num_values), P2Quantile.quantile),
+                            OP_CODE_P99 : (lambda num_values: P2Quantile(0.99, num_values), P2Quantile.quantile),
+                            OP_CODE_MIN : (RunningStats, RunningStats.minimum),
+                            OP_CODE_MAX : (RunningStats, RunningStats.maximum),
+                            OP_CODE_STDDEV : (RunningStats, RunningStats.stddev),
+                            }
+
 operation = OP_CODE_SUBTRACT
 
 # Load a schedstats file
@@ -21,6 +53,27 @@ operation = OP_CODE_SUBTRACT
 #          process,           parent, pids,  seconds,       cycles,  sec%,  cyc%, nsec%, ncyc%, CPU 0  sec%,  cyc%, nsec%, ncyc%, CPU 1  sec%,  cyc%, nsec%, ncyc%, CPU 2  sec%,  cyc%, nsec%, ncyc%, CPU 3  sec%,  cyc%, nsec%, ncyc%, CPU 4  sec%,  cyc%, nsec%, ncyc%, CPU 5  sec%,  cyc%, nsec%, ncyc%, CPU 6  sec%,  cyc%, nsec%, ncyc%, CPU 7  sec%,  cyc%, nsec%, ncyc%
 #          Mapper,              750,    1,   5.1766,         0.00, 12.36,  0.00, 12.36,  0.00,        0.00,  0.00,  0.00,  0.00,        0.00,  0.00,  0.00,  0.00,        0.00,  0.00,  0.00,  0.00,        0.00,  0.00,  0.00,  0.00,        0.00,  0.00,  0.00,  0.00,       98.98,  0.00, 98.98,  0.00,        0.00,  0.00,  0.00,  0.00,        0.00,  0.00,  0.00,  0.00,
 
+def open_stats(filepath):
+    """
+    :param filepath: *string* csv stats file, optionally compressed with gzip
+                     (.gz) or zstd (.zst) like psytrace --compress writes them
+    :return: Text file object
+    """
+    if (filepath.endswith(".gz")):
+        f = gzip.open(filepath, "rb")
+    elif (filepath.endswith(".zst")):
+        import zstandard
+        f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filepath, "rb"), closefd=True))
+    else:
+        f = open(filepath, "rb")
+
+    # psytrace writes the csvs as latin-1 so any byte in a process name can be
+    # read back in Python 3
+    if (sys.version_info[0] >= 3):
+        f = io.TextIOWrapper(f, encoding="latin-1")
+
+    return f
+
 def load_stats(filepath):
     """
     :param filepath: *string* Full filepath to the csv stats file
@@ -28,7 +81,7 @@ def load_stats(filepath):
             same number of columns, all elements are stripped and numeric elements
             converted to float.
     """
-    f = open(filepath, "r")
+    f = open_stats(filepath)
 
     # Read the header row, note the header row is not comma-terminated, but remove
     # the last element if empty, in case it is
@@ -56,18 +109,153 @@ def load_stats(filepath):
 
     return rows
 
-def rows_match(row_a, row_b):
+def load_stats_parallel(filepaths, num_jobs):
+    """
+    Load the stats files in a process pool
+
+    :param filepaths: List of csv stats filepaths
+    :param num_jobs: number of worker processes
+    :return: generator of load_stats results, in the same order as filepaths
+    """
+    import multiprocessing
+
+    pool = multiprocessing.Pool(num_jobs)
+    try:
+        # Keep a bounded number of files in flight so memory doesn't grow with
+        # the number of files when the consumer is slower than the workers
+        pending = []
+        for filepath in filepaths:
+            pending.append(pool.apply_async(load_stats, (filepath,)))
+            if (len(pending) > num_jobs * 2):
+                yield pending.pop(0).get()
+
+        while (len(pending) > 0):
+            yield pending.pop(0).get()
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+def load_stats_files(filepaths, num_jobs = 1):
+    """
+    :param filepaths: List of csv stats filepaths
+    :param num_jobs: number of processes loading the files
+    :return: generator of load_stats results, in the same order as filepaths
+    """
+    if (num_jobs > 1):
+        all_stats = load_stats_parallel(filepaths, num_jobs)
+    else:
+        all_stats = (load_stats(filepath) for filepath in filepaths)
+
+    for i, stats in enumerate(all_stats):
+        logger.info("Loaded trace file %s" % repr(filepaths[i]))
+        yield stats
+
+# Strategies to pair the processes of two schedstats files, see row_keys
+MATCH_EXACT = "exact"
+MATCH_PID = "pid"
+MATCH_PARENT = "parent"
+MATCH_NAMES = [ MATCH_EXACT, MATCH_PID, MATCH_PARENT ]
+
+# Android names threads after the pid of their process, eg Binder:2377_4 is
+# binder thread 4 of pid 2377. Strip the pid so the same thread of the process
+# matches across runs
+NAME_PID_REGEXP = re.compile(r"(?<=:)\d+(?=_)")
+
+def normalize_name(name):
+    """
+    :param name: *string* Process name
+    :return: The process name with the pids embedded in it removed, eg
+             Binder:2377_4 becomes Binder:_4
+    """
+    return NAME_PID_REGEXP.sub("", name)
+
+def row_keys(row, match = MATCH_EXACT):
+    """
+    :param row: Row of schedstat fields
+    :param match: *string* One of MATCH_NAMES
+    :return: List of keys identifying the process of the row, from the most to
+             the least strict. Rows with the same key at the same position in
+             two different schedstat files refer to the same process
+    """
+    name = row[0]
+    if (match == MATCH_EXACT):
+        return [ name ]
+
+    normalized_name = normalize_name(name)
+    if (match == MATCH_PID):
+        # eg Binder:2377_4, lusvr.dabmobile to Binder:2383_4, lusvr.dabmobile
+        return [ name, normalized_name ]
+
+    # Prefer the process with the same parent, then fall back to the name
+    # alone, eg Binder:686_4, surfaceflinger to Binder:689_4, 689 when the
+    # parent wasn't resolved in one of the traces
+    parent = row[1]
+    return [ (name, parent), (normalized_name, parent), name, normalized_name ]
+
+def row_key(row):
+    """
+    :param row: Row of schedstat fields
+    :return: Key identifying the process of the row for exact matching
+    """
+    return row[0]
+
+def index_rows(rows):
+    """
+    :param rows: Rows of schedstat fields
+    :return: dict with the first row for each key, indexed by row_key
+    """
+    index = {}
+    for row in rows:
+        index.setdefault(row_key(row), row)
+
+    return index
+
+def match_rows(rows_a, rows_b, match = MATCH_EXACT):
     """
-    :param row_a: Row of schedstat fields
-    :param row_b: Row of schedstat fields
-    :return: True if row_a and row_b are a match, ie refer to the same process
-        in two different schedstat files
+    :param rows_a: Rows of schedstat fields
+    :param rows_b: Rows of schedstat fields
+    :param match: *string* One of MATCH_NAMES
+    :return: Tuple with the list of rows of B matching each row of A (None if
+             the row of A has no match) and the list of rows of B that didn't
+             match any row of A
     """
-    # Do exact process name matching
-    # XXX In the future this could do parent and partial name matching, eg match
-    #  - Binder:2377_4,  lusvr.dabmobile to Binder:2383_4,  lusvr.dabmobile
-    #  - or even Binder:686_4,   surfaceflinger to Binder:689_4, 689
-    return (row_a[0] == row_b[0])
+    if (match == MATCH_EXACT):
+        # Every row of A matches the first row of B with the same name,
+        # duplicated names in A all match that same row
+        index_b = index_rows(rows_b)
+        matches = [ index_b.get(row_key(row_a)) for row_a in rows_a ]
+        keys_a = set([ row_key(row_a) for row_a in rows_a ])
+        unmatched_b = [ row_b for row_b in rows_b if (row_key(row_b) not in keys_a) ]
+
+        return matches, unmatched_b
+
+    # Fuzzy keys can be shared by several processes of the same file, so each
+    # row of B matches at most one row of A. Match all the rows by their
+    # strictest key first so a looser key doesn't take the row a later row of A
+    # would match more strictly
+    keys_a = [ row_keys(row_a, match) for row_a in rows_a ]
+    keys_b = [ row_keys(row_b, match) for row_b in rows_b ]
+    matches = [ None ] * len(rows_a)
+    matched_b = [ False ] * len(rows_b)
+    for level in range(len(row_keys(["", ""], match))):
+        # Indices of the rows of B for each key, in file order
+        index_b = {}
+        for i, keys in enumerate(keys_b):
+            if (not matched_b[i]):
+                index_b.setdefault(keys[level], collections.deque()).append(i)
+
+        for i, keys in enumerate(keys_a):
+            if (matches[i] is None):
+                candidates = index_b.get(keys[level])
+                if (candidates):
+                    j = candidates.popleft()
+                    matches[i] = rows_b[j]
+                    matched_b[j] = True
+
+    unmatched_b = [ row_b for row_b, matched in zip(rows_b, matched_b) if (not matched) ]
+
+    return matches, unmatched_b
 
 def operate_row(row_a, row_b, fn):
     """
@@ -90,73 +278,134 @@ def operate_row(row_a, row_b, fn):
     assert num_cols > 0, "At least one row must not be empty!!"
 
     # Column 0 is process name, 1 is parent, 2 is pids, 3 is seconds, then numeric columns
+    # Pad the shorter row with None, then apply fn to each pair of columns
+    values_a = row_a[2:] + [None] * (num_cols - max(len(row_a), 2))
+    values_b = row_b[2:] + [None] * (num_cols - max(len(row_b), 2))
     res = row[:2]
-    for col in xrange(2, num_cols):
-        value_a = None if (col >= len(row_a)) else row_a[col]
-        value_b = None if (col >= len(row_b)) else row_b[col]
-        value = fn(value_a, value_b)
-        res.append(value)
+    res.extend(map(fn, values_a, values_b))
 
     return res
 
-def operate_stats(stats_a, stats_b, fn):
+def operate_stats(stats_a, stats_b, fn, match = MATCH_EXACT):
     """
     :param stats_a: Rows of schedstats. Each row split into fields, first row is
                     headers
     :param stats_b: Rows of schedstats. Each row split into fields, first row is
                     headers
     :param fn: Function to apply
+    :param match: *string* How to pair the processes of A and B, one of
+                  MATCH_NAMES
     :return:
     """
 
-    # Operate the rows present in A, and maybe in B
+    # Operate the rows present in A, and maybe in B, then the rows in B but not
+    # in A
+    matches, unmatched_b = match_rows(stats_a[1:], stats_b[1:], match)
     stats_c = [ stats_a[0] ]
-    for row_a in stats_a[1:]:
-        for row_b in stats_b[1:]:
-            if (rows_match(row_a, row_b)):
-                row = operate_row(row_a, row_b, fn)
-                stats_c.append(row)
-                break
-        else:
-            # This row doesn't exist in B
-            row = operate_row(row_a, None, fn)
-            stats_c.append(row)
-
-    # Operate the rows in B but not in A
-    for row_b in stats_b[1:]:
-        for row_a in stats_a[1:]:
-            if (rows_match(row_a, row_b)):
-                break
-        else:
-            row = operate_row(None, row_b, fn)
-            stats_c.append(row)
+    for row_a, row_b in zip(stats_a[1:], matches):
+        # Note row_b is None if the row doesn't exist in B
+        stats_c.append(operate_row(row_a, row_b, fn))
 
-    return stats_c
+    for row_b in unmatched_b:
+        stats_c.append(operate_row(None, row_b, fn))
 
-def diff_stats(stats_a, stats_b):
+    return stats_c
 
-    # Do A - B
-    stats_c = operate_stats(stats_a, stats_b, lambda a, b : (a if a is not None else 0) -
-                                                            (b if b is not None else 0))
+def diff_stats(stats_a, stats_b, match = MATCH_EXACT):
 
-    # Go through and change the process names:
+    # Do A - B, changing the process names:
     # - processes in a but not in b, prefix them with +
     # - processes in b but not in a, prefix them with -
+    fn = lambda a, b : (a if a is not None else 0) - (b if b is not None else 0)
+    matches, unmatched_b = match_rows(stats_a[1:], stats_b[1:], match)
+    stats_c = [ stats_a[0] ]
+    for row_a, row_b in zip(stats_a[1:], matches):
+        row = operate_row(row_a, row_b, fn)
+        if (row_b is None):
+            # Row only on A, prefix with +
+            row[0] = "+" + row[0]
+        # else row on both, keep name
+        stats_c.append(row)
+
+    for row_b in unmatched_b:
+        # Row not in A, has to be only in B, prefix with -
+        row = operate_row(None, row_b, fn)
+        row[0] = "-" + row[0]
+        stats_c.append(row)
 
-    for row_c in stats_c:
-        for row_a in stats_a:
-            if (rows_match(row_c, row_a)):
-                for row_b in stats_b:
-                    if (rows_match(row_c, row_b)):
-                        # Row on both, keep name
-                        break
-                else:
-                    # Row only on A, prefix with +
-                    row_c[0] = "+" + row_c[0]
-                break
+    return stats_c
+
+def distribution_stats(all_stats, op_code, match = MATCH_EXACT):
+    """
+    :param all_stats: Iterable of schedstats, one per run, as returned by
+                      load_stats
+    :param op_code: One of the keys of OP_CODE_TO_DISTRIBUTION
+    :param match: *string* How to pair the processes of the runs, one of
+                  MATCH_NAMES
+    :return: Rows of schedstats with the statistic of each numeric column of
+             every process across the runs, in the order the processes were
+             first seen. A process missing from a run counts as zeros for that
+             run, like avg does
+    """
+    new_sketch, statistic = OP_CODE_TO_DISTRIBUTION[op_code]
+
+    headers = None
+    # First row seen for each process, its sketch and the number of runs
+    # already added to the sketch
+    rows = []
+    sketches = []
+    num_runs_added = []
+    # Index of each process in rows, by id of its first row for fuzzy
+    # matching, by (name, occurrence of the name in the run) for exact
+    # matching
+    row_indices = {}
+    num_runs = 0
+    for stats in all_stats:
+        if (headers is None):
+            headers = stats[0]
+        num_values = len(headers) - 2
+        zeros = [ 0.0 ] * num_values
+
+        if (match == MATCH_EXACT):
+            # The k-th row with a name in this run is the k-th process with
+            # that name, so duplicated names don't all pile on the first one
+            occurrences = collections.Counter()
+            keys = []
+            for row in stats[1:]:
+                key = row_key(row)
+                keys.append((key, occurrences[key]))
+                occurrences[key] += 1
         else:
-            # Row not in A, has to be only in B, prefix with -
-            row_c[0] = "-" + row_c[0]
+            matches, _ = match_rows(stats[1:], rows, match)
+            keys = [ None if (row_match is None) else id(row_match) for row_match in matches ]
+
+        for row, key in zip(stats[1:], keys):
+            assert len(row) - 2 == num_values, "Found %d columns in %s, expected %d" % (
+                len(row), repr(row[0]), num_values + 2)
+            index = row_indices.get(key)
+            if (index is None):
+                # New process
+                index = len(rows)
+                rows.append(row)
+                sketches.append(new_sketch(num_values))
+                num_runs_added.append(0)
+                row_indices[key if (match == MATCH_EXACT) else id(row)] = index
+
+            # Fill in the runs the process was missing from
+            sketch = sketches[index]
+            for i in range(num_runs - num_runs_added[index]):
+                sketch.add(zeros)
+            sketch.add(row[2:])
+            num_runs_added[index] = num_runs + 1
+
+        num_runs += 1
+
+    stats_c = [ headers ]
+    for row, sketch, num_added in zip(rows, sketches, num_runs_added):
+        zeros = [ 0.0 ] * len(row[2:])
+        for i in range(num_runs - num_added):
+            sketch.add(zeros)
+        stats_c.append(row[:2] + statistic(sketch))
 
     return stats_c
 
@@ -165,17 +414,15 @@ def print_stats(stats):
 
     headers = stats[0]
     fmt_mask = " %16s, %16s, %4s, %8s, %12s, "
-    for cpu in xrange(((len(headers) - 4) / 4)):
+    for cpu in range(((len(headers) - 4) // 4)):
         fmt_mask += "%6s, %6s, %6s, %6s, "
-    print fmt_mask % tuple(headers)
+    print(fmt_mask % tuple(headers))
 
     # Output sorted by absolute values of columns 4,5,6,7
     for row in sorted(stats[1:], reverse=True,
-                      cmp=lambda x, y: cmp(
-                          abs(x[4]) if (x[4] != 0) else abs(x[5]),
-                          abs(y[4]) if (y[4] != 0) else abs(y[5]))):
+                      key=lambda x: abs(x[4]) if (x[4] != 0) else abs(x[5])):
         fmt_mask = "%16s, %16s, %4d, %8.4f, %12.2f, "
-        for cpu in xrange(((len(row) - 4) / 4)):
+        for cpu in range(((len(row) - 4) // 4)):
             if (cpu > 0):
                 fmt_mask += "     "
             fmt_mask += "%6.2f, %6.2f, %6.2f, %6.2f, "
@@ -189,7 +436,7 @@ def print_stats(stats):
         else:
             fmt_mask = " " + fmt_mask
 
-        print fmt_mask % tuple([name] + row[1:])
+        print(fmt_mask % tuple([name] + row[1:]))
 
 
 if (__name__ == "__main__"):
@@ -200,59 +447,81 @@ if (__name__ == "__main__"):
     logger.addHandler(logger_handler)
     logger.setLevel(logging.INFO)
 
-    first_filepath_index = 1
-
-    # The first argument should be an operation
-    if ((len(sys.argv) <2) or (sys.argv[1] not in OP_NAMES_TO_CODE)):
-        print "Tool to manipulate psytrace schedstat files"
-        print "https://our.intern.facebook.com/intern/wiki/Users/atejada/psytrace/#statstool.py"
-        print
-        print "usage: statstool.py [avg|sum|diff] filepathpattern1 filepathpattern2 ..."
-        print "Operations:"
-        print "- sum: output a schedstat file sum of filepathpattern1 filepathpattern2 ..."
-        print "- avg: output a schedstat file average of filepathpattern1 filepathpattern2 ..."
-        print "- diff: output a schedstat file difference of filepathpattern1 minus filepathpattern2"
-        sys.exit(-1)
+    parser = argparse.ArgumentParser(
+        description="Tool to manipulate psytrace schedstat files",
+        epilog="https://our.intern.facebook.com/intern/wiki/Users/atejada/psytrace/#statstool.py",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("operation", choices=sorted(OP_NAMES_TO_CODE.keys()),
+                        metavar="{avg,sum,diff,p50,p90,p99,min,max,stddev}",
+                        help="sum: output a schedstat file sum of filepathpattern1 filepathpattern2 ..., "
+                             "avg: output a schedstat file average of filepathpattern1 filepathpattern2 ..., "
+                             "diff: output a schedstat file difference of filepathpattern1 minus filepathpattern2, "
+                             "p50, p90, p99, min, max, stddev: output a schedstat file with that statistic of "
+                             "each process across filepathpattern1 filepathpattern2 ..., the percentiles are "
+                             "estimated in constant memory past a few dozen files")
+    parser.add_argument("filepathpatterns", nargs="+", metavar="filepathpattern",
+                        help="schedstats csv, all the operations but diff accept wildcards")
+    parser.add_argument("--match", choices=MATCH_NAMES, default=MATCH_EXACT,
+                        help="How to pair the processes of different files: "
+                             "exact: same process name, "
+                             "pid: also ignore the pids in names like Binder:2377_4, "
+                             "parent: like pid but prefer the process with the same parent")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of processes used to load the files, but for diff")
+    args = parser.parse_args()
 
     logger.info("Starting")
 
-    operation = OP_NAMES_TO_CODE[sys.argv[1]]
-    first_filepath_index += 1
+    operation = OP_NAMES_TO_CODE[args.operation]
 
     if (operation == OP_CODE_SUBTRACT):
         # Diff is followed by two filepaths A and B to generate A - B
+        if (len(args.filepathpatterns) != 2):
+            parser.error("diff needs two filepaths")
 
-        src_filepath = sys.argv[first_filepath_index]
+        src_filepath = args.filepathpatterns[0]
         stats_a = load_stats(src_filepath)
 
-        src_filepath = sys.argv[first_filepath_index + 1]
+        src_filepath = args.filepathpatterns[1]
         stats_b = load_stats(src_filepath)
 
-        stats_c = diff_stats(stats_a, stats_b)
+        stats_c = diff_stats(stats_a, stats_b, args.match)
 
         print_stats(stats_c)
 
 
-    elif ((operation == OP_CODE_AVERAGE) or (operation == OP_CODE_SUM)):
-        # Sum and average are followed by one or more filepaths, optionally with
-        # wildcards
+    else:
+        # The other operations are followed by one or more filepaths,
+        # optionally with wildcards
+
+        filepaths = []
+        for filepathpattern in args.filepathpatterns:
+            filepaths.extend(glob.glob(filepathpattern))
+
+        if (args.jobs > 1):
+            logger.info("Loading %d files with %d jobs" % (len(filepaths), args.jobs))
+        all_stats = load_stats_files(filepaths, args.jobs)
 
-        # Sum the stats
-        num_stats = 0
-        stats_c = None
-        for filepathpattern in sys.argv[1:]:
-            for filepath in glob.glob(filepathpattern):
-                logger.info("Loading trace file %s" % repr(filepath))
-                stats_a = load_stats(filepath)
+        if (operation in OP_CODE_TO_DISTRIBUTION):
+            stats_c = distribution_stats(all_stats, operation, args.match)
+
+        else:
+            # Sum the stats, always in the order of the files so the floating
+            # point additions and the order of the processes don't depend on the
+            # number of jobs
+            num_stats = 0
+            stats_c = None
+            for stats_a in all_stats:
                 if (stats_c is None):
                     stats_c = stats_a
                 else:
                     stats_c = operate_stats(stats_a, stats_c, lambda a, b: (a if a is not None else 0) +
-                                                                           (b if b is not None else 0))
+                                                                           (b if b is not None else 0),
+                                            args.match)
                 num_stats += 1
 
-        if (operation == OP_CODE_AVERAGE):
-            # Average all the stats
-            stats_c = operate_stats(stats_c, [], lambda a, b: a / num_stats)
+            if (operation == OP_CODE_AVERAGE):
+                # Average all the stats
+                stats_c = operate_stats(stats_c, [], lambda a, b: a / num_stats)
 
         print_stats(stats_c)
@@ -15,6 +15,8 @@ import sys
 import zipfile
 import argparse
 
+import logcat
+
 
 SYSTRACE_PERIODIC_SLEEP_SECONDS_OUTSIDE_TRACE = 10
 SYSTRACE_PERIODIC_SLEEP_SECONDS_INSIDE_TRACE = 0
@@ -108,8 +110,8 @@ def main():
     now = datetime.datetime.now()
     filepath = now.strftime("traces_%Y%m%d-%H%M%S_self_serve.zip")
 
-    # run the parser program to extract desired information from logcat files
-    os_system("python parser.py")
+    logger.info("Grabbing the logcat metrics of the pulled traces")
+    logcat.write_results("traces/")
     
     logger.info("Creating zip file %s" % filepath)
     f_zip = zipfile.ZipFile(filepath, mode = "w", compression = zipfile.ZIP_DEFLATED)
@@ -0,0 +1,49 @@
+"""
+Tests for logcat.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+import logcat
+
+LINES = [
+    b"07-21 10:00:00.100  1000  1010 I VrApi   : FPS=72/72,Prd=39ms,Tear=0,Early=0,Stale=1,VSnc=0,Lat=1,Fov=0,"
+    b"Free=1200MB,PLS=0,Temp=35.0C/0.0C\n",
+    b"07-21 10:00:00.200  1000  1010 I Unrelated: nothing to grab\n",
+    b"07-21 10:00:00.300  1000  1010 I insideout_periodic: {\"frames\":145,\"has_tracking\":true,\"duration\":5000}\n",
+]
+
+class LogcatTest(unittest.TestCase):
+
+    def test_parse_logcat(self):
+        rows = list(logcat.parse_logcat(LINES, [ "FPS", "Temp", "has_tracking", "frames" ], "18"))
+        self.assertEqual(rows, [ ("07-21-18 10:00:00.100", ("72", "35", "", "")),
+                                 ("07-21-18 10:00:00.300", ("", "", "true", "145")) ])
+
+    def test_parse_logcat_no_timestamp(self):
+        rows = list(logcat.parse_logcat([ b"I VrApi   : FPS=60/72,Lat=2\n" ], [ "Lat", "FPS" ], "18"))
+        self.assertEqual(rows, [ (logcat.NO_TIMESTAMP, ("2", "60")) ])
+
+    def test_write_results(self):
+        tmp_dirpath = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp_dirpath, "trace.txt.logcat"), "wb") as f:
+                f.writelines(LINES)
+            filepath = logcat.write_results(tmp_dirpath, year = "18")
+            with open(filepath, "r") as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(tmp_dirpath)
+        fields = lines[1].split(",")
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(fields[0], "07-21-18 10:00:00.100")
+        self.assertEqual(fields[1 + logcat.DEFAULT_FIELDS.index("FPS")], "72")
+        self.assertEqual(len(fields), len(logcat.DEFAULT_FIELDS) + 2)
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Tests for logcatlive.py
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+import logcatlive
+
+class RollingWindowTest(unittest.TestCase):
+
+    def test_expire(self):
+        window = logcatlive.RollingWindow(1000)
+        for time_ms, value in [ (0, 1.0), (500, 2.0), (1200, 3.0) ]:
+            window.add(time_ms, value)
+        summary = window.summary()
+        self.assertEqual(summary["count"], 2)
+        self.assertEqual(summary["mean"], 2.5)
+
+    def test_empty_window(self):
+        # A window that can't hold any sample expires them as they are added
+        window = logcatlive.RollingWindow(0)
+        window.add(0, 1.0)
+        window.add(10, 2.0)
+        self.assertIsNone(window.summary())
+
+class LiveMonitorTest(unittest.TestCase):
+
+    def test_no_dropped_lines(self):
+        # A queue of one line can't keep up with the reader, lines are waited
+        # for instead of dropped
+        lines = [ b"07-21 10:00:%02d.%03d  1000  1010 I VrApi   : FPS=%d/72,Lat=1\n" % (i // 1000, i % 1000, i % 72)
+                  for i in range(5000) ]
+        snapshots = []
+        monitor = logcatlive.LiveMonitor(lines, [ "FPS" ], window_seconds = 1.0, max_lines = 1,
+                                         report = snapshots.append, drop_lines = False)
+        monitor.run()
+        snapshot = snapshots[-1]
+        self.assertEqual(snapshot["lines"], 5000)
+        self.assertEqual(snapshot["dropped"], 0)
+        self.assertEqual(snapshot["rows"], 5000)
+        self.assertEqual(snapshot["metrics"]["FPS"]["count"], 1000)
+        self.assertEqual(snapshot["metrics"]["FPS"]["last"], 4999 % 72)
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Tests for psytrace.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+import psytrace
+
+def wakeup(task, pid, tgid, cpu, timestamp, comm, wakee_pid):
+    return psytrace.build_systrace_line(task, pid, tgid, cpu, "d..3", timestamp, "sched_wakeup",
+        "comm=%s pid=%d prio=120 success=1 target_cpu=%03d" % (comm, wakee_pid, cpu))
+
+def switch(task, pid, tgid, cpu, timestamp, next_comm, next_pid):
+    return psytrace.build_systrace_line(task, pid, tgid, cpu, "d..3", timestamp, "sched_switch",
+        psytrace.build_sched_switch(task, pid, 120, "S", next_comm, next_pid, 120))
+
+class PsytraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dirpath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dirpath)
+
+    def run_psytrace(self, lines):
+        """
+        :return: (lines of the output trace, rows of the schedstats csv)
+        """
+        src_filepath = os.path.join(self.tmp_dirpath, "trace.txt")
+        with open(src_filepath, "w") as f:
+            f.write("# tracer: nop\n")
+            for l in lines:
+                f.write("%s\n" % l)
+
+        dst_filepath = os.path.join(self.tmp_dirpath, "trace.txt.out")
+        psytrace.main(src_filepath, dst_filepath)
+        with open(dst_filepath, "r") as f:
+            trace_lines = f.read().splitlines()
+        with open(dst_filepath + "_schedstats.csv", "r") as f:
+            stats_rows = [ [ field.strip() for field in l.split(",") ] for l in f.read().splitlines()[1:] ]
+        return trace_lines, stats_rows
+
+    def test_unknown_comm_running_placeholder(self):
+        # Foo-100 is known when cpu 0 starts running pid 100 as "<...>", the
+        # placeholder of the initial fake sched_switch must not hide Foo
+        trace_lines, _ = self.run_psytrace([
+            wakeup("Foo", 100, 100, 1, 1.0, "Bar", 300),
+            switch("Foo", 100, 100, 1, 1.1, "swapper/1", 0),
+            wakeup("<...>", 100, 100, 0, 1.2, "Bar", 300),
+            wakeup("<...>", 100, 100, 0, 1.3, "Bar", 300),
+        ])
+        wakeup_lines = [ l for l in trace_lines if ("sched_wakeup" in l) ]
+        self.assertEqual(len(wakeup_lines), 3)
+        for l in wakeup_lines:
+            self.assertIn("Foo-100", l)
+
+    def test_parent_name_with_placeholder(self):
+        # Bar-300 belongs to Foo-100, the "<...>" placeholder added for pid 100
+        # afterwards must not become the parent name
+        _, stats_rows = self.run_psytrace([
+            wakeup("Foo", 100, 100, 1, 1.0, "Bar", 300),
+            switch("Foo", 100, 100, 1, 1.1, "Bar", 300),
+            wakeup("<...>", 100, 100, 0, 1.2, "Bar", 300),
+            switch("<...>", 100, 100, 0, 1.3, "swapper/0", 0),
+            switch("Bar", 300, 100, 1, 1.4, "swapper/1", 0),
+        ])
+        self.assertEqual([ row[1] for row in stats_rows if (row[0] == "Bar") ], [ "Foo" ])
+
+    def test_parent_name_only_placeholder(self):
+        # The name of pid 100 is never known, the parent is its pid
+        _, stats_rows = self.run_psytrace([
+            wakeup("<...>", 100, 100, 0, 1.0, "Bar", 300),
+            switch("<...>", 100, 100, 0, 1.1, "Bar", 300),
+            switch("Bar", 300, 100, 0, 1.2, "swapper/0", 0),
+            switch("swapper/0", 0, 0, 0, 1.3, "Bar", 300),
+            switch("Bar", 300, 100, 0, 1.4, "swapper/0", 0),
+        ])
+        self.assertEqual([ row[1] for row in stats_rows if (row[0] == "Bar") ], [ "100" ])
+
+    def resume_damaged_output(self, damage):
+        """
+        Resume a run after damaging its output with damage(trace_filepath)
+
+        :return: (lines of the resumed output trace, lines of a full run)
+        """
+        lines = [
+            wakeup("Foo", 100, 100, 0, 1.0, "Bar", 300),
+            switch("Foo", 100, 100, 0, 1.1, "Bar", 300),
+            switch("Bar", 300, 100, 0, 1.2, "Foo", 100),
+        ]
+        src_filepath = os.path.join(self.tmp_dirpath, "trace.txt")
+        dst_filepath = os.path.join(self.tmp_dirpath, "trace.txt.out")
+        with open(src_filepath, "w") as f:
+            f.write("# tracer: nop\n")
+            for l in lines[:2]:
+                f.write("%s\n" % l)
+        psytrace.main(src_filepath, dst_filepath, resume = True)
+        damage(dst_filepath)
+        with open(src_filepath, "a") as f:
+            f.write("%s\n" % lines[2])
+        psytrace.main(src_filepath, dst_filepath, resume = True)
+        with open(dst_filepath, "r") as f:
+            resumed_lines = f.read().splitlines()
+
+        trace_lines, _ = self.run_psytrace(lines)
+        return resumed_lines, trace_lines
+
+    def test_resume_missing_output(self):
+        resumed_lines, trace_lines = self.resume_damaged_output(os.remove)
+        self.assertEqual(resumed_lines, trace_lines)
+
+    def test_resume_truncated_output(self):
+        def truncate(filepath):
+            with open(filepath, "r+b") as f:
+                f.truncate(0)
+        resumed_lines, trace_lines = self.resume_damaged_output(truncate)
+        self.assertEqual(resumed_lines, trace_lines)
+        self.assertNotIn("\0", "".join(resumed_lines))
+
+    def test_resume_modified_output(self):
+        def modify(filepath):
+            with open(filepath, "r+b") as f:
+                f.write(b"X")
+        resumed_lines, trace_lines = self.resume_damaged_output(modify)
+        self.assertEqual(resumed_lines, trace_lines)
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests for pyRosita/sequencer.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+import pyRosita
+
+def add_actions(seq):
+    for amt in [ 10, 20, 30 ]:
+        seq.add("change head_nod", amt)
+        seq.add("set wait", 1)
+
+class SequencerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dirpath = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmp_dirpath, "test.sequence")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dirpath)
+
+    def write_sequence(self, mode, stream):
+        """
+        :return: lines of the sequence written to a file opened with mode
+        """
+        with open(self.filepath, mode) as f:
+            seq = pyRosita.Sequencer(f, pyRosita.Robot(), "user", "id", "description", stream=stream, batch_size=1)
+            add_actions(seq)
+            seq.generate_animation()
+        with open(self.filepath, "r") as f:
+            lines = f.read().splitlines()
+        # Drop the random sequence number and the creation times
+        return [ l for l in lines if not l.startswith(("number=", "virtualrobot_created=", "virtualrobot_modified=")) ]
+
+    def test_stream(self):
+        expected_lines = self.write_sequence("w", False)
+        self.assertEqual([ l.rstrip() for l in self.write_sequence("w", True) ], expected_lines)
+
+    def test_stream_append(self):
+        # Writes to a file opened for appending all go to the end, the length
+        # can't be filled in later and the sequence is written at once
+        expected_lines = self.write_sequence("w", False)
+        with open(self.filepath, "w") as f:
+            f.write("previous\n")
+        self.assertEqual(self.write_sequence("a", True), [ "previous" ] + expected_lines)
+
+    def test_stream_length_too_wide(self):
+        with open(self.filepath, "w") as f:
+            seq = pyRosita.Sequencer(f, pyRosita.Robot(), "user", "id", "description", stream=True, batch_size=1)
+            add_actions(seq)
+            if not seq.header_written:
+                self.skipTest("the files of this Python can't be streamed")
+            seq.timer = 10.0 ** (pyRosita.sequencer.LENGTH_DIGITS + 1)
+            self.assertRaises(pyRosita.SequenceError, seq.generate_animation)
+        with open(self.filepath, "r") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[lines.index("length=" + " " * pyRosita.sequencer.LENGTH_DIGITS) + 1], "[Meta]")
+
+if (__name__ == "__main__"):
+    unittest.main()
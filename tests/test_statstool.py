@@ -0,0 +1,44 @@
+"""
+Tests for statstool.py
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+import statstool
+
+HEADERS = [ "name", "parent", "pids", "seconds", "value" ]
+
+def build_stats(rows):
+    """
+    :param rows: List of (name, value)
+    :return: Rows of schedstats as returned by load_stats
+    """
+    return [ HEADERS ] + [ [ name, "init", 1.0, 1.0, value ] for name, value in rows ]
+
+class DistributionStatsTest(unittest.TestCase):
+
+    def test_duplicated_names(self):
+        # Every run has two foo processes, they must stay two rows, each with
+        # a sample per run
+        all_stats = [ build_stats([ ("foo", 1.0), ("foo", 10.0), ("bar", 5.0) ]) for i in range(5) ]
+        for op_code in [ statstool.OP_CODE_P50, statstool.OP_CODE_MIN, statstool.OP_CODE_MAX ]:
+            stats = statstool.distribution_stats(all_stats, op_code)
+            self.assertEqual([ row[0] for row in stats[1:] ], [ "foo", "foo", "bar" ])
+            self.assertEqual([ row[-1] for row in stats[1:] ], [ 1.0, 10.0, 5.0 ])
+
+        stats = statstool.distribution_stats(all_stats, statstool.OP_CODE_STDDEV)
+        self.assertEqual([ row[-1] for row in stats[1:] ], [ 0.0, 0.0, 0.0 ])
+
+    def test_duplicated_names_missing_from_runs(self):
+        # The second foo is missing from the middle run, it counts as zeros
+        all_stats = [ build_stats([ ("foo", 1.0), ("foo", 10.0) ]),
+                      build_stats([ ("foo", 1.0) ]),
+                      build_stats([ ("foo", 1.0), ("foo", 10.0) ]) ]
+        stats = statstool.distribution_stats(all_stats, statstool.OP_CODE_MIN)
+        self.assertEqual([ row[-1] for row in stats[1:] ], [ 1.0, 0.0 ])
+
+if (__name__ == "__main__"):
+    unittest.main()